@@ -0,0 +1,247 @@
+"""Замена aiodocker.Docker для бенчмарка: контейнеры этапов имитируются в процессе.
+
+Поддерживается та часть API, которой пользуется Orchestrator: создание, запуск,
+ожидание, логи (follow), статистика, удаление контейнеров и inspect образов.
+Каждый «контейнер» ждет заданное время, печатает строки прогресса и создает файлы,
+которые создал бы настоящий образ этапа.
+"""
+
+import os
+import uuid
+import random
+import hashlib
+import asyncio
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from bot.utils.table_format import FORMAT_JSONL, append_columns, read_table, table_format, write_table
+
+
+@dataclass
+class StageTiming:
+    """Длительность имитируемого этапа: постоянная часть и время на один элемент входа."""
+
+    base: float = 0.2
+    per_item: float = 0.05
+    jitter: float = 0.2  # Случайный разброс, доля от длительности
+    memory: int = 200 * 1024 * 1024  # Потребление памяти, которое видно в статистике
+
+
+class FakeContainer:
+    def __init__(self, docker: "FakeDocker", config: dict):
+        self.docker = docker
+        self.config = config
+        self.id = uuid.uuid4().hex + uuid.uuid4().hex
+        self.image = config["Image"]
+        self.environment = dict(item.split("=", 1) for item in config.get("Env", []))
+        self.binds = self._parse_binds(config.get("HostConfig", {}).get("Binds", []))
+        self._logs: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        self._done = asyncio.Event()
+        self.exit_code = 0
+
+    def __getitem__(self, key):
+        return {"Id": self.id, "Labels": self.config.get("Labels") or {}}[key]
+
+    @staticmethod
+    def _parse_binds(binds: List[str]) -> Dict[str, str]:
+        mapping = {}
+        for bind in binds:
+            host_path, container_path = bind.rsplit(":", 2)[:2]
+            mapping[container_path] = host_path
+        return mapping
+
+    def to_host(self, container_path: str) -> str:
+        for prefix, host_path in sorted(self.binds.items(), key=lambda item: -len(item[0])):
+            if container_path == prefix or container_path.startswith(prefix.rstrip("/") + "/"):
+                relative = container_path[len(prefix):].lstrip("/")
+                return os.path.join(host_path, *relative.split("/")) if relative else host_path
+        raise ValueError(f"Path {container_path} is not mounted")
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        try:
+            items = self.docker.behaviour(self)
+            timing = self.docker.timings.get(self.image, self.docker.default_timing)
+            duration = timing.base + timing.per_item * len(items)
+            duration *= 1 + random.uniform(-timing.jitter, timing.jitter)
+            steps = max(1, len(items))
+            for done in range(1, steps + 1):
+                await asyncio.sleep(duration / steps)
+                self._logs.put_nowait(f"processed {done}/{steps}\n".encode())
+        except Exception as e:
+            self._logs.put_nowait(f"Error: {e}\n".encode())
+            self.exit_code = 1
+        finally:
+            self._logs.put_nowait(None)
+            self._done.set()
+
+    async def wait(self):
+        await self._done.wait()
+        return {"StatusCode": self.exit_code}
+
+    async def show(self):
+        return {"State": {"Running": not self._done.is_set(), "OOMKilled": False}}
+
+    async def log(self, stdout=True, stderr=True, follow=False):
+        while True:
+            chunk = await self._logs.get()
+            if chunk is None:
+                return
+            yield chunk
+
+    async def stats(self, stream=True):
+        timing = self.docker.timings.get(self.image, self.docker.default_timing)
+        while not self._done.is_set():
+            yield {
+                "memory_stats": {"usage": timing.memory, "stats": {}},
+                "cpu_stats": {"cpu_usage": {"total_usage": 2}, "system_cpu_usage": 4, "online_cpus": 1},
+                "precpu_stats": {"cpu_usage": {"total_usage": 1}, "system_cpu_usage": 2},
+            }
+            await asyncio.sleep(0.5)
+
+    async def delete(self, force=False):
+        if self._task and not self._task.done():
+            self._task.cancel()
+        self.docker.removed += 1
+        self.docker.containers._containers.pop(self.id, None)
+
+
+class FakeContainers:
+    def __init__(self, docker: "FakeDocker"):
+        self.docker = docker
+        self._containers: Dict[str, FakeContainer] = {}
+
+    async def create(self, config: dict) -> FakeContainer:
+        await asyncio.sleep(self.docker.api_latency)
+        container = FakeContainer(self.docker, config)
+        self._containers[container.id] = container
+        self.docker.created += 1
+        self.docker.peak_containers = max(self.docker.peak_containers, len(self._containers))
+        return container
+
+    async def get(self, container_id: str) -> FakeContainer:
+        return self._containers[container_id]
+
+    async def list(self, **kwargs) -> List[FakeContainer]:
+        return list(self._containers.values())
+
+
+class FakeImages:
+    async def inspect(self, image_name: str) -> dict:
+        return {"Id": f"sha256:{hashlib.sha256(image_name.encode()).hexdigest()}", "Config": {"Cmd": ["run"]}}
+
+
+class FakeSystem:
+    def __init__(self, memory: int, cpus: int):
+        self.memory = memory
+        self.cpus = cpus
+
+    async def info(self) -> dict:
+        return {"MemTotal": self.memory, "NCPU": self.cpus}
+
+
+class FakeDocker:
+    """Docker без Docker: поведение этапов задается функциями по имени образа.
+
+    memory/cpus - емкость, которую «демон» сообщает в docker info (для размещения по узлам).
+    """
+
+    def __init__(
+        self,
+        timings: Dict[str, StageTiming] = None,
+        api_latency: float = 0.01,
+        memory: int = 16 * 1024 ** 3,
+        cpus: int = 8,
+    ):
+        self.timings = timings or {}
+        self.default_timing = StageTiming()
+        self.api_latency = api_latency
+        self.containers = FakeContainers(self)
+        self.images = FakeImages()
+        self.system = FakeSystem(memory, cpus)
+        self.created = 0
+        self.removed = 0
+        self.peak_containers = 0
+
+    def behaviour(self, container: FakeContainer) -> List[str]:
+        """Создает выходные файлы этапа и возвращает элементы его входа."""
+        env = container.environment
+        handler = STAGE_BEHAVIOURS.get(container.image)
+        return handler(container, env) if handler else []
+
+    async def close(self):
+        pass
+
+
+def _links(path: str) -> List[str]:
+    with open(path, encoding="utf-8") as file:
+        return [line.strip() for line in file if line.strip()]
+
+
+def _parse(container: FakeContainer, env: Dict[str, str]) -> List[str]:
+    links = _links(container.to_host(env["INPUT_PATH"]))
+    output_path = container.to_host(env["OUTPUT_PATH"])
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    rows = [
+        {"Ссылка": link, "Описание": f"Описание объявления {link}", "Цена": str(random.randint(5, 50) * 1_000_000)}
+        for link in links
+    ]
+    write_table(output_path, ["Ссылка", "Описание", "Цена"], rows)
+    return links
+
+
+def _rewrite(container: FakeContainer, env: Dict[str, str]) -> List[str]:
+    path = container.to_host(env["INPUT_PATH"])
+    fieldnames, rows, delimiter = read_table(path)
+    column = env.get("COLUMN_NAME", "Описание")
+    values = [{column: str(row.get(column) or "")[: int(env.get("MAX_SYMBOL", "500"))]} for row in rows]
+    if table_format(path) == FORMAT_JSONL:
+        # JSONL: переписанная колонка дописывается отдельным файлом, таблица не переписывается
+        append_columns(path, "rewriter", [column], values)
+    else:
+        for row, value in zip(rows, values):
+            row.update(value)
+        write_table(path, fieldnames, rows, delimiter)
+    return [row.get("Ссылка", "") for row in rows]
+
+
+def _listing_number(link: str) -> str:
+    digits = "".join(ch for ch in link if ch.isdigit())
+    return digits or uuid.uuid4().hex[:8]
+
+
+def _images(container: FakeContainer, env: Dict[str, str]) -> List[str]:
+    _, rows, _ = read_table(container.to_host(env["INPUT_PATH"]))
+    pic_dir = container.to_host(env["BASE_IMAGE_DIR_PATH"])
+    os.makedirs(pic_dir, exist_ok=True)
+    for row in rows:
+        with open(os.path.join(pic_dir, f"{_listing_number(row.get('Ссылка', ''))}_1.jpg"), "wb") as file:
+            file.write(os.urandom(2048))
+    return [row.get("Ссылка", "") for row in rows]
+
+
+def _presentations(container: FakeContainer, env: Dict[str, str]) -> List[str]:
+    _, rows, _ = read_table(container.to_host(env["INPUT_PATH"]))
+    output_dir = container.to_host(env["OUTPUT_PATH"])
+    os.makedirs(output_dir, exist_ok=True)
+    for row in rows:
+        with open(os.path.join(output_dir, f"{_listing_number(row.get('Ссылка', ''))}.pptx"), "wb") as file:
+            file.write(os.urandom(16 * 1024))
+    return [row.get("Ссылка", "") for row in rows]
+
+
+def _sheet(container: FakeContainer, env: Dict[str, str]) -> List[str]:
+    _, rows, _ = read_table(container.to_host(env["INPUT_PATH"]))
+    return [row.get("Ссылка", "") for row in rows]
+
+
+STAGE_BEHAVIOURS = {
+    "cian_deep_page_parser": _parse,
+    "rewriter_image": _rewrite,
+    "image_processor": _images,
+    "presentation_image": _presentations,
+    "sheet_tools_image": _sheet,
+}
@@ -0,0 +1,91 @@
+"""Сессия aiogram без сети: ответы Bot API формируются локально с заданной задержкой."""
+
+import os
+import json
+import time
+import asyncio
+import itertools
+from collections import Counter
+from typing import Any, AsyncGenerator, Dict, Optional
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiogram.types import FSInputFile
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Benchmark", "username": "benchmark_bot"}
+
+
+class StubSession(BaseSession):
+    """Отвечает на методы Bot API как Telegram, не отправляя запросов.
+
+    latency - задержка каждого вызова, upload_speed - скорость «загрузки» файлов (байт/с).
+    """
+
+    def __init__(self, latency: float = 0.03, upload_speed: float = 20 * 1024 * 1024):
+        super().__init__()
+        self.latency = latency
+        self.upload_speed = upload_speed
+        self.calls: Counter = Counter()
+        self.documents = Counter()
+        self._message_ids = itertools.count(1000)
+        self._file_ids = itertools.count(1)
+
+    def _message(self, chat_id: Any, **fields) -> Dict[str, Any]:
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private" if int(chat_id) > 0 else "group"},
+            "from": BOT_USER,
+            **fields,
+        }
+
+    def _document(self, media: Any) -> Dict[str, Any]:
+        if isinstance(media, str):
+            name, size = "cached", 0
+        else:
+            name = getattr(media, "filename", None) or "file"
+            size = os.path.getsize(media.path) if isinstance(media, FSInputFile) else 0
+        return {
+            "file_id": f"file-{next(self._file_ids)}",
+            "file_unique_id": f"unique-{name}",
+            "file_name": name,
+            "file_size": size,
+        }
+
+    async def _upload_delay(self, *media: Any):
+        size = sum(os.path.getsize(m.path) for m in media if isinstance(m, FSInputFile))
+        if size:
+            await asyncio.sleep(size / self.upload_speed)
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None) -> Any:
+        api_method = method.__api_method__
+        self.calls[api_method] += 1
+        await asyncio.sleep(self.latency)
+
+        chat_id = getattr(method, "chat_id", 0) or 0
+        if api_method == "getMe":
+            result: Any = BOT_USER
+        elif api_method in ("sendMessage", "editMessageText"):
+            result = self._message(chat_id, text=method.text)
+        elif api_method == "sendDocument":
+            await self._upload_delay(method.document)
+            self.documents[chat_id] += 1
+            result = self._message(chat_id, document=self._document(method.document))
+        elif api_method == "sendMediaGroup":
+            await self._upload_delay(*(item.media for item in method.media))
+            self.documents[chat_id] += len(method.media)
+            result = [self._message(chat_id, document=self._document(item.media)) for item in method.media]
+        else:
+            result = True
+
+        return self.check_response(
+            bot=bot, method=method, status_code=200, content=json.dumps({"ok": True, "result": result})
+        ).result
+
+    async def stream_content(self, url: str, headers=None, timeout: int = 30, chunk_size: int = 65536,
+                             raise_for_status: bool = True) -> AsyncGenerator[bytes, None]:
+        yield b""
+
+    async def close(self):
+        pass
@@ -0,0 +1,192 @@
+"""Сквозной бенчмарк бота без Telegram и Docker.
+
+N пользователей одновременно проходят диалог /links_to_presentations (имя клиента, M ссылок)
+через настоящие обработчики, планировщик и Orchestrator; контейнеры этапов имитирует FakeDocker,
+Bot API - StubSession. Данные бота пишутся во временный каталог (BOT_DATA_DIR).
+
+Запуск:
+    python -m benchmarks.run --users 20 --links 15 --workers 4
+    python -m benchmarks.run --users 20 --links 15 --same-links   # проверка кэша объявлений
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import statistics
+from typing import Dict, List
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the presentation bot")
+    parser.add_argument("--users", type=int, default=10, help="Concurrent users")
+    parser.add_argument("--links", type=int, default=10, help="Links per user")
+    parser.add_argument("--workers", type=int, default=None, help="SCHEDULER_WORKERS override")
+    parser.add_argument("--stage-seconds", type=float, default=0.2, help="Fixed duration of a fake stage")
+    parser.add_argument("--item-seconds", type=float, default=0.02, help="Fake stage duration per link")
+    parser.add_argument("--nodes", type=int, default=1, help="Fake Docker nodes to place containers on")
+    parser.add_argument("--node-memory", type=float, default=16, help="Memory of each fake node, GB")
+    parser.add_argument("--node-cpus", type=int, default=8, help="CPUs of each fake node")
+    parser.add_argument("--docker-latency", type=float, default=0.01, help="Latency of a fake Docker API call")
+    parser.add_argument("--telegram-latency", type=float, default=0.03, help="Latency of a fake Bot API call")
+    parser.add_argument("--same-links", action="store_true", help="All users send the same links")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the listing cache")
+    parser.add_argument("--timeout", type=float, default=600, help="Give up after this many seconds")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for fake stage timings")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    return parser.parse_args(argv)
+
+
+def configure_environment(args: argparse.Namespace, data_dir: str):
+    """Настройки бота задаются до импорта bot.* - модули читают их при загрузке."""
+    os.environ["BOT_DATA_DIR"] = data_dir
+    os.environ["STATE_BACKEND"] = "memory"
+    os.environ["METRICS_ENABLED"] = "0"
+    os.environ["CACHE_ENABLED"] = "0" if args.no_cache else "1"
+    os.environ.setdefault("BOT_TOKEN", "123456:benchmark")
+    if args.workers:
+        os.environ["SCHEDULER_WORKERS"] = str(args.workers)
+
+
+def peak_rss() -> int:
+    """Пиковый RSS процесса в байтах (0, если платформа не сообщает)."""
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux сообщает килобайты, macOS - байты
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def make_links(args: argparse.Namespace, user: int) -> List[str]:
+    first = 300_000_000 if args.same_links else 300_000_000 + user * args.links
+    return [f"https://www.cian.ru/sale/flat/{first + i}/" for i in range(args.links)]
+
+
+async def run(args: argparse.Namespace) -> Dict[str, float]:
+    from aiogram import Bot, Dispatcher
+    from aiogram.types import Update
+
+    from benchmarks.fake_docker import FakeDocker, StageTiming
+    from benchmarks.fake_telegram import StubSession
+    from bot.docker_nodes import DockerNode, NodePool
+    from bot.handlers import router
+    from bot.orchestrator import orchestrator
+    from bot.scheduler import scheduler
+    from bot.state_backend import BackendStorage, state_backend
+    from bot.utils.job_manifest import JOB_DONE
+    from bot.utils.presentation_handler import stage_images
+
+    timing = StageTiming(base=args.stage_seconds, per_item=args.item_seconds)
+    dockers = [
+        FakeDocker(
+            dict.fromkeys(stage_images(), timing),
+            api_latency=args.docker_latency,
+            memory=int(args.node_memory * 1024 ** 3),
+            cpus=args.node_cpus,
+        )
+        for _ in range(max(1, args.nodes))
+    ]
+    orchestrator.nodes = NodePool(
+        [DockerNode(f"fake-{number}", client=docker) for number, docker in enumerate(dockers, start=1)]
+    )
+    await orchestrator.nodes.start()
+    await orchestrator.warm_up(stage_images())
+    await scheduler.start(memory_capacity=orchestrator.nodes.memory_capacity())
+
+    session = StubSession(latency=args.telegram_latency)
+    bot = Bot(token=os.environ["BOT_TOKEN"], session=session)
+    dp = Dispatcher(storage=BackendStorage(state_backend))
+    # Общий роутер пакета: роутеры обработчиков уже подключены к нему при импорте bot.handlers
+    dp.include_router(router)
+    update_ids = iter(range(1, 10 ** 9))
+
+    async def send(user_id: int, text: str):
+        update = {
+            "update_id": next(update_ids),
+            "message": {
+                "message_id": next(update_ids),
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+                "text": text,
+                **({"entities": [{"type": "bot_command", "offset": 0, "length": len(text)}]}
+                   if text.startswith("/") else {}),
+            },
+        }
+        await dp.feed_update(bot, Update.model_validate(update, context={"bot": bot}))
+
+    async def simulate_user(user_id: int) -> float:
+        await send(user_id, "/links_to_presentations")
+        await send(user_id, f"Клиент {user_id}")
+        started = time.monotonic()
+        await send(user_id, "\n".join(make_links(args, user_id)))
+        # Задача выполняется в фоне; по её окончании обработчик очищает состояние диалога
+        key = dp.fsm.get_context(bot, chat_id=user_id, user_id=user_id)
+        while await key.get_state() is not None:
+            await asyncio.sleep(0.05)
+        return time.monotonic() - started
+
+    user_ids = list(range(1, args.users + 1))
+    started = time.monotonic()
+    try:
+        latencies = await asyncio.wait_for(
+            asyncio.gather(*(simulate_user(user_id) for user_id in user_ids)), timeout=args.timeout
+        )
+    finally:
+        elapsed = time.monotonic() - started
+        await scheduler.drain(timeout=5)
+        await scheduler.stop()
+        await orchestrator.nodes.close()
+        await bot.session.close()
+
+    completed = len(await state_backend.list_jobs(JOB_DONE))
+    return {
+        "users": args.users,
+        "links_per_user": args.links,
+        "workers": scheduler.workers,
+        "elapsed_seconds": round(elapsed, 3),
+        "jobs_completed": completed,
+        "jobs_per_minute": round(completed / elapsed * 60, 2) if elapsed else 0.0,
+        "latency_p50": round(statistics.median(latencies), 3),
+        "latency_p95": round(percentile(latencies, 0.95), 3),
+        "latency_max": round(max(latencies), 3),
+        "peak_rss_mb": round(peak_rss() / 1024 ** 2, 1),
+        "containers_created": sum(docker.created for docker in dockers),
+        "containers_peak": sum(docker.peak_containers for docker in dockers),
+        "containers_per_node": [docker.created for docker in dockers],
+        "documents_sent": sum(session.documents.values()),
+        "bot_api_calls": sum(session.calls.values()),
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.seed is not None:
+        random.seed(args.seed)
+    with tempfile.TemporaryDirectory(prefix="bot-benchmark-") as data_dir:
+        configure_environment(args, data_dir)
+        report = asyncio.run(run(args))
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+    width = max(len(name) for name in report)
+    for name, value in report.items():
+        print(f"{name:<{width}}  {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional, TypeVar
+from urllib.parse import urlsplit
+
+from bot.config.config import CACHE_TTL, CACHE_MAX_BYTES
+from bot.utils.workspace import DATA_DIR, JOBS_CONTAINER_DIR
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+CACHE_DIR = os.path.join(DATA_DIR, "cache")
+
+# Номер объявления в ссылке cian.ru (https://www.cian.ru/sale/flat/123456789/)
+LISTING_ID_REGEX = re.compile(r"/(\d{5,})(?:/|$)")
+
+
+def normalize_listing_url(url: str) -> str:
+    """Приводит ссылку на объявление к единому виду: без схемы http, www./m., параметров и якоря."""
+    parts = urlsplit(url.strip() if "://" in url else f"https://{url.strip()}")
+    host = parts.netloc.lower()
+    for prefix in ("www.", "m."):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    path = parts.path.rstrip("/") + "/"
+    return f"https://{host}{path}"
+
+
+def listing_id(url: str) -> Optional[str]:
+    """Номер объявления из ссылки или None."""
+    match = LISTING_ID_REGEX.search(urlsplit(normalize_listing_url(url)).path)
+    return match.group(1) if match else None
+
+
+def _directory_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+
+class ListingCache:
+    """Кэш результатов этапов по объявлениям на диске: строки таблицы и файлы изображений.
+
+    Ключ - нормализованная ссылка, образ этапа (его версия) и окружение этапа без путей задачи.
+    Записи старше CACHE_TTL не выдаются, при превышении CACHE_MAX_BYTES удаляются
+    давно не использованные записи.
+
+    Методы блокируют поток на файловых операциях - из асинхронного кода их вызывают через
+    asyncio.to_thread. Кэш общий для процессов бота: запись, удаленную другим процессом,
+    считаем промахом и перечитываем индекс.
+    """
+
+    def __init__(self, root: str = CACHE_DIR, ttl: int = CACHE_TTL, max_bytes: int = CACHE_MAX_BYTES):
+        self.root = root
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._index: Optional[Dict[str, dict]] = None
+        self._lock = threading.RLock()
+        self.hits = Counter()
+        self.misses = Counter()
+
+    def key(self, url: str, image_name: str, image_version: str, environment: Dict[str, str]) -> str:
+        """Ключ записи кэша для объявления и этапа."""
+        stable_environment = sorted(
+            (name, str(value))
+            for name, value in environment.items()
+            # Формат таблицы не влияет на строки объявления - кэш общий для CSV и JSONL
+            if name not in ("CLIENT_NAME", "TABLE_FORMAT") and not str(value).startswith(JOBS_CONTAINER_DIR)
+        )
+        payload = json.dumps(
+            [normalize_listing_url(url), image_name, image_version, stable_environment],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    @property
+    def index(self) -> Dict[str, dict]:
+        """Метаданные всех записей (загружаются с диска при первом обращении и после промаха по удаленной записи)."""
+        with self._lock:
+            if self._index is None:
+                self._index = self._load_index()
+                logger.info(f"Cache index loaded: {len(self._index)} entries")
+            return self._index
+
+    def _load_index(self) -> Dict[str, dict]:
+        index = {}
+        if os.path.isdir(self.root):
+            for prefix in os.listdir(self.root):
+                prefix_dir = os.path.join(self.root, prefix)
+                for key in os.listdir(prefix_dir) if os.path.isdir(prefix_dir) else []:
+                    if key.endswith(".tmp"):
+                        continue
+                    try:
+                        with open(os.path.join(prefix_dir, key, "meta.json"), encoding="utf-8") as file:
+                            index[key] = json.load(file)
+                    except FileNotFoundError:
+                        # Запись удаляет или пишет другой процесс
+                        continue
+                    except (OSError, ValueError):
+                        shutil.rmtree(os.path.join(prefix_dir, key), ignore_errors=True)
+        return index
+
+    def _lookup(self, key: str) -> Optional[str]:
+        with self._lock:
+            meta = self.index.get(key)
+            if meta and time.time() - meta["created"] > self.ttl:
+                self._remove(key)
+                meta = None
+            if not meta:
+                return None
+            meta["last_access"] = time.time()
+        self._write_meta(key, meta)
+        return self._path(key)
+
+    def _get(self, key: str, stage: str, read: Callable[[str], T]) -> Optional[T]:
+        """Читает запись через read(путь записи); отсутствующая запись или её файлы - промах."""
+        path = self._lookup(key)
+        value = None
+        if path is not None:
+            try:
+                value = read(path)
+            except FileNotFoundError:
+                # Запись вытеснил другой процесс - наш индекс устарел
+                logger.info(f"Cache entry {key[:12]} was removed by another process, reloading index")
+                with self._lock:
+                    self._index = None
+        with self._lock:
+            if value is None:
+                self.misses[stage] += 1
+            else:
+                self.hits[stage] += 1
+        return value
+
+    def _write_meta(self, key: str, meta: dict):
+        try:
+            with open(os.path.join(self._path(key), "meta.json"), "w", encoding="utf-8") as file:
+                json.dump(meta, file, ensure_ascii=False)
+        except FileNotFoundError:
+            # Запись удалена другим процессом - промах обнаружится при чтении
+            pass
+        except OSError as e:
+            logger.warning(f"Failed to update cache entry {key[:12]}: {e}")
+
+    def get_rows(self, key: str, stage: str) -> Optional[List[Dict[str, str]]]:
+        """Строки таблицы объявления или None при промахе."""
+        def read(path):
+            with open(os.path.join(path, "rows.json"), encoding="utf-8") as file:
+                return json.load(file)
+        return self._get(key, stage, read)
+
+    def get_files(self, key: str, stage: str, target_dir: str) -> Optional[List[str]]:
+        """Копирует файлы объявления из кэша в target_dir. Возвращает пути копий или None при промахе."""
+        def read(path):
+            files_dir = os.path.join(path, "files")
+            return [shutil.copy2(os.path.join(files_dir, name), target_dir) for name in sorted(os.listdir(files_dir))]
+        return self._get(key, stage, read)
+
+    def _store(self, key: str, url: str, write) -> None:
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        write(tmp_path)
+        meta = {"url": normalize_listing_url(url), "created": time.time(), "last_access": time.time()}
+        meta["size"] = _directory_size(tmp_path)
+        with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as file:
+            json.dump(meta, file, ensure_ascii=False)
+        with self._lock:
+            shutil.rmtree(path, ignore_errors=True)
+            os.replace(tmp_path, path)
+            self.index[key] = meta
+            self.evict()
+
+    def put_rows(self, key: str, url: str, rows: List[Dict[str, str]]):
+        """Сохраняет строки таблицы объявления."""
+        def write(path):
+            with open(os.path.join(path, "rows.json"), "w", encoding="utf-8") as file:
+                json.dump(rows, file, ensure_ascii=False)
+        self._store(key, url, write)
+
+    def put_files(self, key: str, url: str, files: List[str]):
+        """Сохраняет копии файлов объявления."""
+        def write(path):
+            files_dir = os.path.join(path, "files")
+            os.makedirs(files_dir)
+            for file_path in files:
+                shutil.copy2(file_path, files_dir)
+        self._store(key, url, write)
+
+    def _remove(self, key: str):
+        with self._lock:
+            self.index.pop(key, None)
+            shutil.rmtree(self._path(key), ignore_errors=True)
+
+    def evict(self):
+        """Удаляет просроченные записи и давно не использованные сверх лимита размера."""
+        with self._lock:
+            now = time.time()
+            for key in [k for k, meta in self.index.items() if now - meta["created"] > self.ttl]:
+                self._remove(key)
+
+            total = sum(meta.get("size", 0) for meta in self.index.values())
+            if total <= self.max_bytes:
+                return
+            for key, meta in sorted(self.index.items(), key=lambda item: item[1]["last_access"]):
+                if total <= self.max_bytes * 0.9:
+                    break
+                total -= meta.get("size", 0)
+                self._remove(key)
+                logger.info(f"Cache entry {key[:12]} evicted")
+
+    def log_stats(self, stage: str, hits: int, misses: int):
+        """Пишет в лог попадания этапа и накопленную статистику кэша (может перечитать индекс с диска)."""
+        logger.info(
+            f"Cache [{stage}]: {hits} hits, {misses} misses "
+            f"(total {sum(self.hits.values())} hits / {sum(self.misses.values())} misses, "
+            f"{len(self.index)} entries)"
+        )
+
+
+# Создание глобального экземпляра
+listing_cache = ListingCache()
@@ -1,4 +1,5 @@
 import os
+import json
 
 # Токен бота
 BOT_TOKEN = os.getenv("BOT_TOKEN", "7178816290:AAFVPHF2d69nanZaT0XE2mUqB5xTui-zvQw")
@@ -7,3 +8,133 @@ BOT_TOKEN = os.getenv("BOT_TOKEN", "7178816290:AAFVPHF2d69nanZaT0XE2mUqB5xTui-zv
 
 MEMORY_LIMIT = 12 * 1024 * 1024 * 1024  # 4GB в байтах
 SWAP_LIMIT = 12 * 1024 * 1024 * 1024  # 4GB Swap
+
+# Шардирование больших задач: парсинг и обработка изображений выполняются
+# в нескольких контейнерах параллельно, по SHARD_SIZE ссылок в каждом
+SHARD_SIZE = int(os.getenv("SHARD_SIZE", "10"))
+SHARD_CONCURRENCY = int(os.getenv("SHARD_CONCURRENCY", str(max(1, (os.cpu_count() or 2) // 2))))
+
+# Планировщик задач
+SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", "2"))  # Максимум одновременно выполняемых задач
+HOST_MEMORY_BUDGET = int(os.getenv("HOST_MEMORY_BUDGET", "0"))  # Бюджет памяти под задачи в байтах (0 - 80% памяти узлов Docker)
+# Резерв памяти на задачу, пока у этапов нет истории потребления (0 - не резервировать:
+# бюджет начинает действовать, когда резерв можно оценить по наблюдавшимся пикам этапов)
+JOB_MEMORY_RESERVATION = int(os.getenv("JOB_MEMORY_RESERVATION", "0"))
+
+# Сколько хранить каталог упавшей задачи для /retry (сек)
+JOB_RETENTION = int(os.getenv("JOB_RETENTION", str(3 * 24 * 3600)))
+
+# Пул «тёплых» контейнеров для этапов (0 - каждый этап в новом контейнере)
+CONTAINER_POOL_ENABLED = os.getenv("CONTAINER_POOL_ENABLED", "0") == "1"
+POOL_SIZE_PER_IMAGE = int(os.getenv("POOL_SIZE_PER_IMAGE", "2"))  # Сколько простаивающих контейнеров держать на образ
+POOL_MAX_USES = int(os.getenv("POOL_MAX_USES", "20"))  # После стольких запусков контейнер пересоздается
+POOL_IDLE_TIMEOUT = int(os.getenv("POOL_IDLE_TIMEOUT", "900"))  # Простаивающий дольше (сек) контейнер удаляется
+
+# Кэш разобранных объявлений и обработанных изображений между задачами
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "1") == "1"
+CACHE_TTL = int(os.getenv("CACHE_TTL", str(7 * 24 * 3600)))  # Время жизни записи (сек)
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(5 * 1024 * 1024 * 1024)))  # 5GB, сверх - вытесняются давно не использованные
+CACHE_LINK_COLUMN = os.getenv("CACHE_LINK_COLUMN", "Ссылка")  # Колонка таблицы со ссылкой на объявление
+
+# Сколько последних байт лога контейнера держать в памяти для сообщений об ошибке
+LOG_TAIL_BYTES = int(os.getenv("LOG_TAIL_BYTES", str(64 * 1024)))
+
+# Ограничения Telegram на отправку/редактирование сообщений (сообщений в секунду)
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "25"))  # На весь бот (лимит Telegram - 30)
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))  # На личный чат
+TELEGRAM_GROUP_RATE = float(os.getenv("TELEGRAM_GROUP_RATE", str(20 / 60)))  # На группу (лимит Telegram - 20 в минуту)
+
+# Отправка готовых презентаций
+DELIVERY_CONCURRENCY = int(os.getenv("DELIVERY_CONCURRENCY", "4"))  # Одновременных загрузок на весь бот
+DELIVERY_RETRIES = int(os.getenv("DELIVERY_RETRIES", "5"))  # Попыток на одну отправку
+DELIVERY_ZIP_THRESHOLD = int(os.getenv("DELIVERY_ZIP_THRESHOLD", "20"))  # Больше стольких файлов - один архив (0 - не архивировать)
+
+# Режим получения обновлений: polling или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # Публичный адрес бота, например https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # Проверяется в заголовке X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+SHUTDOWN_DRAIN_TIMEOUT = int(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "600"))  # Сколько ждать выполняющиеся задачи при остановке (сек)
+
+# Общее состояние (FSM, реестр задач, владельцы контейнеров) для нескольких процессов бота
+STATE_BACKEND = os.getenv("STATE_BACKEND", "sqlite")  # sqlite - файл на общем диске, memory - только в процессе
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "")  # Путь к базе SQLite (пусто - data/state.sqlite3)
+INSTANCE_ID = os.getenv("INSTANCE_ID", "")  # Имя процесса бота (пусто - hostname-pid)
+INSTANCE_HEARTBEAT_INTERVAL = int(os.getenv("INSTANCE_HEARTBEAT_INTERVAL", "30"))  # Как часто процесс отмечается живым (сек)
+INSTANCE_TTL = int(os.getenv("INSTANCE_TTL", "120"))  # Без отметки дольше (сек) процесс считается упавшим
+JOB_WATCH_INTERVAL = int(os.getenv("JOB_WATCH_INTERVAL", "5"))  # Как часто проверяются запросы отмены и брошенные задачи (сек)
+
+# Прогрев образов этапов при запуске: отсутствующие образы загружаются заранее, а не в задаче пользователя
+IMAGE_REGISTRY = os.getenv("IMAGE_REGISTRY", "")  # Реестр для загрузки отсутствующих образов, например localhost:5000
+IMAGE_TARBALL_DIR = os.getenv("IMAGE_TARBALL_DIR", "")  # Каталог с архивами образов (<образ>.tar из docker save)
+IMAGE_PULL_TIMEOUT = int(os.getenv("IMAGE_PULL_TIMEOUT", "600"))  # Ограничение на загрузку одного образа (сек)
+IMAGE_WARMUP_REQUIRED = os.getenv("IMAGE_WARMUP_REQUIRED", "0") == "1"  # Не запускать бота, если какой-то образ недоступен
+
+# Повторы запуска контейнеров этапов
+STAGE_TIMEOUT = int(os.getenv("STAGE_TIMEOUT", "300"))  # Таймаут одного запуска этапа (сек)
+STAGE_RETRIES = int(os.getenv("STAGE_RETRIES", "3"))  # Попыток запуска, включая первую
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "2"))  # Пауза после первой неудачи, дальше удваивается (сек)
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "60"))
+# Настройки отдельных образов, например {"cian_deep_page_parser": {"timeout": 900, "retry_on": ["docker", "timeout"]}}
+# retry_on - какие ошибки повторять: exit, oom, killed, timeout, docker, error
+STAGE_RETRY_POLICIES = json.loads(os.getenv("STAGE_RETRY_POLICIES", "{}"))
+# Предохранитель: после стольких неудачных запусков образа подряд задачи с ним падают сразу
+CIRCUIT_BREAKER_THRESHOLD = int(os.getenv("CIRCUIT_BREAKER_THRESHOLD", "5"))  # 0 - отключен
+CIRCUIT_BREAKER_COOLDOWN = int(os.getenv("CIRCUIT_BREAKER_COOLDOWN", "300"))  # Через сколько (сек) пробовать снова
+
+# Порты хоста, из которых выделяются порты для публикации портов контейнеров этапов (пусто - эфемерные порты Docker)
+HOST_PORT_RANGE = os.getenv("HOST_PORT_RANGE", "9223-9322")
+
+# Ограничения ресурсов контейнеров по истории потребления этапов (иначе - MEMORY_LIMIT/SWAP_LIMIT для всех)
+ADAPTIVE_LIMITS_ENABLED = os.getenv("ADAPTIVE_LIMITS_ENABLED", "1") == "1"
+RESOURCE_SAFETY_MARGIN = float(os.getenv("RESOURCE_SAFETY_MARGIN", "1.5"))  # Запас сверх наблюдавшегося пика
+RESOURCE_MIN_SAMPLES = int(os.getenv("RESOURCE_MIN_SAMPLES", "3"))  # Сколько запусков образа нужно до адаптации
+RESOURCE_HISTORY_SIZE = int(os.getenv("RESOURCE_HISTORY_SIZE", "50"))  # Сколько последних запусков образа помнить
+RESOURCE_MIN_MEMORY = int(os.getenv("RESOURCE_MIN_MEMORY", str(256 * 1024 * 1024)))  # Нижняя граница памяти контейнера
+RESOURCE_MIN_CPUS = float(os.getenv("RESOURCE_MIN_CPUS", "0.5"))  # Нижняя граница квоты CPU (ядер)
+# Ожидаемый пик памяти контейнера этапа, пока нет истории: столько резервируется на узле Docker при размещении
+CONTAINER_MEMORY_ESTIMATE = int(os.getenv("CONTAINER_MEMORY_ESTIMATE", str(1024 * 1024 * 1024)))
+
+# Метрики: /metrics для Prometheus и команда /stats для администраторов
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+ADMIN_IDS = {int(user_id) for user_id in os.getenv("ADMIN_IDS", "").split(",") if user_id.strip()}  # id пользователей Telegram
+
+# Предварительная проверка ссылок: дубликаты убираются всегда, доступность - если включено
+LINK_CHECK_ENABLED = os.getenv("LINK_CHECK_ENABLED", "0") == "1"
+LINK_CHECK_CONCURRENCY = int(os.getenv("LINK_CHECK_CONCURRENCY", "10"))  # Одновременных запросов к cian.ru
+LINK_CHECK_TIMEOUT = float(os.getenv("LINK_CHECK_TIMEOUT", "5"))  # Ожидание ответа на одну ссылку (сек)
+
+# Файлы логов: ротация лога бота, логи задач и команда /logs
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))  # Размер лога бота, после которого он ротируется
+LOG_ROTATE_INTERVAL = int(os.getenv("LOG_ROTATE_INTERVAL", str(24 * 3600)))  # Ротация не реже, чем раз в столько секунд
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "10"))  # Сколько сжатых старых логов бота хранить
+LOG_RETENTION = int(os.getenv("LOG_RETENTION", str(14 * 24 * 3600)))  # Время хранения логов задач (сек)
+LOG_TAIL_LINES = int(os.getenv("LOG_TAIL_LINES", "1000"))  # Сколько последних строк отправляет /logs по умолчанию
+LOG_MAX_LINES = int(os.getenv("LOG_MAX_LINES", "100000"))  # Наибольшее число строк, которое можно запросить
+LOG_COMPRESS_THRESHOLD = int(os.getenv("LOG_COMPRESS_THRESHOLD", str(256 * 1024)))  # Больше - отправляется в gzip
+
+# Узлы Docker для контейнеров этапов. JSON-список, например:
+# [{"name": "local"}, {"name": "node2", "url": "tcp://10.0.0.2:2375", "memory": 34359738368, "cpus": 8, "data_path": "/mnt/bot-data"}]
+# url - адрес Docker API (по умолчанию - локальный демон), memory/cpus - емкость узла (по умолчанию - из docker info),
+# data_path - где на узле смонтирован общий каталог данных бота (по умолчанию - тот же путь, что и у бота)
+DOCKER_NODES = json.loads(os.getenv("DOCKER_NODES", "[]"))
+NODE_FAILURE_THRESHOLD = int(os.getenv("NODE_FAILURE_THRESHOLD", "3"))  # Ошибок Docker API подряд до исключения узла
+NODE_HEALTH_INTERVAL = int(os.getenv("NODE_HEALTH_INTERVAL", "30"))  # Как часто проверять исключенные узлы (сек)
+
+# Повторные задачи клиента: обрабатываются только ссылки, которых не было в последней успешной задаче
+INCREMENTAL_RUNS_ENABLED = os.getenv("INCREMENTAL_RUNS_ENABLED", "1") == "1"
+CLIENT_HISTORY_TTL = int(os.getenv("CLIENT_HISTORY_TTL", str(30 * 24 * 3600)))  # Более старая история не учитывается (сек)
+
+# Порядок задач: сначала короткие (по оценке длительности), ожидание постепенно повышает приоритет
+FAST_LANE_WORKERS = int(os.getenv("FAST_LANE_WORKERS", "1"))  # Воркеры только для коротких задач (всегда остается хотя бы один общий)
+FAST_LANE_MAX_SECONDS = int(os.getenv("FAST_LANE_MAX_SECONDS", "180"))  # Задача не длиннее (по оценке) - короткая
+SCHEDULER_AGING = float(os.getenv("SCHEDULER_AGING", "0.5"))  # На сколько секунд оценки уменьшается каждая секунда ожидания
+USER_PRIORITIES = json.loads(os.getenv("USER_PRIORITIES", "{}"))  # {"<id пользователя>": вес}, вес 2 - оценка вдвое меньше
+
+# Промежуточная таблица задачи: csv (совместимость) или jsonl (схема в первой строке, колонки можно дописывать файлами)
+TABLE_FORMAT = os.getenv("TABLE_FORMAT", "csv")
+STAGE_TABLE_FORMATS = json.loads(os.getenv("STAGE_TABLE_FORMATS", "{}"))  # {"образ": "csv"|"jsonl"} - формат, который понимает образ этапа
@@ -0,0 +1,256 @@
+import aiodocker
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from bot.config.config import (
+    POOL_SIZE_PER_IMAGE,
+    POOL_MAX_USES,
+    POOL_IDLE_TIMEOUT,
+)
+from bot.resource_limits import ResourceLimits, StatsMonitor
+from bot.utils.workspace import JOBS_DIR, JOBS_CONTAINER_DIR
+from bot.utils.log_stream import LogStream, LineSplitter
+from bot.state_backend import INSTANCE_ID, OWNER_LABEL, state_backend
+
+logger = logging.getLogger(__name__)
+
+# Команда, которая держит контейнер запущенным в ожидании exec
+IDLE_ENTRYPOINT = ["sleep", "infinity"]
+
+
+class PoolUnavailable(Exception):
+    """Этап нельзя выполнить в пуле - нужно запускать контейнер в обычном режиме."""
+
+
+class PooledWorker:
+    """Долгоживущий контейнер, в котором этапы выполняются через exec."""
+
+    def __init__(self, image_name: str, container, limits: ResourceLimits):
+        self.image_name = image_name
+        self.container = container
+        self.limits = limits
+        self.uses = 0
+        self.last_used = time.monotonic()
+
+    def fits(self, limits: ResourceLimits) -> bool:
+        """Ограничения контейнера не меньше нужных запуску (0 по CPU - без ограничения)."""
+        if self.limits.memory < limits.memory:
+            return False
+        return not self.limits.nano_cpus or 0 < limits.nano_cpus <= self.limits.nano_cpus
+
+    @property
+    def id(self) -> str:
+        return self.container.id
+
+    async def is_healthy(self) -> bool:
+        """Контейнер жив и готов принимать exec."""
+        try:
+            info = await self.container.show()
+            return bool(info["State"]["Running"])
+        except aiodocker.exceptions.DockerError:
+            return False
+
+
+class ContainerPool:
+    """Пул тёплых контейнеров по образам с переиспользованием, проверкой здоровья и вытеснением.
+
+    Контейнер создается с ограничениями ресурсов первого запуска, которому он понадобился,
+    и переиспользуется только запусками, которым этих ограничений хватает. Контейнеры пула
+    записываются в общее состояние, как и обычные контейнеры этапов.
+    """
+
+    def __init__(self, data_path: str):
+        self.data_path = data_path
+        self.docker = None
+        self._idle: Dict[str, List[PooledWorker]] = {}
+        self._commands: Dict[str, Tuple[List[str], Optional[str]]] = {}
+        self._unsupported = set()
+        self._lock = asyncio.Lock()
+        self._evict_task: Optional[asyncio.Task] = None
+
+    def start(self, docker):
+        """Подключение к Docker клиенту оркестратора и запуск фонового вытеснения."""
+        self.docker = docker
+        if self._evict_task is None:
+            self._evict_task = asyncio.create_task(self._evict_loop())
+        logger.info(
+            f"Container pool enabled: {POOL_SIZE_PER_IMAGE} idle per image, "
+            f"max {POOL_MAX_USES} uses, idle timeout {POOL_IDLE_TIMEOUT}s"
+        )
+
+    @staticmethod
+    def supports(volumes: Optional[dict]) -> bool:
+        """Пул монтирует только общий каталог задач, поэтому остальные привязки не поддерживаются."""
+        for host_path, container_path in (volumes or {}).items():
+            relative = os.path.relpath(os.path.abspath(host_path), JOBS_DIR)
+            if relative.startswith(".."):
+                return False
+            if container_path != f"{JOBS_CONTAINER_DIR}/{relative.replace(os.sep, '/')}":
+                return False
+        return True
+
+    async def _image_command(self, image_name: str) -> Tuple[List[str], Optional[str]]:
+        """Команда и рабочий каталог образа, которые выполнил бы обычный запуск."""
+        if image_name not in self._commands:
+            info = await self.docker.images.inspect(image_name)
+            config = info.get("Config") or {}
+            command = (config.get("Entrypoint") or []) + (config.get("Cmd") or [])
+            if not command:
+                raise PoolUnavailable(f"Image {image_name} has no entrypoint or command")
+            self._commands[image_name] = (command, config.get("WorkingDir") or None)
+        return self._commands[image_name]
+
+    async def _create_worker(self, image_name: str, limits: ResourceLimits) -> PooledWorker:
+        config = {
+            "Image": image_name,
+            "Entrypoint": IDLE_ENTRYPOINT,
+            "Cmd": [],
+            "HostConfig": {
+                "Binds": [
+                    f"{self.data_path}:/app/data:rw",
+                    f"{JOBS_DIR}:{JOBS_CONTAINER_DIR}:rw",
+                ],
+                **limits.host_config(),
+            },
+            "Labels": {OWNER_LABEL: INSTANCE_ID},
+        }
+        container = await self.docker.containers.create(config)
+        worker = PooledWorker(image_name, container, limits)
+        await state_backend.add_container(container.id, INSTANCE_ID, image_name)
+        try:
+            await container.start()
+            await asyncio.sleep(0.5)
+            if not await worker.is_healthy():
+                raise PoolUnavailable(f"Idle container for {image_name} exited right after start")
+        except Exception:
+            await self._remove(worker)
+            raise
+        logger.info(f"Pool worker {worker.id[:12]} started for {image_name}")
+        return worker
+
+    async def _remove(self, worker: PooledWorker):
+        try:
+            await worker.container.delete(force=True)
+            logger.info(f"Pool worker {worker.id[:12]} removed")
+        except aiodocker.exceptions.DockerError as e:
+            logger.error(f"Failed to remove pool worker {worker.id[:12]}: {e}")
+        finally:
+            await state_backend.remove_container(worker.id)
+
+    async def _acquire(self, image_name: str, limits: ResourceLimits) -> PooledWorker:
+        """Берет здоровый простаивающий контейнер с достаточными ограничениями или создает новый."""
+        while True:
+            async with self._lock:
+                idle = self._idle.get(image_name, [])
+                worker = next((w for w in reversed(idle) if w.fits(limits)), None)
+                if worker is not None:
+                    idle.remove(worker)
+            if worker is None:
+                return await self._create_worker(image_name, limits)
+            if await worker.is_healthy():
+                return worker
+            logger.warning(f"Pool worker {worker.id[:12]} is unhealthy, replacing")
+            await self._remove(worker)
+
+    async def _release(self, worker: PooledWorker, reusable: bool):
+        """Возвращает контейнер в пул или удаляет его (исчерпан лимит, ошибка, переполнение)."""
+        worker.last_used = time.monotonic()
+        if reusable and worker.uses < POOL_MAX_USES:
+            async with self._lock:
+                idle = self._idle.setdefault(worker.image_name, [])
+                if len(idle) < POOL_SIZE_PER_IMAGE:
+                    idle.append(worker)
+                    return
+        await self._remove(worker)
+
+    async def run(
+        self,
+        image_name: str,
+        log_stream: LogStream,
+        environment: dict = None,
+        command: str = None,
+        timeout: int = 300,
+        limits: ResourceLimits = None,
+    ) -> Tuple[str, int, StatsMonitor]:
+        """Выполняет этап в тёплом контейнере с ограничениями не меньше limits.
+
+        Возвращает (последние строки лога, код выхода, пиковое потребление контейнера за время запуска).
+        """
+        limits = limits or ResourceLimits()
+        if image_name in self._unsupported:
+            raise PoolUnavailable(f"Image {image_name} cannot be pooled")
+
+        try:
+            image_command, workdir = await self._image_command(image_name)
+            worker = await self._acquire(image_name, limits)
+        except (PoolUnavailable, aiodocker.exceptions.DockerError) as e:
+            logger.warning(f"Pool mode disabled for {image_name}: {e}")
+            self._unsupported.add(image_name)
+            raise PoolUnavailable(str(e)) from e
+
+        worker_id = worker.id[:12]
+        log_stream.write(f"--- pool worker {worker_id} ---")
+        worker.uses += 1
+        reusable = False
+        monitor = StatsMonitor(worker.container)
+        stats_task = asyncio.create_task(monitor.run())
+        try:
+            exec_instance = await worker.container.exec(
+                command.split() if command else image_command,
+                stdout=True,
+                stderr=True,
+                environment=environment or {},
+                workdir=workdir,
+            )
+            await asyncio.wait_for(
+                self._collect_output(exec_instance, log_stream), timeout=timeout
+            )
+            exit_code = (await exec_instance.inspect())["ExitCode"]
+            # Контейнер с упавшим процессом не переиспользуем: состояние внутри могло испортиться
+            reusable = exit_code == 0
+            return log_stream.tail(), exit_code, monitor
+        except asyncio.TimeoutError:
+            logger.error(f"Timeout while waiting for {image_name} in pool worker {worker_id}")
+            raise
+        finally:
+            stats_task.cancel()
+            await asyncio.gather(stats_task, return_exceptions=True)
+            await self._release(worker, reusable)
+
+    async def _collect_output(self, exec_instance, log_stream: LogStream):
+        """Передает вывод exec в поток логов построчно."""
+        splitter = LineSplitter(log_stream)
+        async with exec_instance.start(detach=False) as stream:
+            while True:
+                message = await stream.read_out()
+                if message is None:
+                    break
+                splitter.feed(message.data.decode("utf-8", errors="replace"))
+        splitter.flush()
+
+    async def _evict_loop(self):
+        """Периодически удаляет контейнеры, простаивающие дольше POOL_IDLE_TIMEOUT."""
+        while True:
+            await asyncio.sleep(min(60, POOL_IDLE_TIMEOUT))
+            now = time.monotonic()
+            expired = []
+            async with self._lock:
+                for image_name, idle in self._idle.items():
+                    expired.extend(w for w in idle if now - w.last_used > POOL_IDLE_TIMEOUT)
+                    idle[:] = [w for w in idle if now - w.last_used <= POOL_IDLE_TIMEOUT]
+            for worker in expired:
+                logger.info(f"Evicting idle pool worker {worker.id[:12]} ({worker.image_name})")
+                await self._remove(worker)
+
+    async def shutdown(self):
+        """Удаляет все простаивающие контейнеры пула."""
+        if self._evict_task:
+            self._evict_task.cancel()
+            self._evict_task = None
+        async with self._lock:
+            workers = [w for idle in self._idle.values() for w in idle]
+            self._idle.clear()
+        await asyncio.gather(*(self._remove(w) for w in workers))
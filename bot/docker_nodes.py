@@ -0,0 +1,247 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+import aiodocker
+import aiohttp
+
+from bot.config.config import DOCKER_NODES, NODE_FAILURE_THRESHOLD, NODE_HEALTH_INTERVAL
+from bot.metrics import NODE_HEALTHY, NODE_CONTAINERS
+from bot.port_allocator import PortAllocator, is_port_conflict
+from bot.resource_limits import ResourceLimits
+from bot.utils.workspace import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+
+class NoHealthyNodes(Exception):
+    """Все узлы Docker исключены из-за ошибок API."""
+
+
+def is_node_error(error: BaseException) -> bool:
+    """Ошибка говорит о проблеме узла (демон недоступен или сбоит), а не о конкретном контейнере."""
+    if isinstance(error, aiodocker.exceptions.DockerError):
+        # Занятый порт - ошибка 500, но узел исправен
+        return error.status >= 500 and not is_port_conflict(error)
+    # Отказ соединения с демоном - тоже ClientError; таймаут этапа к здоровью узла не относится
+    return isinstance(error, aiohttp.ClientError)
+
+
+class DockerNode:
+    """Docker демон, на котором запускаются контейнеры этапов, и его текущая загрузка.
+
+    memory/cpus - емкость узла (0 - узнать из docker info), data_path - путь общего
+    каталога данных бота на этом узле: контейнеры получают тома по нему.
+    ports - порты узла для публикации портов контейнеров (HOST_PORT_RANGE на каждом узле).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        url: Optional[str] = None,
+        memory: int = 0,
+        cpus: float = 0,
+        data_path: str = "",
+        client: Any = None,
+    ):
+        self.name = name
+        self.url = url
+        self.memory = memory
+        self.cpus = cpus
+        self.data_path = data_path or DATA_DIR
+        self.client = client
+        self.images: Dict[str, str] = {}  # Образы, проверенные на узле: имя -> digest
+        # Проверить порт попыткой занять его можно только на машине бота
+        self.ports = PortAllocator(probe=self.is_local)
+        self.reserved_memory = 0
+        self.reserved_cpus = 0.0
+        self.running = 0
+        self.failures = 0
+        self.healthy = True
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "DockerNode":
+        return cls(
+            name=config.get("name") or config.get("url") or "local",
+            url=config.get("url"),
+            memory=int(config.get("memory", 0)),
+            cpus=float(config.get("cpus", 0)),
+            data_path=config.get("data_path", ""),
+        )
+
+    @property
+    def is_local(self) -> bool:
+        """Демон работает на машине бота (локальный сокет)."""
+        return not self.url or self.url.startswith("unix://")
+
+    def to_node_path(self, host_path: str) -> str:
+        """Путь на узле для пути бота внутри DATA_DIR (остальные пути не меняются)."""
+        relative = os.path.relpath(host_path, DATA_DIR)
+        if relative == os.curdir:
+            return self.data_path
+        if relative.startswith(os.pardir):
+            return host_path
+        return "/".join([self.data_path.rstrip("/"), *relative.split(os.sep)])
+
+    @staticmethod
+    def demand(limits: ResourceLimits, memory: int):
+        """(память, ядра), которые резервирует контейнер; без квоты CPU - одно ядро.
+
+        memory - ожидаемый пик памяти контейнера (см. ResourceHistory.expected_memory), а не его лимит.
+        """
+        return memory, (limits.nano_cpus / 1e9) or 1.0
+
+    def load(self) -> float:
+        """Доля занятой емкости узла (наибольшая из памяти и CPU)."""
+        return max(
+            self.reserved_memory / self.memory if self.memory else 0.0,
+            self.reserved_cpus / self.cpus if self.cpus else 0.0,
+        )
+
+    def fits(self, limits: ResourceLimits, memory: int) -> bool:
+        """Контейнер помещается на узел. На пустой узел помещается любой, иначе он не запустится никогда."""
+        if not self.running:
+            return True
+        memory, cpus = self.demand(limits, memory)
+        return (not self.memory or self.reserved_memory + memory <= self.memory) and (
+            not self.cpus or self.reserved_cpus + cpus <= self.cpus
+        )
+
+    async def connect(self):
+        """Создает клиент и дополняет емкость из docker info."""
+        if self.client is None:
+            self.client = aiodocker.Docker(url=self.url) if self.url else aiodocker.Docker()
+        try:
+            info = await self.client.system.info()
+        except Exception as e:
+            logger.warning(f"Docker node {self.name}: info unavailable ({e})")
+            return
+        self.memory = self.memory or int(info.get("MemTotal") or 0)
+        self.cpus = self.cpus or float(info.get("NCPU") or 0)
+        logger.info(
+            f"Docker node {self.name} connected: {self.memory // 1024 ** 2} MB, {self.cpus:g} CPUs, "
+            f"data at {self.data_path}"
+        )
+
+
+class NodePool:
+    """Набор узлов Docker: размещение контейнеров на наименее загруженном узле и учет их здоровья.
+
+    После NODE_FAILURE_THRESHOLD ошибок API подряд узел исключается из размещения;
+    раз в NODE_HEALTH_INTERVAL исключенные узлы проверяются и при ответе возвращаются.
+    """
+
+    def __init__(self, nodes: List[DockerNode]):
+        if not nodes:
+            raise ValueError("At least one Docker node is required")
+        self.nodes = nodes
+        self._condition = asyncio.Condition()
+        self._health_task: Optional[asyncio.Task] = None
+        for node in nodes:
+            self._update_metrics(node)
+
+    @classmethod
+    def from_config(cls, configs: List[Dict[str, Any]] = DOCKER_NODES) -> "NodePool":
+        return cls([DockerNode.from_config(config) for config in configs] or [DockerNode("local")])
+
+    @property
+    def primary(self) -> DockerNode:
+        """Первый узел: на нем работает пул тёплых контейнеров."""
+        return self.nodes[0]
+
+    def healthy(self) -> List[DockerNode]:
+        return [node for node in self.nodes if node.healthy]
+
+    def memory_capacity(self) -> int:
+        """Суммарная память узлов (0 - ни для одного узла она не известна)."""
+        return sum(node.memory for node in self.nodes)
+
+    async def start(self):
+        await asyncio.gather(*(node.connect() for node in self.nodes))
+        if not self._health_task:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def acquire(
+        self, limits: ResourceLimits, memory: int, nodes: Optional[List[DockerNode]] = None
+    ) -> DockerNode:
+        """Узел для контейнера с ограничениями limits и ожидаемым пиком памяти memory.
+
+        nodes - из каких узлов выбирать (по умолчанию - из всех). Ждет, если ни на одном
+        здоровом узле нет места.
+        """
+        async with self._condition:
+            while True:
+                candidates = [node for node in nodes or self.nodes if node.healthy]
+                if not candidates:
+                    raise NoHealthyNodes("No healthy Docker nodes")
+                fitting = [node for node in candidates if node.fits(limits, memory)]
+                if fitting:
+                    node = min(fitting, key=lambda n: (n.load(), n.running))
+                    break
+                await self._condition.wait()
+            memory, cpus = node.demand(limits, memory)
+            node.reserved_memory += memory
+            node.reserved_cpus += cpus
+            node.running += 1
+            self._update_metrics(node)
+            return node
+
+    async def release(self, node: DockerNode, limits: ResourceLimits, memory: int):
+        async with self._condition:
+            memory, cpus = node.demand(limits, memory)
+            node.reserved_memory -= memory
+            node.reserved_cpus -= cpus
+            node.running -= 1
+            self._update_metrics(node)
+            self._condition.notify_all()
+
+    def record_success(self, node: DockerNode):
+        node.failures = 0
+
+    async def record_failure(self, node: DockerNode, error: BaseException):
+        """Учитывает ошибку API узла; после NODE_FAILURE_THRESHOLD подряд узел исключается."""
+        if not is_node_error(error):
+            return
+        node.failures += 1
+        if node.healthy and node.failures >= NODE_FAILURE_THRESHOLD:
+            node.healthy = False
+            self._update_metrics(node)
+            logger.error(f"Docker node {node.name} marked unhealthy after {node.failures} errors: {error}")
+            async with self._condition:
+                # Ожидающие размещения должны узнать, что узлов стало меньше
+                self._condition.notify_all()
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(NODE_HEALTH_INTERVAL)
+            for node in self.nodes:
+                if node.healthy:
+                    continue
+                try:
+                    started = time.monotonic()
+                    await asyncio.wait_for(node.client.system.info(), timeout=NODE_HEALTH_INTERVAL)
+                except Exception as e:
+                    logger.warning(f"Docker node {node.name} is still unhealthy: {e}")
+                    continue
+                node.failures = 0
+                node.healthy = True
+                self._update_metrics(node)
+                logger.info(f"Docker node {node.name} is healthy again ({time.monotonic() - started:.2f}s)")
+                async with self._condition:
+                    self._condition.notify_all()
+
+    @staticmethod
+    def _update_metrics(node: DockerNode):
+        NODE_HEALTHY.set(int(node.healthy), node=node.name)
+        NODE_CONTAINERS.set(node.running, node=node.name)
+
+    async def close(self):
+        if self._health_task:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+        for node in self.nodes:
+            if node.client:
+                await node.client.close()
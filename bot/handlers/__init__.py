@@ -8,7 +8,10 @@ logger = logging.getLogger("handlers")  # Можно задать имя лог
 from .cancel_handler import cancel_router
 from .links_to_presentations_handler import links_to_presentations_router 
 from .log_handler import log_router
+from .priority_handler import priority_router
+from .queue_handler import queue_router
 from .start_handler import start_router
+from .stats_handler import stats_router
 
 
 # Создаем общий роутер
@@ -18,6 +21,9 @@ router = Router()
 router.include_router(start_router)
 router.include_router(cancel_router)
 router.include_router(log_router)
+router.include_router(priority_router)
+router.include_router(queue_router)
+router.include_router(stats_router)
 router.include_router(links_to_presentations_router )
 
 logger.info("Все обработчики успешно добавлены в роутер")
@@ -3,7 +3,8 @@ from aiogram.types import Message
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 import logging
-from bot.handlers.links_to_presentations_handler import LinkStates
+from bot.config.config import JOB_WATCH_INTERVAL
+from bot.handlers.links_to_presentations_handler import LinkStates, cancel_jobs, request_cancel
 
 logger = logging.getLogger(__name__)
 
@@ -20,10 +21,21 @@ async def cancel(message: Message, state: FSMContext):
     # Получаем текущее состояние FSM для пользователя
     current_state = await state.get_state()
 
-    # Проверяем, находится ли пользователь в состоянии обработки ссылок
+    # Если ссылки уже обрабатываются, останавливаем задачу вместе с её контейнерами
     if current_state == LinkStates.processing_links.state:
-        # Если да, то отмена недоступна. Сообщаем об этом пользователю.
-        await message.answer("⚠️ Невозможно отменить процесс, так как ссылки уже обрабатываются.")
+        cancelled = await cancel_jobs(message.chat.id)
+        # Задачу может выполнять другой процесс бота - его просим отменить через общий реестр
+        requested = await request_cancel(message.chat.id)
+        await state.clear()
+        logger.info(f"Пользователь отменил обработку ссылок (задач: {cancelled}, запрошено у других процессов: {requested}).")
+        if cancelled:
+            await message.answer("🛑 Обработка ссылок остановлена.")
+        elif requested:
+            await message.answer(
+                f"🛑 Задача выполняется другим процессом бота, она будет остановлена в течение ~{JOB_WATCH_INTERVAL} с."
+            )
+        else:
+            await message.answer("Действие отменено. Выполняющихся задач не найдено — ничего не остановлено.")
         return
 
     # Если у пользователя нет активного состояния, сообщаем ему об этом
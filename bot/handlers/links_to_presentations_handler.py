@@ -1,14 +1,27 @@
-import os
 import re
-import logging
 import asyncio
-from aiogram import Router
-from aiogram.types import Message, FSInputFile
-from aiogram.filters import Command
+import logging
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-from bot.utils.presentation_handler import process_links_with_orchestrator
+from bot.utils.presentation_handler import process_links_with_orchestrator, stage_images, unprocessed_links
+from bot.utils.workspace import JobWorkspace
+from bot.utils.progress import ProgressReporter
+from bot.utils.delivery import deliver_files
+from bot.utils.link_preprocessing import prepare_links, format_link_report
+from bot.utils.log_files import log_index
+from bot.utils.client_history import client_history, LinkDelta
+from bot.utils.user_priorities import user_priorities
+from bot.utils.stage_graph import STAGE_DONE
+from bot.utils.job_manifest import JobManifest, JOB_QUEUED, JOB_RUNNING, JOB_FAILED, JOB_DONE, JOB_CANCELLED, JOB_CANCEL_REQUESTED, UNFINISHED_STATES
+from bot.scheduler import scheduler, Job
+from bot.resource_limits import resource_history
+from bot.state_backend import state_backend, INSTANCE_ID
+from bot.logger import current_job_id
+from bot.config.config import JOB_RETENTION, INSTANCE_TTL, JOB_WATCH_INTERVAL, INCREMENTAL_RUNS_ENABLED
 
 logger = logging.getLogger(__name__)
 
@@ -18,11 +31,6 @@ URL_REGEX_CIAN = re.compile(
     re.IGNORECASE
 )
 
-# Путь к папке с презентациями
-PRESENTATION_DIR = os.path.abspath(
-    os.path.join(os.path.dirname(__file__), "..", "..", "data", "presentation", "output")
-)
-
 # Создаем роутер
 links_to_presentations_router = Router()
 
@@ -34,8 +42,26 @@ class LinkStates(StatesGroup):
     processing_links = State()
 
 
+# Аргумент команды, отключающий обработку только изменений: /links_to_presentations full
+FULL_RUN_ARGUMENTS = ("full", "полностью")
+
+
+def format_delta(client_name: str, delta: LinkDelta, limit: int = 10) -> str:
+    """Сообщение о том, что изменилось в списке ссылок клиента с прошлой задачи."""
+    text = (
+        f"♻️ Клиент {client_name} уже обрабатывался: новых ссылок {len(delta.added)}, "
+        f"убрано {len(delta.removed)}, без изменений {len(delta.unchanged)}."
+    )
+    if delta.removed:
+        removed = delta.removed[:limit] + ([f"… и ещё {len(delta.removed) - limit}"] if len(delta.removed) > limit else [])
+        text += "\n\nУбраны:\n" + "\n".join(removed)
+    if delta.added:
+        text += "\n\nОбрабатываю только новые ссылки. Полная обработка — /links_to_presentations full"
+    return text
+
+
 @links_to_presentations_router.message(Command("links_to_presentations"))
-async def links_to_presentations(message: Message, state: FSMContext):
+async def links_to_presentations(message: Message, state: FSMContext, command: CommandObject):
     """Обработчик команды /links_to_presentations."""
     current_state = await state.get_state()
 
@@ -47,6 +73,7 @@ async def links_to_presentations(message: Message, state: FSMContext):
 
     await message.answer("👤 Пожалуйста, укажите имя клиента.\n\nЧтобы отменить задачу — используйте: /cancel")
     await state.set_state(LinkStates.waiting_for_client_name)
+    await state.update_data(full_run=(command.args or "").strip().lower() in FULL_RUN_ARGUMENTS)
 
 
 @links_to_presentations_router.message(LinkStates.waiting_for_client_name)
@@ -86,12 +113,52 @@ async def handle_links(message: Message, state: FSMContext):
             await message.answer("🚨 Ошибка! Пожалуйста, начните с указания имени клиента.")
             return
 
-        await message.answer(f"🔄 Начинаю обработку ссылок для клиента: {client_name}\n\n⏳ Пожалуйста, подождите...")
-
         await state.set_state(LinkStates.processing_links)
 
-        # Запускаем обработку ссылок в отдельной задаче
-        asyncio.create_task(process_links_task(links, message, client_name, state))
+        # Повторы одного объявления и недоступные объявления не отправляются в контейнеры
+        prepared = await prepare_links(links)
+        report = format_link_report(prepared)
+        if report:
+            await message.answer(report)
+        if not prepared.links:
+            await message.answer("⚠️ Не осталось ссылок для обработки. Отправьте другие ссылки.")
+            await state.set_state(LinkStates.waiting_for_links)
+            return
+        links = client_links = prepared.links
+
+        # Повторная задача клиента: только ссылки, которых не было в его последней успешной задаче
+        delta = None
+        if INCREMENTAL_RUNS_ENABLED and not data.get("full_run"):
+            delta = client_history.diff(message.chat.id, client_name, links)
+        if delta is not None:
+            await message.answer(format_delta(client_name, delta))
+            if not delta.added:
+                # Обрабатывать нечего - запоминаем только удаленные ссылки
+                client_history.record(message.chat.id, client_name, client_links)
+                await message.answer("✅ Новых ссылок нет, все презентации уже были отправлены.")
+                await state.clear()
+                return
+            links = delta.added
+
+        # Манифест - постоянная запись о задаче, по нему задачу можно продолжить после ошибки или перезапуска
+        manifest = JobManifest.create(
+            JobWorkspace(),
+            chat_id=message.chat.id,
+            client_name=client_name,
+            links=links,
+            message=message.model_dump(mode="json", exclude_none=True),
+            client_links=client_links,
+        )
+        await set_job_status(manifest, JOB_QUEUED)
+        position = await submit_job(manifest, message, state)
+
+        if position <= scheduler.workers - scheduler.running_count:
+            await message.answer(f"🔄 Начинаю обработку ссылок для клиента: {client_name}\n\n⏳ Пожалуйста, подождите...")
+        else:
+            await message.answer(
+                f"🕒 Задача для клиента {client_name} поставлена в очередь (позиция {position}).\n\n"
+                "Узнать положение в очереди — /queue"
+            )
 
     except Exception as e:
         logger.error(f"Ошибка при обработке ссылок: {e}", exc_info=True)
@@ -99,35 +166,225 @@ async def handle_links(message: Message, state: FSMContext):
         await state.clear()
 
 
-async def process_links_task(links, message, client_name, state: FSMContext):
+async def set_job_status(manifest: JobManifest, status: str):
+    """Статус задачи в манифесте и в общем реестре задач (с этим процессом как владельцем)."""
+    if status != JOB_DONE:
+        manifest.set_status(status)
+    await state_backend.put_job(manifest.job_id, manifest.chat_id, status, INSTANCE_ID)
+
+
+async def submit_job(manifest: JobManifest, message: Message, state: FSMContext) -> int:
+    """Ставит задачу из манифеста в очередь планировщика. Возвращает позицию в очереди."""
+    return await scheduler.submit(
+        Job(
+            job_id=manifest.job_id,
+            chat_id=manifest.chat_id,
+            # Резерв памяти - по истории потребления этапов на входе такого размера
+            memory=resource_history.job_memory(stage_images(), len(manifest.data["links"])),
+            # По числу ссылок планировщик оценивает длительность, вес пользователя - из /priority
+            items=len(manifest.data["links"]),
+            priority=user_priorities.get(message.from_user.id if message.from_user else None),
+            run=lambda: process_links_task(
+                manifest.data["links"], message, manifest.data["client_name"], state, manifest.workspace, manifest
+            ),
+        )
+    )
+
+
+async def cancel_jobs(chat_id: int) -> int:
+    """Отменяет задачи чата в очереди и в работе (их контейнеры удаляются), удаляет их каталоги.
+
+    Отмененная задача не продолжается ни через /retry, ни после перезапуска. Возвращает число задач.
+    """
+    jobs = await scheduler.cancel_chat(chat_id)
+    for job in jobs:
+        await state_backend.put_job(job.job_id, chat_id, JOB_CANCELLED, INSTANCE_ID)
+        JobWorkspace(job.job_id).cleanup()
+    return len(jobs)
+
+
+async def request_cancel(chat_id: int) -> int:
+    """Просит другие процессы бота отменить задачи чата (их выполняет не этот процесс).
+
+    Владелец увидит запрос в watch_unfinished_jobs. Возвращает число задач.
+    """
+    return await state_backend.request_cancel(chat_id, INSTANCE_ID)
+
+
+async def apply_cancel_requests():
+    """Отменяет свои задачи, отмену которых запросил другой процесс, и задачи упавших владельцев."""
+    live = await state_backend.live_instances(INSTANCE_TTL)
+    for job in await state_backend.list_jobs(JOB_CANCEL_REQUESTED):
+        if job["owner"] == INSTANCE_ID:
+            cancelled = await cancel_jobs(job["chat_id"])
+            logger.info(f"Задачи чата {job['chat_id']} отменены по запросу другого процесса: {cancelled}")
+        elif job["owner"] in live:
+            continue
+        # Задача уже не выполняется (владелец упал или она не попала в очередь) - просто закрываем её
+        if not scheduler.has_job(job["job_id"]):
+            await state_backend.put_job(job["job_id"], job["chat_id"], JOB_CANCELLED, INSTANCE_ID)
+            JobWorkspace(job["job_id"]).cleanup()
+
+
+@links_to_presentations_router.message(Command("retry"))
+async def retry(message: Message, state: FSMContext):
+    """Продолжает последнюю упавшую задачу с первого незавершенного этапа."""
+    if await state.get_state():
+        await message.answer("❌ У вас уже есть активная задача! Дождитесь её завершения или используйте /cancel для отмены.")
+        return
+
+    manifest = JobManifest.latest_failed(message.chat.id)
+    if manifest is None:
+        await message.answer("Нет задач, которые можно продолжить.")
+        return
+
+    await state.set_state(LinkStates.processing_links)
+    await set_job_status(manifest, JOB_QUEUED)
+    position = await submit_job(manifest, message, state)
+    await message.answer(
+        f"♻️ Задача для клиента {manifest.data['client_name']} будет продолжена (позиция в очереди: {max(position, 1)})."
+    )
+
+
+async def resume_job(manifest: JobManifest, bot: Bot, dp: Dispatcher):
+    """Забирает незавершенную задачу себе и ставит её в очередь, если у неё нет живого владельца."""
+    try:
+        if not await state_backend.claim_job(manifest.job_id, manifest.chat_id, JOB_QUEUED, INSTANCE_ID, INSTANCE_TTL):
+            logger.info(f"Задача {manifest.job_id} выполняется другим процессом, пропускаю")
+            return
+        message = Message.model_validate(manifest.data["message"], context={"bot": bot})
+        state = dp.fsm.get_context(bot=bot, chat_id=message.chat.id, user_id=message.from_user.id)
+        await state.update_data(client_name=manifest.data["client_name"])
+        await state.set_state(LinkStates.processing_links)
+        await submit_job(manifest, message, state)
+        await message.answer(
+            f"♻️ Бот был перезапущен. Задача для клиента {manifest.data['client_name']} продолжится автоматически."
+        )
+        logger.info(f"Задача {manifest.job_id} восстановлена после перезапуска")
+    except Exception as e:
+        logger.error(f"Не удалось восстановить задачу {manifest.job_id}: {e}", exc_info=True)
+
+
+async def resume_unfinished_jobs(bot: Bot, dp: Dispatcher):
+    """Ставит в очередь задачи, прерванные перезапуском бота, и удаляет давно упавшие.
+
+    Задачи других живых процессов бота не трогаются: задачу забирает только тот процесс,
+    которому удалось записать себя владельцем в реестре. Задачи, владелец которых
+    еще считается живым, позже подбирает watch_unfinished_jobs.
+    """
+    JobManifest.cleanup_expired(JOB_RETENTION)
+    for manifest in reversed(JobManifest.all()):
+        if manifest.status not in UNFINISHED_STATES or not manifest.data.get("message"):
+            continue
+        if not scheduler.has_job(manifest.job_id):
+            await resume_job(manifest, bot, dp)
+
+
+async def take_over_orphaned_jobs(bot: Bot, dp: Dispatcher):
+    """Забирает незавершенные задачи процессов, переставших отмечаться живыми.
+
+    В том числе задачи прошлого запуска этого же хоста: после перезапуска у процесса
+    новое имя, и пока старое не устарело (INSTANCE_TTL), забрать их при запуске нельзя.
+    """
+    live = await state_backend.live_instances(INSTANCE_TTL)
+    orphaned = [
+        job
+        for job in await state_backend.list_jobs()
+        if job["status"] in UNFINISHED_STATES and job["owner"] not in (None, INSTANCE_ID) and job["owner"] not in live
+    ]
+    for job in orphaned:
+        manifest = JobManifest.load(JobWorkspace(job["job_id"]))
+        if manifest is None or manifest.status not in UNFINISHED_STATES or not manifest.data.get("message"):
+            continue
+        if not scheduler.has_job(manifest.job_id):
+            await resume_job(manifest, bot, dp)
+
+
+async def watch_unfinished_jobs(bot: Bot, dp: Dispatcher):
+    """Раз в JOB_WATCH_INTERVAL выполняет запросы отмены от других процессов
+    и подбирает задачи упавших или перезапущенных процессов."""
+    while True:
+        await asyncio.sleep(JOB_WATCH_INTERVAL)
+        try:
+            await apply_cancel_requests()
+            await take_over_orphaned_jobs(bot, dp)
+        except Exception as e:
+            logger.error(f"Не удалось проверить брошенные задачи: {e}", exc_info=True)
+
+
+async def process_links_task(
+    links,
+    message,
+    client_name,
+    state: FSMContext,
+    workspace: JobWorkspace,
+    manifest: JobManifest = None,
+):
     """Фоновая задача для обработки ссылок и отправки файлов."""
+    finished = False
+    cancelled = False
+    # Записи логов этой задачи (она выполняется в своей asyncio задаче) попадают и в её файл лога
+    current_job_id.set(workspace.job_id)
+    log_index.register(workspace.job_id, message.chat.id)
+    # Статус задачи показывается в одном сообщении, которое редактируется по ходу обработки
+    progress = ProgressReporter(message).start()
     try:
-        output_status = await process_links_with_orchestrator(links, message, client_name)
+        if manifest:
+            await set_job_status(manifest, JOB_RUNNING)
+
+        output_files = await process_links_with_orchestrator(
+            links, message, client_name, workspace=workspace, manifest=manifest, progress=progress
+        )
+        await progress.close()
 
-        if output_status:
+        if output_files is not None:
             await message.answer("✅ Обработка завершена. Отправляю презентации...")
 
-            files_sent = 0
-            for file_name in os.listdir(PRESENTATION_DIR):
-                file_path = os.path.join(PRESENTATION_DIR, file_name)
-                if os.path.isfile(file_path):
-                    try:
-                        document = FSInputFile(file_path)
-                        await message.answer_document(document)
-                        files_sent += 1
-                        logger.info(f"Файл отправлен: {file_name}")
-                    except Exception as e:
-                        logger.error(f"Ошибка при отправке файла {file_name}: {e}", exc_info=True)
-
-            if files_sent == 0:
+            files_sent = await deliver_files(message, output_files, archive_dir=workspace.path)
+
+            if not output_files:
                 await message.answer("⚠️ Не найдено файлов презентаций. Возможно, произошла ошибка.")
+            elif files_sent < len(output_files):
+                await message.answer(
+                    f"⚠️ Отправлено {files_sent} из {len(output_files)} файлов. Подробности — в /logs."
+                )
+            # По таблице задачи и упавшим шардам видно, по каким объявлениям результатов нет
+            missing = unprocessed_links(links, workspace)
+            if missing:
+                shown = missing[:10] + ([f"… и ещё {len(missing) - 10}"] if len(missing) > 10 else [])
+                await message.answer(
+                    f"⚠️ Нет данных по {len(missing)} из {len(links)} объявлений:\n" + "\n".join(shown)
+                )
+            finished = True
+            # Следующая задача клиента в этом чате обработает только изменения - если эта прошла целиком
+            # (вместе с таблицей); ссылки без результатов не запоминаются и будут обработаны снова
+            if manifest and manifest.all_stages_done(STAGE_DONE) and files_sent == len(output_files):
+                client_links = manifest.data.get("client_links") or links
+                client_history.record(
+                    message.chat.id, client_name, [link for link in client_links if link not in missing], workspace.job_id
+                )
 
         else:
-            await message.answer("🚨 Ошибка при обработке ссылок. Презентации не отправлены.")
+            await message.answer(
+                "🚨 Ошибка при обработке ссылок. Презентации не отправлены.\n\n"
+                "Чтобы продолжить с места ошибки — используйте: /retry"
+            )
+
+    except asyncio.CancelledError:
+        cancelled = True
+        raise
 
     except Exception as e:
         logger.error(f"Ошибка в процессе обработки ссылок: {e}", exc_info=True)
         await message.answer("🚨 Критическая ошибка во время обработки!")
 
     finally:
+        await progress.close()
+        # Каталог упавшей задачи сохраняется для /retry; при отмене (остановке бота) статус остается running
+        if finished:
+            workspace.cleanup()
+            if manifest:
+                await set_job_status(manifest, JOB_DONE)
+        elif manifest and not cancelled:
+            await set_job_status(manifest, JOB_FAILED)
         await state.clear()
\ No newline at end of file
@@ -1,31 +1,80 @@
 from aiogram import Router
-from aiogram.types import Message, FSInputFile
-from aiogram.filters import Command
+from aiogram.types import Message, BufferedInputFile
+from aiogram.filters import Command, CommandObject
 import os
+import gzip
+import asyncio
 import logging
 
+from bot.config.config import ADMIN_IDS, LOG_TAIL_LINES, LOG_MAX_LINES, LOG_COMPRESS_THRESHOLD
+from bot.logger import BOT_LOG_PATH
+from bot.utils.log_files import log_index, tail_lines
+
 logger = logging.getLogger(__name__)
- 
+
 # Создаем роутер
 log_router = Router()
 
+USAGE = (
+    "Использование: /logs [job_id|bot] [строк]\n"
+    "Без job_id — лог вашей последней задачи."
+)
+
+
+def can_read_bot_log(user_id: int) -> bool:
+    """Общий лог бота содержит чужие задачи: если администраторы заданы, он доступен только им."""
+    return not ADMIN_IDS or user_id in ADMIN_IDS
+
+
+def resolve_log(message: Message, target: str):
+    """(путь к логу, имя файла для отправки) или (None, текст ошибки)."""
+    if target == "bot":
+        if not can_read_bot_log(message.from_user.id):
+            return None, "⛔ Общий лог бота доступен только администраторам."
+        return BOT_LOG_PATH, "bot"
+
+    job_id = target or log_index.latest(message.chat.id)
+    if not job_id:
+        return None, "Логи недоступны: у вас ещё не было задач."
+    entry = log_index.get(job_id)
+    if not entry or (entry["chat_id"] != message.chat.id and message.from_user.id not in ADMIN_IDS):
+        return None, f"Лог задачи {job_id} не найден."
+    return entry["path"], job_id
+
 
 @log_router.message(Command("logs"))
-async def send_logs(message: Message):
-    """Отправляем логи последнего запроса."""
-    log_path = os.path.join(os.path.dirname(__file__), "..","..","logs")
-    log_files = sorted(
-        [os.path.join(log_path, f) for f in os.listdir(log_path) if f.endswith(".log")],
-        key=lambda x: os.path.getmtime(os.path.join("logs", x)),
-        reverse=True,
-    )
-
-    if log_files:
-        last_log_file = os.path.join("logs", log_files[0])
-        logger.info(f"Отправляем лог {last_log_file}")
-        await message.answer_document(
-            FSInputFile(last_log_file)
-        )  # Отправляем лог
-    else:
-        logger.info("Логи недоступны.")
-        await message.answer("Логи недоступны.")
\ No newline at end of file
+async def send_logs(message: Message, command: CommandObject):
+    """Отправляем последние строки лога задачи (или общего лога бота)."""
+    target, lines = "", LOG_TAIL_LINES
+    for argument in (command.args or "").split():
+        if argument.isdigit():
+            lines = int(argument)
+        else:
+            target = argument
+    lines = max(1, min(lines, LOG_MAX_LINES))
+
+    path, name = resolve_log(message, target)
+    if path is None:
+        await message.answer(f"{name}\n\n{USAGE}")
+        return
+
+    try:
+        # Читается только конец файла, в отдельном потоке - лог может быть большим
+        data = await asyncio.to_thread(tail_lines, path, lines)
+    except FileNotFoundError:
+        await message.answer("Логи недоступны.")
+        return
+    if not data:
+        await message.answer("Лог пуст.")
+        return
+
+    sent_lines = len(data.splitlines())
+    filename = f"{name}.log"
+    if len(data) > LOG_COMPRESS_THRESHOLD:
+        data = await asyncio.to_thread(gzip.compress, data)
+        filename += ".gz"
+
+    logger.info(f"Отправляем лог {os.path.basename(path)} ({sent_lines} строк)")
+    await message.answer_document(
+        BufferedInputFile(data, filename=filename), caption=f"Последние {sent_lines} строк лога {name}"
+    )  # Отправляем лог
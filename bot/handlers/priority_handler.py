@@ -0,0 +1,42 @@
+from aiogram import Router
+from aiogram.types import Message
+from aiogram.filters import Command, CommandObject
+import logging
+
+from bot.config.config import ADMIN_IDS
+from bot.utils.user_priorities import user_priorities, DEFAULT_PRIORITY
+
+logger = logging.getLogger(__name__)
+
+# Создаем роутер
+priority_router = Router()
+
+USAGE = (
+    "Использование: /priority [user_id вес]\n"
+    f"Вес больше {DEFAULT_PRIORITY:g} — задачи пользователя идут в очереди раньше, меньше — позже."
+)
+
+
+@priority_router.message(Command("priority"))
+async def set_priority(message: Message, command: CommandObject):
+    """Просмотр и изменение весов приоритета пользователей (только для администраторов)."""
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("⛔ Команда доступна только администраторам.")
+        return
+
+    if not command.args:
+        weights = sorted(user_priorities.all().items())
+        lines = ["⚖️ Приоритеты пользователей:", *(f"  {user_id}: {weight:g}" for user_id, weight in weights)]
+        if not weights:
+            lines = ["Приоритеты не заданы, у всех вес по умолчанию."]
+        await message.answer("\n".join(lines) + f"\n\n{USAGE}")
+        return
+
+    try:
+        user_id, weight = command.args.split()
+        user_priorities.set(int(user_id), float(weight))
+    except ValueError:
+        await message.answer(USAGE)
+        return
+    logger.info(f"Admin {message.from_user.id} set priority of user {user_id} to {weight}")
+    await message.answer(f"✅ Приоритет пользователя {user_id}: {float(weight):g}")
@@ -0,0 +1,40 @@
+from aiogram import Router
+from aiogram.types import Message
+from aiogram.filters import Command
+import logging
+
+from bot.scheduler import scheduler
+
+logger = logging.getLogger(__name__)
+
+# Создаем роутер
+queue_router = Router()
+
+
+def format_eta(seconds: float) -> str:
+    """Человекочитаемая оценка времени ожидания."""
+    minutes = int(seconds // 60)
+    if minutes < 1:
+        return "меньше минуты"
+    return f"~{minutes} мин."
+
+
+@queue_router.message(Command("queue"))
+async def show_queue(message: Message):
+    """Показывает положение задач пользователя в очереди."""
+    running, pending = scheduler.status(message.chat.id)
+
+    if not running and not pending:
+        await message.answer(
+            f"У вас нет задач в очереди.\n\n"
+            f"Всего в работе: {scheduler.running_count}, в очереди: {scheduler.queued_count}."
+        )
+        return
+
+    lines = []
+    for job in running:
+        lines.append(f"⚙️ Задача {job.job_id} выполняется")
+    for job, position, eta in pending:
+        lines.append(f"🕒 Задача {job.job_id}: позиция {position}, ожидание {format_eta(eta)}")
+
+    await message.answer("\n".join(lines))
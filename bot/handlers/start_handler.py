@@ -14,5 +14,7 @@ async def start(message: Message):
         "Привет! Вот список доступных команд:\n"
         "/links_to_presentations - Отправь ссылки, чтобы создать презентации.\n"
         "/logs - Получить файл логов последнего запроса.\n"
+        "/queue - Показать положение ваших задач в очереди.\n"
+        "/retry - Продолжить упавшую задачу с места ошибки.\n"
         "/cancel - Отменить текущее действие. (если, например указаны неверные данные во время создания презентации, можно его отменить)"
     )
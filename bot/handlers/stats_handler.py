@@ -0,0 +1,99 @@
+from aiogram import Router
+from aiogram.types import Message
+from aiogram.filters import Command
+import logging
+
+from bot.config.config import ADMIN_IDS
+from bot.metrics import (
+    STAGE_DURATION,
+    CONTAINER_OPERATION,
+    QUEUE_WAIT,
+    JOB_DURATION,
+    DELIVERY_DURATION,
+    CONTAINER_RETRIES,
+    CONTAINER_FAILURES,
+    ACTIVE_CONTAINERS,
+    JOBS_RUNNING,
+    JOBS_QUEUED,
+)
+from bot.orchestrator import orchestrator
+
+logger = logging.getLogger(__name__)
+
+# Создаем роутер
+stats_router = Router()
+
+
+def format_histogram(title: str, histogram, key=()) -> str:
+    """Строка с числом наблюдений и медианой/p95 гистограммы."""
+    count = histogram.count(key)
+    if not count:
+        return f"{title}: нет данных"
+    return (
+        f"{title}: {count} шт., p50 {histogram.quantile(0.5, key):.1f}с, "
+        f"p95 {histogram.quantile(0.95, key):.1f}с"
+    )
+
+
+def images_status() -> str:
+    """Состояние прогрева образов этапов (см. Orchestrator.ready)."""
+    if orchestrator.ready:
+        return "готовы"
+    if not orchestrator.warmed_up:
+        return "прогрев не завершен"
+    return "есть недоступные"
+
+
+@stats_router.message(Command("stats"))
+async def show_stats(message: Message):
+    """Сводка метрик бота (только для администраторов)."""
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("⛔ Команда доступна только администраторам.")
+        return
+
+    lines = [
+        "📊 Статистика",
+        f"Задач в работе: {JOBS_RUNNING.value():.0f}, в очереди: {JOBS_QUEUED.value():.0f}, "
+        f"контейнеров: {ACTIVE_CONTAINERS.value():.0f}",
+        f"Образы этапов: {images_status()}",
+        format_histogram("Ожидание в очереди", QUEUE_WAIT),
+        format_histogram("Задачи", JOB_DURATION),
+    ]
+
+    lines.append("\nЭтапы:")
+    for stage, image, status in STAGE_DURATION.label_sets():
+        lines.append(format_histogram(f"  {stage} {image} ({status})", STAGE_DURATION, (stage, image, status)))
+
+    lines.append("\nDocker:")
+    for image, operation in CONTAINER_OPERATION.label_sets():
+        lines.append(format_histogram(f"  {image} {operation}", CONTAINER_OPERATION, (image, operation)))
+
+    for mode in DELIVERY_DURATION.label_sets():
+        lines.append(format_histogram(f"Отправка ({mode[0]})", DELIVERY_DURATION, mode))
+
+    problems = [
+        f"  {image}: {reason} ×{count:.0f}" for (image, reason), count in sorted(CONTAINER_FAILURES.values.items())
+    ]
+    retries = [
+        f"  {image}: {reason} ×{count:.0f}" for (image, reason), count in sorted(CONTAINER_RETRIES.values.items())
+    ]
+    if problems:
+        lines.append("\nОшибки:\n" + "\n".join(problems))
+    if retries:
+        lines.append("\nПовторы:\n" + "\n".join(retries))
+
+    open_circuits = [f"{image} ({state})" for image, state in orchestrator.breakers.states().items() if state != "closed"]
+    if open_circuits:
+        lines.append(f"\n⚠️ Отключены образы: {', '.join(open_circuits)}")
+    if len(orchestrator.nodes.nodes) > 1 or not orchestrator.nodes.primary.healthy:
+        lines.append("\nУзлы Docker:")
+        for node in orchestrator.nodes.nodes:
+            lines.append(
+                f"  {'✅' if node.healthy else '⛔'} {node.name}: контейнеров {node.running}, "
+                f"загрузка {node.load():.0%}"
+            )
+    if orchestrator.image_errors:
+        lines.append(f"⚠️ Недоступны образы: {', '.join(orchestrator.image_errors)}")
+
+    # Ограничение Telegram на длину сообщения
+    await message.answer("\n".join(lines)[:4000])
@@ -1,20 +1,89 @@
+import os
+import gzip
+import time
+import shutil
 import logging
-from datetime import datetime
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+from typing import Optional
+
+from bot.config.config import LOG_MAX_BYTES, LOG_ROTATE_INTERVAL, LOG_BACKUP_COUNT
+
+# Каталог логов: общий лог бота и логи задач (logs/jobs/<job_id>.log)
+LOGS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "logs"))
+BOT_LOG_PATH = os.path.join(LOGS_DIR, "bot.log")
+JOB_LOGS_DIR = os.path.join(LOGS_DIR, "jobs")
+
+# Задача, к которой относится текущий код (наследуется дочерними asyncio задачами)
+current_job_id: ContextVar[Optional[str]] = ContextVar("current_job_id", default=None)
+
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(name)s %(message)s"
+
+
+def job_log_path(job_id: str) -> str:
+    """Файл лога задачи: строки бота по этой задаче и вывод её контейнеров."""
+    return os.path.join(JOB_LOGS_DIR, f"{job_id}.log")
+
+
+def _gzip_rotator(source: str, dest: str):
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+class SizeAndTimeRotatingFileHandler(RotatingFileHandler):
+    """Ротирует лог при превышении размера или по истечении интервала; старые файлы сжимаются (bot.log.1.gz)."""
+
+    def __init__(self, filename: str, max_bytes: int, interval: int, backup_count: int):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        self.interval = interval
+        self.namer = lambda name: f"{name}.gz"
+        self.rotator = _gzip_rotator
+        self.opened_at = time.time()
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.interval and time.time() - self.opened_at >= self.interval:
+            return os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self):
+        super().doRollover()
+        self.opened_at = time.time()
+
+
+class JobLogHandler(logging.Handler):
+    """Дублирует записи, сделанные в контексте задачи, в файл лога этой задачи."""
+
+    def emit(self, record: logging.LogRecord):
+        job_id = current_job_id.get()
+        if not job_id:
+            return
+        try:
+            path = job_log_path(job_id)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Записей бота по задаче немного - файл открывается на каждую, чтобы не держать дескрипторы
+            with open(path, "a", encoding="utf-8") as file:
+                file.write(self.format(record) + "\n")
+        except Exception:
+            self.handleError(record)
+
 
 def setup_logger() -> logging.Logger:
-    # Настройка имени файла логов
-    log_filename = f"logs/bot_{datetime.now().strftime('%Y%m%d_%H-%M-%S')}.log"
-    
+    os.makedirs(LOGS_DIR, exist_ok=True)
+
     # Настройка корневого логгера
     root_logger = logging.getLogger()
     root_logger.setLevel(logging.INFO)
 
-    formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(name)s %(message)s")
+    formatter = logging.Formatter(LOG_FORMAT)
 
-    # Создание файлового обработчика
-    file_handler = logging.FileHandler(log_filename, encoding="utf-8")
+    # Общий лог бота с ротацией по размеру и времени
+    file_handler = SizeAndTimeRotatingFileHandler(BOT_LOG_PATH, LOG_MAX_BYTES, LOG_ROTATE_INTERVAL, LOG_BACKUP_COUNT)
     file_handler.setFormatter(formatter)
 
+    job_handler = JobLogHandler()
+    job_handler.setFormatter(formatter)
+
     # Создание обработчика для вывода в консоль
     stream_handler = logging.StreamHandler()
     stream_handler.setFormatter(formatter)
@@ -22,6 +91,7 @@ def setup_logger() -> logging.Logger:
     # Проверка, чтобы избежать дублирования обработчиков
     if not root_logger.hasHandlers():
         root_logger.addHandler(file_handler)
+        root_logger.addHandler(job_handler)
         root_logger.addHandler(stream_handler)
 
-    return logging.getLogger(__name__)
\ No newline at end of file
+    return logging.getLogger(__name__)
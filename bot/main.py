@@ -3,11 +3,16 @@ import logging
 from datetime import datetime
 from aiogram import Bot, Dispatcher
 from aiogram.types import BotCommand
-from aiogram.fsm.storage.memory import MemoryStorage
 
-from bot.config.config import BOT_TOKEN
+from bot.config.config import BOT_TOKEN, BOT_MODE, SHUTDOWN_DRAIN_TIMEOUT
 from bot.handlers import router
+from bot.handlers.links_to_presentations_handler import resume_unfinished_jobs, watch_unfinished_jobs
 from bot.orchestrator import orchestrator
+from bot.utils.presentation_handler import stage_images
+from bot.scheduler import scheduler
+from bot.state_backend import state_backend, BackendStorage
+from bot.webhook import run_webhook
+from bot.metrics import start_metrics_server
 from bot.logger import setup_logger 
 
 
@@ -18,7 +23,9 @@ logger = setup_logger()
 BOT_COMMANDS = [
     BotCommand(command="/start", description="Начать работу с ботом"),
     BotCommand(command="/links_to_presentations", description="Создать презентации из ссылок"),
-    BotCommand(command="/logs", description="Получить логи"),
+    BotCommand(command="/logs", description="Лог последней задачи"),
+    BotCommand(command="/queue", description="Положение задач в очереди"),
+    BotCommand(command="/retry", description="Продолжить упавшую задачу"),
     BotCommand(command="/cancel", description="Отменить текущее действие"),
 ]
 
@@ -26,7 +33,7 @@ async def init_bot() -> tuple[Bot, Dispatcher]:
     logger.info("Инициализация бота...")
     try:
         bot = Bot(token=BOT_TOKEN)
-        dp = Dispatcher(storage=MemoryStorage())
+        dp = Dispatcher(storage=BackendStorage(state_backend))
         logger.info("Бот и диспетчер успешно инициализированы.")
         return bot, dp
     except Exception as e:
@@ -37,18 +44,37 @@ async def main():
     logger.info("Запуск бота...")
     
     # Инициализируем оркестратор
-    await orchestrator.initialize()
+    await orchestrator.initialize(images=stage_images())
+    await scheduler.start(memory_capacity=orchestrator.nodes.memory_capacity())
+    metrics_runner = await start_metrics_server()
     
     bot, dp = await init_bot()
     dp.include_router(router)
+    resume_task = None
 
     try:
         await bot.set_my_commands(BOT_COMMANDS)
-        await dp.start_polling(bot)
+        await resume_unfinished_jobs(bot, dp)
+        # Задачи процессов, упавших или перезапущенных недавно, подбираются, когда их владелец устареет
+        resume_task = asyncio.create_task(watch_unfinished_jobs(bot, dp))
+        if BOT_MODE == "webhook":
+            await run_webhook(bot, dp)
+        else:
+            # Вебхук и getUpdates взаимоисключающие - при переходе на polling вебхук снимаем
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
     except Exception as e:
         logger.critical(f"Критическая ошибка в процессе работы бота: {e}")
     finally:
+        if resume_task:
+            resume_task.cancel()
+        # Даем выполняющимся задачам завершиться, ожидающие продолжатся после перезапуска
+        await scheduler.drain(SHUTDOWN_DRAIN_TIMEOUT)
+        await scheduler.stop()
+        if metrics_runner:
+            await metrics_runner.cleanup()
         await orchestrator.shutdown()
+        await state_backend.close()
         await bot.session.close()
         logger.info("Сессия бота закрыта.")
 
@@ -0,0 +1,216 @@
+import time
+import bisect
+import logging
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+from bot.config.config import METRICS_ENABLED, METRICS_HOST, METRICS_PORT
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм длительностей (сек): от быстрых вызовов Docker API до этапов на десятки минут
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    """Метрика с набором меток; значения хранятся по кортежу значений меток."""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+
+    def _key(self, labels: Dict[str, object]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        """(суффикс имени, метки, значение) для вывода в формате Prometheus."""
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{self.name}{suffix}{labels} {value:g}" for suffix, labels, value in self.samples())
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in sorted(self.values.items()):
+            yield "_total", _format_labels(self.label_names, key), value
+
+
+class Gauge(Metric):
+    """Текущее значение; может вычисляться функцией в момент чтения."""
+
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values: Dict[LabelValues, float] = {}
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels):
+        self.values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], float]):
+        self.function = function
+
+    def value(self, **labels) -> float:
+        if self.function:
+            return self.function()
+        return self.values.get(self._key(labels), 0)
+
+    def samples(self):
+        if self.function:
+            yield "", "", self.function()
+            return
+        for key, value in sorted(self.values.items()):
+            yield "", _format_labels(self.label_names, key), value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # Для каждого набора меток: счетчики по корзинам (последняя - +Inf), сумма
+        self.counts: Dict[LabelValues, List[int]] = {}
+        self.sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        counts = self.counts.setdefault(key, [0] * (len(self.buckets) + 1))
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sums[key] = self.sums.get(key, 0) + value
+
+    @contextmanager
+    def time(self, **labels):
+        """Измеряет длительность блока кода (в том числе завершившегося исключением)."""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started, **labels)
+
+    def label_sets(self) -> List[LabelValues]:
+        return sorted(self.counts)
+
+    def count(self, key: LabelValues) -> int:
+        return sum(self.counts.get(key, ()))
+
+    def quantile(self, q: float, key: LabelValues) -> float:
+        """Оценка квантиля по корзинам (линейная интерполяция внутри корзины, как histogram_quantile)."""
+        counts = self.counts.get(key)
+        if not counts:
+            return 0.0
+        rank = q * sum(counts)
+        cumulative = 0
+        for index, count in enumerate(counts):
+            if cumulative + count >= rank and count:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def samples(self):
+        for key in self.label_sets():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), self.counts[key]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                yield "_bucket", _format_labels(self.label_names, key, f'le="{le}"'), cumulative
+            yield "_sum", _format_labels(self.label_names, key), self.sums[key]
+            yield "_count", _format_labels(self.label_names, key), cumulative
+
+
+class MetricsRegistry:
+    """Все метрики процесса и их вывод в текстовом формате Prometheus."""
+
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Создание глобального экземпляра
+metrics = MetricsRegistry()
+
+STAGE_DURATION = metrics.register(Histogram(
+    "bot_stage_duration_seconds", "Stage processing time", ("stage", "image", "status")
+))
+CONTAINER_OPERATION = metrics.register(Histogram(
+    "bot_container_operation_seconds", "Docker operation latency (create, start, wait, teardown)", ("image", "operation")
+))
+QUEUE_WAIT = metrics.register(Histogram("bot_job_queue_wait_seconds", "Time a job waited in the scheduler queue"))
+JOB_DURATION = metrics.register(Histogram("bot_job_duration_seconds", "Job processing time"))
+DELIVERY_DURATION = metrics.register(Histogram(
+    "bot_delivery_seconds", "Time to deliver job files to Telegram", ("mode",)
+))
+CONTAINER_RETRIES = metrics.register(Counter(
+    "bot_container_retries", "Container run retries", ("image", "reason")
+))
+CONTAINER_TIMEOUTS = metrics.register(Counter("bot_container_timeouts", "Container runs that timed out", ("image",)))
+CONTAINER_FAILURES = metrics.register(Counter(
+    "bot_container_failures", "Container runs that failed after all retries", ("image", "reason")
+))
+ACTIVE_CONTAINERS = metrics.register(Gauge("bot_active_containers", "One-shot containers currently running"))
+JOBS_RUNNING = metrics.register(Gauge("bot_jobs_running", "Jobs currently running"))
+JOBS_QUEUED = metrics.register(Gauge("bot_jobs_queued", "Jobs waiting in the queue"))
+IMAGES_READY = metrics.register(Gauge(
+    "bot_images_ready", "Stage image warm-up finished and all stage images are available (1) or not (0)"
+))
+NODE_HEALTHY = metrics.register(Gauge(
+    "bot_docker_node_healthy", "Docker node accepts containers (1) or is excluded after API errors (0)", ("node",)
+))
+NODE_CONTAINERS = metrics.register(Gauge("bot_docker_node_containers", "Stage containers placed on a Docker node", ("node",)))
+
+
+async def metrics_view(request: web.Request) -> web.Response:
+    return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server() -> Optional[web.AppRunner]:
+    """Запускает HTTP сервер с /metrics (по умолчанию только на localhost)."""
+    if not METRICS_ENABLED:
+        return None
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_view)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host=METRICS_HOST, port=METRICS_PORT).start()
+    logger.info(f"Metrics available at http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    return runner
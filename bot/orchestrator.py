@@ -1,44 +1,256 @@
 import aiodocker
 import asyncio
+import json
 import os
+import time
 import logging
 from contextlib import asynccontextmanager
+from typing import Optional, Tuple
 from bot.config.config import *
+from bot.container_pool import ContainerPool, PoolUnavailable
+from bot.docker_nodes import DockerNode, NodePool, NoHealthyNodes
+from bot.port_allocator import is_port_conflict
+from bot.resource_limits import ResourceLimits, StatsMonitor, resource_history
+from bot.metrics import (
+    ACTIVE_CONTAINERS,
+    IMAGES_READY,
+    CONTAINER_OPERATION,
+    CONTAINER_RETRIES,
+    CONTAINER_TIMEOUTS,
+    CONTAINER_FAILURES,
+)
+from bot.utils.log_stream import LogStream, LineSplitter
+from bot.utils.workspace import DATA_DIR
+from bot.state_backend import state_backend, INSTANCE_ID, OWNER_LABEL
+from bot.retry_policy import (
+    RetryPolicy,
+    CircuitBreakers,
+    CircuitOpen,
+    retry_policy_for,
+    classify_exit,
+    FAILURE_OOM,
+    FAILURE_TIMEOUT,
+    FAILURE_DOCKER,
+    FAILURE_ERROR,
+)
 # Настройка логирования
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
 # Путь к данным
-data_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data"))
+data_path = DATA_DIR
+
+
+class ImageUnavailable(Exception):
+    """Образ этапа не найден и не может быть загружен (или непригоден для запуска)."""
+
+
+def split_image_name(image_name: str):
+    """Разделяет имя образа на репозиторий и тег (registry:5000/name:tag -> registry:5000/name, tag)."""
+    repository, separator, tag = image_name.rpartition(":")
+    if not separator or "/" in tag:
+        return image_name, "latest"
+    return repository, tag
+
 
 class Orchestrator:
     def __init__(self):
-        self.docker = None
-        self.active_containers = set()
+        # Узлы Docker (DOCKER_NODES; по умолчанию - один локальный демон)
+        self.nodes = NodePool.from_config()
+        # id -> контейнер: контейнер удаляется через клиент своего узла
+        self.active_containers = {}
+        self.image_versions = {}
+        self.image_errors = {}
+        self.warmed_up = False
+        self.breakers = CircuitBreakers()
+        ACTIVE_CONTAINERS.set_function(lambda: len(self.active_containers))
+        IMAGES_READY.set_function(lambda: int(self.ready))
+        self.pool = ContainerPool(data_path) if CONTAINER_POOL_ENABLED else None
+        self._heartbeat_task = None
 
-    async def initialize(self):
-        """Асинхронная инициализация Docker клиента"""
+    @property
+    def docker(self):
+        """Клиент основного узла (на нем работает пул тёплых контейнеров)."""
+        return self.nodes.primary.client
+
+    async def initialize(self, images=()):
+        """Асинхронная инициализация Docker клиентов узлов и прогрев образов этапов"""
         try:
-            self.docker = aiodocker.Docker()
-            logger.info("Docker client initialized")
+            await self.nodes.start()
+            logger.info(f"Docker clients initialized for {len(self.nodes.nodes)} node(s)")
+            await state_backend.heartbeat(INSTANCE_ID)
+            # До запуска пула: все контейнеры с нашей меткой остались от прошлого запуска этого процесса
+            await self.reconcile_orphans(startup=True)
+            self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+            if self.pool:
+                self.pool.start(self.docker)
         except Exception as e:
             logger.critical(f"Failed to initialize Docker client: {e}")
             raise
+        await self.warm_up(list(images))
+
+    async def warm_up(self, images):
+        """Параллельно проверяет (и при отсутствии загружает) образы этапов, запоминает их digest.
+
+        Ошибки не прерывают запуск (если не задан IMAGE_WARMUP_REQUIRED): задачи, которым
+        нужен недоступный образ, падают сразу, а не после всех повторов run_container.
+        """
+        started = time.monotonic()
+        results = await asyncio.gather(*(self.prepare_image(image) for image in images), return_exceptions=True)
+        for image_name, result in zip(images, results):
+            if isinstance(result, Exception):
+                self.image_errors[image_name] = str(result)
+                logger.error(f"Image {image_name} is not available: {result}")
+            else:
+                logger.info(f"Image {image_name} ready ({result[:19]})")
+        self.warmed_up = True
+        logger.info(
+            f"Warm-up finished in {time.monotonic() - started:.1f}s: "
+            f"{len(images) - len(self.image_errors)}/{len(images)} images ready, "
+            f"orchestrator {'ready' if self.ready else 'NOT ready'}"
+        )
+        if self.image_errors and IMAGE_WARMUP_REQUIRED:
+            raise ImageUnavailable(f"Images not available: {', '.join(self.image_errors)}")
+
+    @property
+    def ready(self) -> bool:
+        """Прогрев завершен и все образы этапов доступны."""
+        return self.warmed_up and not self.image_errors
+
+    async def _inspect_image(self, node: DockerNode, image_name: str):
+        """Описание образа на узле или None, если его нет."""
+        try:
+            return await node.client.images.inspect(image_name)
+        except aiodocker.exceptions.DockerError as e:
+            if e.status == 404:
+                return None
+            raise
+
+    async def _fetch_image(self, node: DockerNode, image_name: str):
+        """Загружает отсутствующий на узле образ: из архива в IMAGE_TARBALL_DIR или из реестра IMAGE_REGISTRY."""
+        repository, tag = split_image_name(image_name)
+        if IMAGE_TARBALL_DIR:
+            tarball = os.path.join(IMAGE_TARBALL_DIR, f"{repository.replace('/', '_')}.tar")
+            if os.path.exists(tarball):
+                logger.info(f"Loading image {image_name} from {tarball} on node {node.name}")
+                with open(tarball, "rb") as file:
+                    await node.client.images.import_image(data=file)
+                return
+        if IMAGE_REGISTRY:
+            remote = f"{IMAGE_REGISTRY.rstrip('/')}/{repository}"
+            logger.info(f"Pulling image {remote}:{tag} on node {node.name}")
+            await node.client.images.pull(remote, tag=tag)
+            await node.client.images.tag(f"{remote}:{tag}", repo=repository, tag=tag)
+            return
+        raise ImageUnavailable(f"Image {image_name} not found and no registry or tarball cache is configured")
+
+    async def prepare_image_on(self, node: DockerNode, image_name: str) -> str:
+        """Проверяет образ на узле, при отсутствии загружает его. Возвращает digest."""
+        info = await self._inspect_image(node, image_name)
+        if info is None:
+            await asyncio.wait_for(self._fetch_image(node, image_name), timeout=IMAGE_PULL_TIMEOUT)
+            info = await self._inspect_image(node, image_name)
+            if info is None:
+                raise ImageUnavailable(f"Image {image_name} is still missing on node {node.name} after loading")
+        config = info.get("Config") or {}
+        if not (config.get("Entrypoint") or config.get("Cmd")):
+            raise ImageUnavailable(f"Image {image_name} has no entrypoint or command")
+        node.images[image_name] = info["Id"]
+        return info["Id"]
+
+    async def prepare_image(self, image_name: str) -> str:
+        """Готовит образ на всех здоровых узлах и запоминает digest. Возвращает digest.
+
+        Ошибка - только если образ недоступен ни на одном узле; узел без образа
+        попробует загрузить его снова при размещении на нем контейнера.
+        """
+        nodes = self.nodes.healthy() or self.nodes.nodes
+        results = await asyncio.gather(*(self.prepare_image_on(node, image_name) for node in nodes), return_exceptions=True)
+        digests = [result for result in results if not isinstance(result, BaseException)]
+        for node, result in zip(nodes, results):
+            if isinstance(result, BaseException):
+                if not digests:
+                    raise result
+                logger.warning(f"Image {image_name} is not available on node {node.name}: {result}")
+        self.image_versions[image_name] = digests[0]
+        self.image_errors.pop(image_name, None)
+        return digests[0]
+
+    async def image_version(self, image_name: str) -> str:
+        """Идентификатор (digest) локального образа - меняется при пересборке образа."""
+        if image_name not in self.image_versions:
+            await self.prepare_image(image_name)
+        return self.image_versions[image_name]
+
+    async def reconcile_orphans(self, startup: bool = False):
+        """Удаляет контейнеры бота, владелец которых упал (не отмечался дольше INSTANCE_TTL).
+
+        При запуске удаляются и контейнеры с нашим именем процесса - они остались от прошлого запуска.
+        """
+        live_instances = await state_backend.live_instances(INSTANCE_TTL)
+        containers = []
+        # Без списка контейнеров какого-то узла нельзя понять, каких контейнеров уже нет
+        listed_all = True
+        for node in self.nodes.nodes:
+            if not node.healthy:
+                listed_all = False
+                continue
+            try:
+                containers.extend(
+                    await node.client.containers.list(all=True, filters=json.dumps({"label": [OWNER_LABEL]}))
+                )
+            except Exception as e:
+                listed_all = False
+                logger.error(f"Failed to list containers on node {node.name}: {e}")
+        existing = set()
+        for container in containers:
+            owner = (container["Labels"] or {}).get(OWNER_LABEL)
+            existing.add(container.id)
+            if owner == INSTANCE_ID:
+                orphaned = startup
+            else:
+                orphaned = owner not in live_instances
+            if not orphaned:
+                continue
+            try:
+                await container.delete(force=True)
+                existing.discard(container.id)
+                logger.warning(f"Orphaned container {container.id[:12]} of {owner} removed")
+            except aiodocker.exceptions.DockerError as e:
+                logger.error(f"Failed to remove orphaned container {container.id[:12]}: {e}")
+        if not listed_all:
+            return
+        # Записи о контейнерах, которых уже нет
+        for record in await state_backend.list_containers():
+            if record["container_id"] not in existing:
+                await state_backend.remove_container(record["container_id"])
+
+    async def _heartbeat_loop(self):
+        """Отмечает процесс живым и периодически подчищает контейнеры упавших процессов."""
+        while True:
+            await asyncio.sleep(INSTANCE_HEARTBEAT_INTERVAL)
+            try:
+                await state_backend.heartbeat(INSTANCE_ID)
+                await self.reconcile_orphans()
+            except Exception as e:
+                logger.error(f"State reconciliation failed: {e}")
 
     @asynccontextmanager
-    async def managed_container(self, container):
+    async def managed_container(self, container, image_name: str = None):
         """Контекстный менеджер для управления контейнером"""
-        self.active_containers.add(container.id)
+        self.active_containers[container.id] = container
+        await state_backend.add_container(container.id, INSTANCE_ID, image_name)
         try:
             yield container
         finally:
-            await self.cleanup_container(container.id)
+            with CONTAINER_OPERATION.time(image=image_name, operation="teardown"):
+                await self.cleanup_container(container.id)
 
     async def cleanup_container(self, container_id):
         """Удаление контейнера с проверкой его существования"""
-        if container_id in self.active_containers:
+        container = self.active_containers.get(container_id)
+        if container is not None:
             try:
-                container = await self.docker.containers.get(container_id)
                 await container.delete(force=True)
                 logger.info(f"Container {container_id[:12]} removed")
             except aiodocker.exceptions.DockerError as e:
@@ -46,16 +258,18 @@ class Orchestrator:
             except Exception as e:
                 logger.error(f"Unexpected error while removing container {container_id}: {e}")
             finally:
-                self.active_containers.discard(container_id)
+                self.active_containers.pop(container_id, None)
+                await state_backend.remove_container(container_id)
 
-    async def stream_logs(self, container):
-        """Стриминг логов контейнера"""
+    async def stream_logs(self, container, log_stream: LogStream):
+        """Стриминг логов контейнера в поток логов (единственное чтение логов контейнера)"""
         container_id = container.id[:12]
+        splitter = LineSplitter(log_stream)
         try:
             logger.info(f"Starting log stream for {container_id}")
-            async for line in container.log(stdout=True, stderr=True, follow=True):
-                log_line = line.decode("utf-8", errors="replace").strip() if isinstance(line, bytes) else line.strip()
-                logger.info(f"[{container_id}] {log_line}")
+            async for chunk in container.log(stdout=True, stderr=True, follow=True):
+                splitter.feed(chunk.decode("utf-8", errors="replace") if isinstance(chunk, bytes) else chunk)
+            splitter.flush()
         except asyncio.CancelledError:
             logger.warning(f"Log stream task was cancelled for {container_id}")
         except Exception as e:
@@ -63,84 +277,270 @@ class Orchestrator:
         finally:
             logger.info(f"Log stream ended for {container_id}")
 
-    async def run_container(
+    async def finish_log_task(self, log_task: asyncio.Task, timeout: int = 5):
+        """Дожидается конца потока логов (он завершается сам после остановки контейнера)"""
+        if log_task.done():
+            return
+        await asyncio.wait({log_task}, timeout=timeout)
+        if not log_task.done():
+            log_task.cancel()
+            await asyncio.gather(log_task, return_exceptions=True)
+
+    async def run_in_pool(
         self,
         image_name: str,
+        log_stream: LogStream,
         environment: dict = None,
         command: str = None,
-        retries: int = 3,
-        delay: int = 10,
-        ports: dict = None
-    ):
-        """Запуск контейнера с ограничением памяти"""
-        for attempt in range(1, retries + 1):
-            try:
-                logger.info(f"Attempt {attempt}/{retries} to run {image_name}")
-
-                # Ограничение памяти (4GB RAM + 4GB Swap)
-                
-
-                # Проверяем, есть ли порты
-                port_bindings = {}
-                exposed_ports = {}
-                if ports:
-                    for c_port, h_port in ports.items():
-                        port_bindings[f"{c_port}/tcp"] = [{"HostPort": str(h_port)}]
-                        exposed_ports[f"{c_port}/tcp"] = {}
-
-                config = {
-                    "Image": image_name,
-                    "Env": [f"{k}={v}" for k, v in (environment or {}).items()],
-                    "HostConfig": {
-                        "Binds": [f"{data_path}:/app/data:rw"],
-                        "PortBindings": port_bindings,
-                        "Memory": MEMORY_LIMIT,  # Ограничение RAM (4GB)
-                        "MemorySwap": SWAP_LIMIT,  # Swap (4GB)
-                    },
-                    "ExposedPorts": exposed_ports
-                }
-
-                if command:
-                    config["Cmd"] = command.split()
-
-                container = await self.docker.containers.create(config)
-                async with self.managed_container(container):
-                    await container.start()
-                    log_task = asyncio.create_task(self.stream_logs(container))
+        timeout: int = 300,
+        limits: ResourceLimits = None,
+        items: int = 0,
+    ) -> Optional[int]:
+        """Запуск этапа в тёплом контейнере пула. Возвращает код выхода или None, если образ нельзя выполнить в пуле.
 
+        Пул работает на основном узле: запуск резервирует на нем память и CPU, как отдельный контейнер,
+        а пиковое потребление попадает в историю ресурсов образа.
+        """
+        limits = limits or ResourceLimits()
+        reserved_memory = resource_history.expected_memory(image_name, items, limits)
+        try:
+            node = await self.nodes.acquire(limits, reserved_memory, [self.nodes.primary])
+        except NoHealthyNodes:
+            logger.info(f"Primary node is unhealthy, running {image_name} in a one-shot container")
+            return None
+        try:
+            _, exit_code, monitor = await self.pool.run(
+                image_name, log_stream, environment=environment, command=command, timeout=timeout, limits=limits
+            )
+        except PoolUnavailable:
+            logger.info(f"Falling back to one-shot container for {image_name}")
+            return None
+        finally:
+            await self.nodes.release(node, limits, reserved_memory)
+        await asyncio.to_thread(
+            resource_history.record, image_name, items, monitor.peak_memory, monitor.cpus, limits
+        )
+        return exit_code
+
+    async def run_once(
+        self,
+        image_name: str,
+        log_stream: LogStream,
+        timeout: int,
+        environment: dict = None,
+        command: str = None,
+        ports: dict = None,
+        volumes: dict = None,
+        limits: ResourceLimits = None,
+        items: int = 0,
+    ) -> Tuple[int, bool]:
+        """Один запуск этапа. Возвращает (код выхода, убит ли контейнер за превышение памяти).
+
+        По таймауту контейнер удаляется и выбрасывается asyncio.TimeoutError.
+        Пиковое потребление памяти и CPU отдельного контейнера записывается в историю ресурсов образа.
+        """
+        limits = limits or ResourceLimits()
+        # Пул не публикует порты - этапам с портами нужен отдельный контейнер
+        if self.pool and not ports and ContainerPool.supports(volumes):
+            exit_code = await self.run_in_pool(image_name, log_stream, environment, command, timeout, limits, items)
+            if exit_code is not None:
+                return exit_code, False
+
+        # Контейнер размещается на наименее загруженном здоровом узле, где хватает памяти и CPU;
+        # память резервируется по ожидаемому пику, лимит контейнера остается верхней границей
+        reserved_memory = resource_history.expected_memory(image_name, items, limits)
+        node = await self.nodes.acquire(limits, reserved_memory)
+        # Порты без явного номера выделяются из пула узла и освобождаются после удаления контейнера
+        allocated = []
+        try:
+            if image_name not in node.images:
+                await self.prepare_image_on(node, image_name)
+            port_bindings = {}
+            exposed_ports = {}
+            for c_port, h_port in (ports or {}).items():
+                if not h_port:
+                    h_port = await node.ports.acquire()
+                    allocated.append(h_port)
+                port_bindings[f"{c_port}/tcp"] = [{"HostPort": str(h_port)}]
+                exposed_ports[f"{c_port}/tcp"] = {}
+            if port_bindings:
+                logger.info(f"Publishing ports for {image_name}: {port_bindings}")
+
+            # Каталог данных общий для узлов (смонтирован на каждом по node.data_path)
+            binds = [f"{node.to_node_path(data_path)}:/app/data:rw"]
+            binds.extend(
+                f"{node.to_node_path(host_path)}:{container_path}:rw" for host_path, container_path in (volumes or {}).items()
+            )
+
+            config = {
+                "Image": image_name,
+                "Env": [f"{k}={v}" for k, v in (environment or {}).items()],
+                "HostConfig": {
+                    "Binds": binds,
+                    "PortBindings": port_bindings,
+                    # Память, swap и CPU - по истории потребления этапа (без неё - MEMORY_LIMIT/SWAP_LIMIT)
+                    **limits.host_config(),
+                },
+                "ExposedPorts": exposed_ports,
+                # Владелец - чтобы после падения процесса контейнер нашел и удалил reconcile_orphans
+                "Labels": {OWNER_LABEL: INSTANCE_ID},
+            }
+
+            if command:
+                config["Cmd"] = command.split()
+
+            with CONTAINER_OPERATION.time(image=image_name, operation="create"):
+                container = await node.client.containers.create(config)
+            async with self.managed_container(container, image_name):
+                with CONTAINER_OPERATION.time(image=image_name, operation="start"):
+                    await container.start()
+                self.nodes.record_success(node)
+                logger.info(f"Container {container.id[:12]} ({image_name}) started on node {node.name}")
+                log_task = asyncio.create_task(self.stream_logs(container, log_stream))
+                monitor = StatsMonitor(container)
+                stats_task = asyncio.create_task(monitor.run())
+                oom_killed = False
+                cancelled = False
+                try:
+                    with CONTAINER_OPERATION.time(image=image_name, operation="wait"):
+                        result = await asyncio.wait_for(container.wait(), timeout=timeout)
+                    await self.finish_log_task(log_task)
                     try:
-                        result = await asyncio.wait_for(container.wait(), timeout=300)
-                        logs = await container.log(stdout=True, stderr=True)
-                        decoded_logs = "".join(
-                            line.decode("utf-8", errors="replace") if isinstance(line, bytes) else line
-                            for line in logs
+                        oom_killed = bool((await container.show())["State"].get("OOMKilled"))
+                    except aiodocker.exceptions.DockerError:
+                        pass
+                    return result["StatusCode"], oom_killed
+                except asyncio.CancelledError:
+                    # Задачу отменили: контейнер удаляется сразу, конец его логов не ждем
+                    cancelled = True
+                    log_task.cancel()
+                    logger.warning(f"Run of {image_name} cancelled, removing container {container.id[:12]}")
+                    raise
+                finally:
+                    stats_task.cancel()
+                    await asyncio.gather(stats_task, return_exceptions=True)
+                    # Прерванный запуск не показывает реального потребления - в историю не попадает
+                    if not cancelled:
+                        await asyncio.to_thread(
+                            resource_history.record,
+                            image_name, items, monitor.peak_memory, monitor.cpus, limits, oom=oom_killed,
                         )
-                        return decoded_logs, result["StatusCode"]
-                    except asyncio.TimeoutError:
-                        logger.error(f"Timeout while waiting for {image_name}")
-                        await self.cleanup_container(container.id)
-                    finally:
-                        await asyncio.sleep(1)
-                        await log_task
+                    await self.finish_log_task(log_task)
+        except Exception as e:
+            if is_port_conflict(e):
+                # Порт занят на узле чем-то вне пула - на время исключаем его, повтор получит другой
+                for port in allocated:
+                    node.ports.block(port)
+            # Ошибки API узла (5xx, отказ соединения) копятся и исключают узел из размещения
+            await self.nodes.record_failure(node, e)
+            raise
+        finally:
+            for port in allocated:
+                await node.ports.release(port)
+            await self.nodes.release(node, limits, reserved_memory)
+
+    async def run_container(
+        self,
+        image_name: str,
+        environment: dict = None,
+        command: str = None,
+        ports: dict = None,
+        volumes: dict = None,
+        log_stream: LogStream = None,
+        policy: RetryPolicy = None,
+        items: int = 0,
+    ):
+        """Запуск контейнера с ограничением памяти.
+
+        volumes - дополнительные привязки {путь на хосте: путь в контейнере},
+        например каталог задачи из JobWorkspace.
+        log_stream - приемник логов контейнера (файл лога задачи, подписчики на прогресс);
+        возвращаются только последние строки лога из его кольцевого буфера.
+        ports - публикуемые порты {порт контейнера: порт хоста}; порт хоста None выделяется из пула
+        HOST_PORT_RANGE, так что одинаковые этапы могут работать одновременно.
+        В режиме пула этап без портов выполняется через exec в тёплом контейнере,
+        если это невозможно - создается отдельный контейнер, как обычно.
+        policy - таймаут и повторы (по умолчанию - из настроек образа, см. retry_policy_for):
+        повторяются только ошибки из policy.retry_on, паузы растут экспоненциально.
+        Если образ падает во многих запусках подряд, запуски отклоняются сразу (CircuitOpen).
+        items - размер входа (ссылок или строк таблицы): по нему и истории запусков образа
+        подбираются ограничения памяти и CPU; после OOM следующая попытка получает вдвое больше памяти.
+        """
+        log_stream = log_stream or LogStream()
+        policy = policy or retry_policy_for(image_name)
+        breaker = self.breakers[image_name]
+        try:
+            breaker.check()
+        except CircuitOpen:
+            CONTAINER_FAILURES.inc(image=image_name, reason="circuit_open")
+            raise
+        limits = resource_history.limits_for(image_name, items)
 
+        # Отсутствующий образ - не временная ошибка: повторы не помогут, задача падает сразу
+        if image_name not in self.image_versions:
+            try:
+                await self.prepare_image(image_name)
+            except aiodocker.exceptions.DockerError as e:
+                logger.warning(f"Failed to inspect image {image_name}: {e}")
+
+        for attempt in range(1, policy.attempts + 1):
+            logger.info(f"Attempt {attempt}/{policy.attempts} to run {image_name}")
+            if attempt > 1:
+                log_stream.write(f"--- attempt {attempt}/{policy.attempts} ---")
+            try:
+                exit_code, oom_killed = await self.run_once(
+                    image_name, log_stream, policy.timeout, environment, command, ports, volumes, limits, items
+                )
+                failure = classify_exit(exit_code, oom_killed)
+                if failure is None:
+                    breaker.record_success()
+                    return log_stream.tail(), exit_code
+                logger.error(
+                    f"{image_name} failed ({failure}, exit code {exit_code}), attempt {attempt}/{policy.attempts}"
+                )
+                if not policy.should_retry(failure, attempt):
+                    breaker.record_failure()
+                    CONTAINER_FAILURES.inc(image=image_name, reason=failure)
+                    return log_stream.tail(), exit_code
+                if failure == FAILURE_OOM:
+                    limits = limits.scaled(2)
+            except asyncio.TimeoutError:
+                failure = FAILURE_TIMEOUT
+                CONTAINER_TIMEOUTS.inc(image=image_name)
+                logger.error(f"Timeout ({policy.timeout}s) while waiting for {image_name}")
             except aiodocker.exceptions.DockerError as e:
-                logger.error(f"Container error: {e}, attempt {attempt}/{retries}")
+                failure = FAILURE_DOCKER
+                logger.error(f"Container error: {e}, attempt {attempt}/{policy.attempts}")
             except Exception as e:
+                failure = FAILURE_ERROR
                 logger.critical(f"Unexpected error while running {image_name}: {e}")
 
-            if attempt < retries:
-                logger.info(f"Retrying in {delay} seconds...")
-                await asyncio.sleep(delay)
+            if not policy.should_retry(failure, attempt):
+                break
+            CONTAINER_RETRIES.inc(image=image_name, reason=failure)
+            delay = policy.backoff(attempt)
+            logger.info(f"Retrying in {delay:.1f} seconds...")
+            await asyncio.sleep(delay)
 
-        raise RuntimeError(f"Failed to start container {image_name} after {retries} attempts")
+        # policy.attempts >= 1, так что цикл выполнился хотя бы раз и failure/attempt заданы
+        breaker.record_failure()
+        CONTAINER_FAILURES.inc(image=image_name, reason=failure)
+        raise RuntimeError(f"Failed to run container {image_name}: {failure} after {attempt} attempts")
 
     async def shutdown(self):
         """Завершение работы: удаление контейнеров и закрытие клиента"""
         logger.info("Cleaning up all containers...")
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            await asyncio.gather(self._heartbeat_task, return_exceptions=True)
+            self._heartbeat_task = None
+        if self.pool:
+            await self.pool.shutdown()
         await asyncio.gather(*(self.cleanup_container(cid) for cid in list(self.active_containers)))
-        if self.docker:
-            await self.docker.close()
-            logger.info("Docker client closed")
+        # Процесс больше не владеет задачами - другие экземпляры могут забрать их сразу
+        await state_backend.remove_instance(INSTANCE_ID)
+        await self.nodes.close()
+        logger.info("Docker clients closed")
 
 # Создание глобального экземпляра
 orchestrator = Orchestrator()
\ No newline at end of file
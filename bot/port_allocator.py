@@ -0,0 +1,106 @@
+import time
+import socket
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+import aiodocker
+
+from bot.config.config import HOST_PORT_RANGE
+
+logger = logging.getLogger(__name__)
+
+# Сколько не выдавать порт, на котором Docker сообщил о конфликте (сек)
+PORT_CONFLICT_COOLDOWN = 60
+
+
+def parse_port_range(port_range: str) -> List[int]:
+    """Порты из строки вида "9223-9322" (пустая строка - пустой список)."""
+    if not port_range.strip():
+        return []
+    first, _, last = port_range.partition("-")
+    first, last = int(first), int(last or first)
+    if not 0 < first <= last < 65536:
+        raise ValueError(f"Invalid port range: {port_range}")
+    return list(range(first, last + 1))
+
+
+def is_port_free(port: int) -> bool:
+    """Порт хоста сейчас никем не занят."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        try:
+            sock.bind(("0.0.0.0", port))
+            return True
+        except OSError:
+            return False
+
+
+def is_port_conflict(error: BaseException) -> bool:
+    """Docker не смог опубликовать порт: его уже занял другой контейнер или процесс узла."""
+    if not isinstance(error, aiodocker.exceptions.DockerError):
+        return False
+    message = str(error.message).lower()
+    return "port is already allocated" in message or "address already in use" in message
+
+
+class PortAllocator:
+    """Пул портов узла Docker для публикации портов контейнеров этапов.
+
+    Каждый контейнер получает свои порты, поэтому этапы с публикуемыми портами
+    могут работать одновременно. Без диапазона порт выбирает сам Docker (эфемерный).
+    Освобожденный порт уходит в конец очереди, чтобы не попасть сразу в новый контейнер.
+    У каждого узла свой пул. probe - проверять порт попыткой занять его: это возможно только
+    для локального узла, на удаленном занятость видна лишь по ошибке Docker (см. block).
+    """
+
+    def __init__(self, port_range: str = HOST_PORT_RANGE, probe: bool = True):
+        self._free: Deque[int] = deque(parse_port_range(port_range))
+        self._size = len(self._free)
+        self._probe = probe
+        self._blocked: Dict[int, float] = {}  # Порт -> до какого времени (monotonic) его не выдавать
+        self._condition = asyncio.Condition()
+
+    @property
+    def ephemeral(self) -> bool:
+        return self._size == 0
+
+    def _take_free(self) -> Optional[int]:
+        """Первый свободный порт пула (занятые посторонними процессами пропускаются)."""
+        now = time.monotonic()
+        for _ in range(len(self._free)):
+            port = self._free.popleft()
+            if self._blocked.get(port, 0) <= now and (not self._probe or is_port_free(port)):
+                self._blocked.pop(port, None)
+                return port
+            self._free.append(port)
+        return None
+
+    def block(self, port: str, seconds: float = PORT_CONFLICT_COOLDOWN):
+        """Не выдавать порт seconds секунд: Docker сообщил, что он занят на узле."""
+        if port:
+            self._blocked[int(port)] = time.monotonic() + seconds
+            logger.warning(f"Host port {port} is in use on the node, skipping it for {seconds:g}s")
+
+    async def acquire(self) -> str:
+        """Порт хоста для одной привязки ("" - выбор за Docker). Ждет, если все порты пула заняты."""
+        if self.ephemeral:
+            return ""
+        async with self._condition:
+            port = self._take_free()
+            while port is None:
+                logger.warning("All host ports of the pool are in use, waiting")
+                try:
+                    # Порты могут освободить и посторонние процессы - проверяем периодически
+                    await asyncio.wait_for(self._condition.wait(), timeout=5)
+                except asyncio.TimeoutError:
+                    pass
+                port = self._take_free()
+            return str(port)
+
+    async def release(self, port: str):
+        if not port:
+            return
+        async with self._condition:
+            self._free.append(int(port))
+            self._condition.notify()
@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import logging
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+from bot.config.config import (
+    MEMORY_LIMIT,
+    SWAP_LIMIT,
+    SHARD_SIZE,
+    SHARD_CONCURRENCY,
+    JOB_MEMORY_RESERVATION,
+    ADAPTIVE_LIMITS_ENABLED,
+    RESOURCE_SAFETY_MARGIN,
+    RESOURCE_MIN_SAMPLES,
+    RESOURCE_HISTORY_SIZE,
+    RESOURCE_MIN_MEMORY,
+    RESOURCE_MIN_CPUS,
+    CONTAINER_MEMORY_ESTIMATE,
+)
+from bot.utils.file_lock import file_lock, file_version
+from bot.utils.workspace import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+RESOURCE_HISTORY_PATH = os.path.join(DATA_DIR, "cache", "resource_history.json")
+
+
+class ResourceLimits(NamedTuple):
+    """Ограничения одного контейнера (nano_cpus = 0 - без ограничения CPU)."""
+
+    memory: int = MEMORY_LIMIT
+    memory_swap: int = SWAP_LIMIT
+    nano_cpus: int = 0
+
+    def host_config(self) -> Dict[str, int]:
+        """Поля HostConfig Docker API."""
+        config = {"Memory": self.memory, "MemorySwap": self.memory_swap}
+        if self.nano_cpus:
+            config["NanoCpus"] = self.nano_cpus
+        return config
+
+    def scaled(self, factor: float) -> "ResourceLimits":
+        """Те же ограничения с памятью, увеличенной в factor раз (не больше MEMORY_LIMIT)."""
+        return limits_for_memory(int(self.memory * factor), self.nano_cpus)
+
+
+def limits_for_memory(memory: int, nano_cpus: int = 0) -> ResourceLimits:
+    """Ограничения с заданной памятью; swap - в той же пропорции, что SWAP_LIMIT к MEMORY_LIMIT."""
+    memory = max(RESOURCE_MIN_MEMORY, min(MEMORY_LIMIT, memory))
+    return ResourceLimits(memory, int(memory * SWAP_LIMIT / MEMORY_LIMIT), nano_cpus)
+
+
+class StatsMonitor:
+    """Пиковое потребление памяти и CPU контейнером по потоку статистики Docker."""
+
+    def __init__(self, container):
+        self.container = container
+        self.peak_memory = 0
+        self.cpu_samples: List[float] = []
+
+    async def run(self):
+        try:
+            async for stats in self.container.stats(stream=True):
+                self.update(stats)
+        except Exception as e:
+            # Статистика - вспомогательные данные, её потеря не должна влиять на этап
+            logger.debug(f"Stats stream for {self.container.id[:12]} ended: {e}")
+
+    def update(self, stats: Dict[str, Any]):
+        memory = stats.get("memory_stats") or {}
+        details = memory.get("stats") or {}
+        # Как в docker stats: без страничного кэша (cgroup v2 - inactive_file, v1 - total_inactive_file)
+        usage = memory.get("usage", 0) - details.get("inactive_file", details.get("total_inactive_file", 0))
+        self.peak_memory = max(self.peak_memory, usage)
+
+        cpu, precpu = stats.get("cpu_stats") or {}, stats.get("precpu_stats") or {}
+        cpu_usage, precpu_usage = cpu.get("cpu_usage") or {}, precpu.get("cpu_usage") or {}
+        cpu_delta = cpu_usage.get("total_usage", 0) - precpu_usage.get("total_usage", 0)
+        system_delta = cpu.get("system_cpu_usage", 0) - precpu.get("system_cpu_usage", 0)
+        online = cpu.get("online_cpus") or len(cpu_usage.get("percpu_usage") or []) or 1
+        if cpu_delta > 0 and system_delta > 0:
+            self.cpu_samples.append(cpu_delta / system_delta * online)
+
+    @property
+    def cpus(self) -> float:
+        """90-й перцентиль загрузки CPU (в ядрах): короткие всплески не раздувают квоту."""
+        if not self.cpu_samples:
+            return 0.0
+        samples = sorted(self.cpu_samples)
+        return samples[int(0.9 * (len(samples) - 1))]
+
+
+class ResourceHistory:
+    """История потребления ресурсов этапами (по образам) и ограничения на её основе.
+
+    Память оценивается как базовая часть плюс прирост на элемент входа (ссылку или строку таблицы),
+    CPU - по наибольшей наблюдавшейся загрузке; к обеим оценкам добавляется запас
+    RESOURCE_SAFETY_MARGIN. Пока наблюдений мало, действуют общие MEMORY_LIMIT/SWAP_LIMIT.
+    История общая для процессов бота: она перечитывается, когда файл изменился,
+    а наблюдение дописывается под блокировкой поверх свежей версии.
+    """
+
+    def __init__(self, path: str = RESOURCE_HISTORY_PATH):
+        self.path = path
+        self._samples: Optional[Dict[str, List[Dict[str, Any]]]] = None
+        self._version = None
+
+    @property
+    def samples(self) -> Dict[str, List[Dict[str, Any]]]:
+        version = file_version(self.path)
+        if self._samples is None or version != self._version:
+            try:
+                with open(self.path, encoding="utf-8") as file:
+                    self._samples = json.load(file)
+            except (OSError, ValueError):
+                self._samples = {}
+            self._version = version
+        return self._samples
+
+    def record(
+        self, image_name: str, items: int, memory: int, cpus: float, limits: ResourceLimits, oom: bool = False
+    ):
+        """Сохраняет наблюдение. При OOM реальная потребность неизвестна - записывается вдвое больше лимита.
+
+        Читает и пишет файл истории - из асинхронного кода вызывается через asyncio.to_thread.
+        """
+        if oom:
+            memory = max(memory, limits.memory * 2)
+        elif memory <= 0:
+            return
+        with file_lock(self.path):
+            samples = self.samples.setdefault(image_name, [])
+            samples.append(
+                {"items": max(items, 1), "memory": memory, "cpus": round(cpus, 3), "oom": oom, "at": time.time()}
+            )
+            del samples[:-RESOURCE_HISTORY_SIZE]
+            self._save()
+        logger.info(
+            f"{image_name}: peak memory {memory // 1024 ** 2} MB, CPU {cpus:.2f} for {items} items"
+            f"{' (OOM)' if oom else ''}"
+        )
+
+    @staticmethod
+    def _memory_estimate(samples: List[Dict[str, Any]], items: int) -> int:
+        """Пик памяти на items элементах по наблюдениям (без запаса)."""
+        items = max(items, 1)
+        baseline = min(s["memory"] for s in samples)
+        per_item = max((s["memory"] - baseline) / s["items"] for s in samples)
+        memory = baseline + per_item * items
+        # Не меньше того, что уже потребовалось на входе такого же или меньшего размера
+        return int(max([memory] + [s["memory"] for s in samples if s["items"] <= items]))
+
+    def expected_memory(self, image_name: str, items: int, limits: ResourceLimits) -> int:
+        """Сколько памяти резервировать на узле под запуск: ожидаемый пик по истории
+        (без неё - CONTAINER_MEMORY_ESTIMATE), но не больше лимита контейнера limits.
+
+        Лимит - верхняя граница на случай выброса, а не типичное потребление: резерв по лимиту
+        оставил бы на узле место для одного-двух контейнеров.
+        """
+        samples = self.samples.get(image_name, [])
+        if len(samples) < RESOURCE_MIN_SAMPLES:
+            return min(CONTAINER_MEMORY_ESTIMATE, limits.memory)
+        return min(self._memory_estimate(samples, items), limits.memory)
+
+    def limits_for(self, image_name: str, items: int) -> ResourceLimits:
+        """Ограничения для запуска образа на items элементах входа."""
+        samples = self.samples.get(image_name, [])
+        if not ADAPTIVE_LIMITS_ENABLED or len(samples) < RESOURCE_MIN_SAMPLES:
+            return ResourceLimits()
+
+        memory = self._memory_estimate(samples, items)
+        cpus = max(s["cpus"] for s in samples) * RESOURCE_SAFETY_MARGIN
+        nano_cpus = int(min(os.cpu_count() or 1, max(RESOURCE_MIN_CPUS, cpus)) * 1e9) if cpus else 0
+        return limits_for_memory(int(memory * RESOURCE_SAFETY_MARGIN), nano_cpus)
+
+    def job_memory(self, images: Iterable[str], items: int) -> int:
+        """Резерв памяти для задачи в планировщике: ожидаемый пик самого тяжелого этапа во всех шардах
+        плюс параллельный этап на всем входе. Пока история есть не у всех этапов - JOB_MEMORY_RESERVATION.
+
+        Считается по наблюдавшимся пикам, а не по лимитам контейнеров: сумма лимитов
+        (до MEMORY_LIMIT на контейнер) пропускала бы одну задачу на любом узле.
+        """
+        images = list(images)
+        if not images or any(len(self.samples.get(image, [])) < RESOURCE_MIN_SAMPLES for image in images):
+            return JOB_MEMORY_RESERVATION
+        shard = max(self._memory_estimate(self.samples[image], min(items, SHARD_SIZE)) for image in images)
+        whole = max(self._memory_estimate(self.samples[image], items) for image in images)
+        return shard * SHARD_CONCURRENCY + whole
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(self.samples, file)
+        os.replace(tmp_path, self.path)
+        self._version = file_version(self.path)
+
+
+# Создание глобального экземпляра
+resource_history = ResourceHistory()
@@ -0,0 +1,150 @@
+import time
+import random
+import logging
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Optional
+
+from bot.config.config import (
+    STAGE_TIMEOUT,
+    STAGE_RETRIES,
+    RETRY_BASE_DELAY,
+    RETRY_MAX_DELAY,
+    STAGE_RETRY_POLICIES,
+    CIRCUIT_BREAKER_THRESHOLD,
+    CIRCUIT_BREAKER_COOLDOWN,
+)
+
+logger = logging.getLogger(__name__)
+
+# Классы ошибок запуска контейнера
+FAILURE_EXIT = "exit"  # Процесс завершился с ненулевым кодом - обычно повтор даст тот же результат
+FAILURE_OOM = "oom"  # Контейнер убит за превышение лимита памяти
+FAILURE_KILLED = "killed"  # Контейнер убит SIGKILL не из-за памяти (docker stop, перезапуск узла)
+FAILURE_TIMEOUT = "timeout"  # Этап не уложился в таймаут
+FAILURE_DOCKER = "docker"  # Ошибка Docker API (демон перезапускается, конфликт имен и т.п.)
+FAILURE_ERROR = "error"  # Прочие неожиданные ошибки
+
+# Код выхода процесса, убитого SIGKILL: OOM killer, docker stop по таймауту, перезапуск узла
+SIGKILL_EXIT_CODE = 137
+
+
+def classify_exit(exit_code: int, oom_killed: bool = False) -> Optional[str]:
+    """Класс ошибки по результату контейнера или None, если этап завершился успешно."""
+    if exit_code == 0:
+        return None
+    # Об OOM говорит только флаг Docker: у любого SIGKILL тот же код 137, и удвоение памяти ему не поможет
+    if oom_killed:
+        return FAILURE_OOM
+    if exit_code == SIGKILL_EXIT_CODE:
+        return FAILURE_KILLED
+    return FAILURE_EXIT
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Таймаут, число попыток и паузы между ними для одного этапа."""
+
+    timeout: int = STAGE_TIMEOUT
+    attempts: int = STAGE_RETRIES
+    base_delay: float = RETRY_BASE_DELAY
+    max_delay: float = RETRY_MAX_DELAY
+    retry_on: FrozenSet[str] = frozenset({FAILURE_DOCKER, FAILURE_OOM, FAILURE_KILLED, FAILURE_ERROR})
+
+    def __post_init__(self):
+        # Хотя бы одна попытка запуска, даже при STAGE_RETRIES=0
+        object.__setattr__(self, "attempts", max(1, self.attempts))
+
+    def should_retry(self, failure: str, attempt: int) -> bool:
+        return failure in self.retry_on and attempt < self.attempts
+
+    def backoff(self, attempt: int) -> float:
+        """Пауза после attempt-й попытки: экспоненциальный рост со случайным разбросом,
+        чтобы одновременно упавшие задачи не повторяли запуск в один момент."""
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return random.uniform(delay / 2, delay)
+
+
+def retry_policy_for(image_name: str) -> RetryPolicy:
+    """Политика повторов для образа этапа: общие настройки и переопределения из STAGE_RETRY_POLICIES."""
+    overrides = dict(STAGE_RETRY_POLICIES.get(image_name, {}))
+    if "retry_on" in overrides:
+        overrides["retry_on"] = frozenset(overrides["retry_on"])
+    return RetryPolicy(**overrides)
+
+
+class CircuitOpen(Exception):
+    """Образ подряд падает во многих задачах - запуски временно не выполняются."""
+
+
+class CircuitBreaker:
+    """Предохранитель для образа: после threshold неудач подряд запуски отклоняются сразу.
+
+    Через cooldown секунд пропускается одна пробная попытка: успех замыкает цепь,
+    неудача снова размыкает её на cooldown.
+    """
+
+    def __init__(
+        self,
+        image_name: str,
+        threshold: int = CIRCUIT_BREAKER_THRESHOLD,
+        cooldown: int = CIRCUIT_BREAKER_COOLDOWN,
+    ):
+        self.image_name = image_name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        # Время начала пробной попытки (если её отменили, через cooldown разрешается следующая)
+        self._trial_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return "open"
+        return "half-open"
+
+    def check(self):
+        """Выбрасывает CircuitOpen, если запуск сейчас не разрешен."""
+        state = self.state
+        now = time.monotonic()
+        trial_running = self._trial_at is not None and now - self._trial_at < self.cooldown
+        if state == "open" or (state == "half-open" and trial_running):
+            retry_in = max(0, self.cooldown - (now - self.opened_at))
+            raise CircuitOpen(
+                f"Image {self.image_name} failed {self.failures} times in a row, "
+                f"runs are suspended for {retry_in:.0f}s"
+            )
+        if state == "half-open":
+            self._trial_at = now
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logger.info(f"Circuit for {self.image_name} closed")
+        self.failures = 0
+        self.opened_at = None
+        self._trial_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_at = None
+        if self.threshold and self.failures >= self.threshold:
+            if self.opened_at is None or self.state == "half-open":
+                logger.error(f"Circuit for {self.image_name} opened after {self.failures} failures")
+            self.opened_at = time.monotonic()
+
+
+class CircuitBreakers:
+    """Предохранители всех образов."""
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def __getitem__(self, image_name: str) -> CircuitBreaker:
+        if image_name not in self._breakers:
+            self._breakers[image_name] = CircuitBreaker(image_name)
+        return self._breakers[image_name]
+
+    def states(self) -> Dict[str, str]:
+        return {name: breaker.state for name, breaker in self._breakers.items()}
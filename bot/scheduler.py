@@ -0,0 +1,327 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from bot.config.config import (
+    SCHEDULER_WORKERS,
+    HOST_MEMORY_BUDGET,
+    JOB_MEMORY_RESERVATION,
+    FAST_LANE_WORKERS,
+    FAST_LANE_MAX_SECONDS,
+    SCHEDULER_AGING,
+)
+from bot.metrics import QUEUE_WAIT, JOB_DURATION, JOBS_RUNNING, JOBS_QUEUED
+
+logger = logging.getLogger(__name__)
+
+# Оценка длительности задачи, пока нет статистики
+DEFAULT_JOB_DURATION = 300
+DEFAULT_JOB_OVERHEAD = 60  # Постоянная часть (запуск этапов, отправка), сек
+DEFAULT_ITEM_SECONDS = 25  # На одну ссылку, сек
+# Сколько последних задач учитывается в оценке длительности по числу ссылок
+COST_HISTORY_SIZE = 50
+# Доля памяти под задачи, если бюджет не задан явно
+MEMORY_BUDGET_SHARE = 0.8
+
+
+def detect_memory_budget(capacity: int = 0) -> int:
+    """Бюджет памяти под задачи: из конфига, 80% суммарной памяти узлов Docker (capacity)
+    или 80% физической памяти хоста."""
+    if HOST_MEMORY_BUDGET > 0:
+        return HOST_MEMORY_BUDGET
+    if capacity > 0:
+        return int(capacity * MEMORY_BUDGET_SHARE)
+    try:
+        total = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+        return int(total * MEMORY_BUDGET_SHARE)
+    except (AttributeError, ValueError, OSError):
+        # Windows и прочие системы без sysconf - без бюджета, задачи ограничивает только число воркеров
+        return 0
+
+
+@dataclass
+class Job:
+    """Задача в очереди планировщика."""
+
+    job_id: str
+    chat_id: int
+    run: Callable[[], Awaitable[None]]
+    memory: int = JOB_MEMORY_RESERVATION
+    items: int = 0  # Размер задачи (ссылок) - по нему оценивается длительность
+    priority: float = 1.0  # Вес пользователя: делит оценку длительности при выборе следующей задачи
+    expected: float = 0.0  # Оценка длительности (сек), выставляется при постановке в очередь
+    submitted_at: float = field(default_factory=time.monotonic)
+    started_at: Optional[float] = None
+    # Отдельная asyncio задача выполнения: её отмена прерывает задачу, не затрагивая воркер
+    task: Optional[asyncio.Task] = None
+
+
+class Scheduler:
+    """Очередь задач с пулом воркеров, приоритетом коротких задач и контролем памяти.
+
+    Задачи каждого чата выполняются по порядку, а среди первых задач чатов воркер берет
+    задачу с наименьшей оценкой длительности (делится на вес пользователя); каждая секунда
+    ожидания уменьшает оценку на SCHEDULER_AGING, поэтому длинные задачи не ждут бесконечно.
+    FAST_LANE_WORKERS воркеров берут только короткие задачи (не длиннее FAST_LANE_MAX_SECONDS):
+    задача на пару ссылок не ждет, пока все воркеры заняты большими. Задача запускается,
+    только если её резерв памяти помещается в бюджет хоста.
+    """
+
+    def __init__(
+        self,
+        workers: int = SCHEDULER_WORKERS,
+        memory_budget: Optional[int] = None,
+    ):
+        self.workers = max(1, workers)
+        self._fixed_budget = bool(memory_budget)
+        self.memory_budget = memory_budget or detect_memory_budget()
+        self._queues: "OrderedDict[int, Deque[Job]]" = OrderedDict()
+        self._running: Dict[str, Job] = {}
+        self._reserved = 0
+        self._durations: Deque[float] = deque(maxlen=20)
+        # (ссылок, длительность) завершенных задач - для оценки длительности новых
+        self._costs: Deque[Tuple[int, float]] = deque(maxlen=COST_HISTORY_SIZE)
+        # Хотя бы один воркер должен брать любые задачи, иначе длинные не запустятся
+        self.fast_lane_workers = max(0, min(FAST_LANE_WORKERS, self.workers - 1))
+        self._condition = asyncio.Condition()
+        self._worker_tasks: List[asyncio.Task] = []
+        self._draining = False
+        JOBS_RUNNING.set_function(lambda: self.running_count)
+        JOBS_QUEUED.set_function(lambda: self.queued_count)
+
+    async def start(self, memory_capacity: int = 0):
+        """Запуск воркеров.
+
+        memory_capacity - суммарная память узлов Docker: контейнеры задач работают на них,
+        поэтому бюджет считается от неё, а не от памяти хоста бота (если бюджет не задан явно).
+        """
+        if self._worker_tasks:
+            return
+        if not self._fixed_budget and memory_capacity > 0:
+            self.memory_budget = detect_memory_budget(memory_capacity)
+        self._worker_tasks = [
+            asyncio.create_task(self._worker(index), name=f"scheduler-worker-{index}")
+            for index in range(1, self.workers + 1)
+        ]
+        logger.info(
+            f"Scheduler started: {self.workers} workers ({self.fast_lane_workers} for short jobs), "
+            f"memory budget {self.memory_budget // 1024 ** 2} MB"
+        )
+
+    async def drain(self, timeout: float):
+        """Перестает запускать новые задачи и ждет завершения выполняющихся (не дольше timeout).
+
+        Ожидающие задачи остаются в манифестах и продолжатся после перезапуска.
+        """
+        async with self._condition:
+            self._draining = True
+            self._condition.notify_all()
+        logger.info(f"Draining scheduler: {len(self._running)} running, {self.queued_count} queued")
+        try:
+            async with self._condition:
+                await asyncio.wait_for(
+                    self._condition.wait_for(lambda: not self._running), timeout=timeout
+                )
+            logger.info("All running jobs finished")
+        except asyncio.TimeoutError:
+            logger.warning(f"Drain timeout, {len(self._running)} jobs will be interrupted")
+
+    async def stop(self):
+        """Остановка воркеров (выполняющиеся задачи отменяются)."""
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        logger.info("Scheduler stopped")
+
+    async def submit(self, job: Job) -> int:
+        """Ставит задачу в очередь и возвращает её позицию (1 - следующая на запуск)."""
+        job.expected = self.estimate(job.items)
+        async with self._condition:
+            self._queues.setdefault(job.chat_id, deque()).append(job)
+            self._condition.notify_all()
+        logger.info(
+            f"Job {job.job_id} queued for chat {job.chat_id} "
+            f"({job.items} items, expected {job.expected:.0f}s, priority {job.priority:g})"
+        )
+        return self.position(job.job_id)
+
+    async def cancel_chat(self, chat_id: int, timeout: float = 30) -> List[Job]:
+        """Отменяет задачи чата и возвращает их.
+
+        Ожидающие задачи убираются из очереди, выполняющиеся прерываются (CancelledError доходит
+        до контейнеров, и они удаляются). Завершения прерванных задач ждем не дольше timeout.
+        """
+        async with self._condition:
+            pending = list(self._queues.pop(chat_id, ()))
+            running = [job for job in self._running.values() if job.chat_id == chat_id]
+        tasks = [job.task for job in running if job.task]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+        if pending or running:
+            logger.info(f"Chat {chat_id}: cancelled {len(running)} running and {len(pending)} queued jobs")
+        return running + pending
+
+    def estimate(self, items: int) -> float:
+        """Ожидаемая длительность задачи из items ссылок (сек).
+
+        Линейная модель по завершенным задачам: постоянная часть плюс время на ссылку
+        (метод наименьших квадратов); пока данных мало - среднее время на ссылку или значения по умолчанию.
+        """
+        samples = list(self._costs)
+        if len(samples) >= 2:
+            mean_items = sum(n for n, _ in samples) / len(samples)
+            mean_duration = sum(d for _, d in samples) / len(samples)
+            variance = sum((n - mean_items) ** 2 for n, _ in samples)
+            if variance > 0:
+                slope = max(0.0, sum((n - mean_items) * (d - mean_duration) for n, d in samples) / variance)
+                return max(0.0, mean_duration - slope * mean_items) + slope * items
+        if samples:
+            per_item = sum(d for _, d in samples) / sum(max(n, 1) for n, _ in samples)
+            return per_item * max(items, 1)
+        return DEFAULT_JOB_OVERHEAD + DEFAULT_ITEM_SECONDS * items
+
+    @staticmethod
+    def _score(job: Job, now: float) -> float:
+        """Чем меньше, тем раньше задача будет запущена."""
+        return job.expected / job.priority - SCHEDULER_AGING * (now - job.submitted_at)
+
+    def _ordered_pending(self) -> List[Job]:
+        """Порядок, в котором воркеры заберут ожидающие задачи (по текущим оценкам)."""
+        now = time.monotonic()
+        queues = [deque(queue) for queue in self._queues.values()]
+        ordered = []
+        while any(queues):
+            queue = min((q for q in queues if q), key=lambda q: self._score(q[0], now))
+            ordered.append(queue.popleft())
+        return ordered
+
+    def position(self, job_id: str) -> int:
+        """Позиция задачи в очереди (0 - задача уже выполняется или не найдена)."""
+        for index, job in enumerate(self._ordered_pending(), start=1):
+            if job.job_id == job_id:
+                return index
+        return 0
+
+    @property
+    def average_duration(self) -> float:
+        if not self._durations:
+            return DEFAULT_JOB_DURATION
+        return sum(self._durations) / len(self._durations)
+
+    def eta(self, position: int) -> float:
+        """Оценка времени (в секундах) до запуска задачи на данной позиции."""
+        if position <= 0:
+            return 0.0
+        now = time.monotonic()
+        average = self.average_duration
+        # Ближайший освободившийся воркер + полные «волны» задач впереди
+        remaining = sorted(
+            max(0.0, average - (now - job.started_at))
+            for job in self._running.values()
+            if job.started_at is not None
+        )
+        free_slots = self.workers - len(remaining)
+        if position <= free_slots:
+            return 0.0
+        first_wait = remaining[0] if remaining else 0.0
+        waves = (position - max(free_slots, 0) - 1) // self.workers
+        return first_wait + waves * average
+
+    def status(self, chat_id: int) -> Tuple[List[Job], List[Tuple[Job, int, float]]]:
+        """Выполняющиеся и ожидающие задачи чата: (running, [(job, position, eta)])."""
+        running = [job for job in self._running.values() if job.chat_id == chat_id]
+        pending = [
+            (job, index, self.eta(index))
+            for index, job in enumerate(self._ordered_pending(), start=1)
+            if job.chat_id == chat_id
+        ]
+        return running, pending
+
+    @property
+    def queued_count(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    @property
+    def running_count(self) -> int:
+        return len(self._running)
+
+    def has_job(self, job_id: str) -> bool:
+        """Задача выполняется или ждет в очереди этого процесса."""
+        return job_id in self._running or any(job.job_id == job_id for queue in self._queues.values() for job in queue)
+
+    def _take_next(self, fast_lane: bool = False) -> Optional[Job]:
+        """Забирает задачу с наименьшей оценкой среди первых задач чатов, если она помещается в бюджет памяти.
+
+        fast_lane - воркер коротких задач: длинные задачи он не берет.
+        """
+        if self._draining:
+            return None
+        candidates = [queue[0] for queue in self._queues.values()]
+        if fast_lane:
+            candidates = [job for job in candidates if job.expected <= FAST_LANE_MAX_SECONDS]
+        if not candidates:
+            return None
+        now = time.monotonic()
+        job = min(candidates, key=lambda j: self._score(j, now))
+        # Если ничего не выполняется, пропускаем задачу даже сверх бюджета, иначе она не запустится никогда
+        if self.memory_budget and self._running and self._reserved + job.memory > self.memory_budget:
+            return None
+        queue = self._queues[job.chat_id]
+        queue.popleft()
+        if not queue:
+            del self._queues[job.chat_id]
+        return job
+
+    async def _worker(self, index: int):
+        fast_lane = index <= self.fast_lane_workers
+        while True:
+            async with self._condition:
+                job = self._take_next(fast_lane)
+                while job is None:
+                    await self._condition.wait()
+                    job = self._take_next(fast_lane)
+                self._reserved += job.memory
+                job.started_at = time.monotonic()
+                self._running[job.job_id] = job
+                job.task = asyncio.create_task(job.run(), name=f"job-{job.job_id}")
+
+            QUEUE_WAIT.observe(job.started_at - job.submitted_at)
+            logger.info(
+                f"Worker {index} started job {job.job_id} "
+                f"(waited {job.started_at - job.submitted_at:.1f}s)"
+            )
+            try:
+                await asyncio.wait({job.task})
+                if job.task.cancelled():
+                    logger.warning(f"Job {job.job_id} cancelled")
+                elif job.task.exception():
+                    logger.error(f"Job {job.job_id} failed: {job.task.exception()}", exc_info=job.task.exception())
+            except asyncio.CancelledError:
+                # Остановка планировщика - прерывается и выполняющаяся задача
+                job.task.cancel()
+                await asyncio.wait({job.task})
+                logger.warning(f"Job {job.job_id} cancelled")
+                raise
+            finally:
+                duration = time.monotonic() - job.started_at
+                JOB_DURATION.observe(duration)
+                # Прерванные задачи не участвуют в оценке времени ожидания
+                if not job.task.cancelled():
+                    self._durations.append(duration)
+                    self._costs.append((job.items, duration))
+                async with self._condition:
+                    self._running.pop(job.job_id, None)
+                    self._reserved -= job.memory
+                    self._condition.notify_all()
+                logger.info(f"Worker {index} finished job {job.job_id}")
+
+
+# Создание глобального экземпляра
+scheduler = Scheduler()
@@ -0,0 +1,273 @@
+import os
+import json
+import time
+import socket
+import asyncio
+import logging
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Set
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+from bot.config.config import STATE_BACKEND, STATE_DB_PATH, INSTANCE_ID as CONFIGURED_INSTANCE_ID
+from bot.utils.workspace import DATA_DIR
+from bot.utils.job_manifest import JOB_CANCEL_REQUESTED, UNFINISHED_STATES
+
+logger = logging.getLogger(__name__)
+
+# Имя этого процесса бота: им помечаются задачи и контейнеры, которыми он владеет
+INSTANCE_ID = CONFIGURED_INSTANCE_ID or f"{socket.gethostname()}-{os.getpid()}"
+
+# Метка Docker с владельцем контейнера - по ней находятся контейнеры, брошенные упавшим процессом
+OWNER_LABEL = "presentation-bot.owner"
+
+
+class StateBackend(ABC):
+    """Общее для процессов бота состояние: данные FSM, реестр задач и владельцы контейнеров.
+
+    Интерфейс асинхронный, чтобы за ним могло стоять сетевое хранилище (Redis, Postgres);
+    SQLiteStateBackend - реализация для одного хоста с общим диском.
+    """
+
+    # FSM
+    @abstractmethod
+    async def get_fsm_state(self, key: str) -> Optional[str]: ...
+
+    @abstractmethod
+    async def set_fsm_state(self, key: str, state: Optional[str]): ...
+
+    @abstractmethod
+    async def get_fsm_data(self, key: str) -> Dict[str, Any]: ...
+
+    @abstractmethod
+    async def set_fsm_data(self, key: str, data: Dict[str, Any]): ...
+
+    # Реестр задач
+    @abstractmethod
+    async def put_job(self, job_id: str, chat_id: int, status: str, instance_id: str): ...
+
+    @abstractmethod
+    async def claim_job(self, job_id: str, chat_id: int, status: str, instance_id: str, ttl: int) -> bool:
+        """Забирает задачу себе, если у неё нет живого владельца. True - задача теперь наша."""
+
+    @abstractmethod
+    async def list_jobs(self, status: Optional[str] = None) -> List[Dict[str, Any]]: ...
+
+    @abstractmethod
+    async def request_cancel(self, chat_id: int, instance_id: str) -> int:
+        """Помечает незавершенные задачи чата других процессов для отмены их владельцами. Возвращает число задач."""
+
+    # Владельцы контейнеров
+    @abstractmethod
+    async def add_container(self, container_id: str, instance_id: str, image_name: str): ...
+
+    @abstractmethod
+    async def remove_container(self, container_id: str): ...
+
+    @abstractmethod
+    async def list_containers(self) -> List[Dict[str, Any]]: ...
+
+    # Живые процессы
+    @abstractmethod
+    async def heartbeat(self, instance_id: str): ...
+
+    @abstractmethod
+    async def remove_instance(self, instance_id: str): ...
+
+    @abstractmethod
+    async def live_instances(self, ttl: int) -> Set[str]: ...
+
+    @abstractmethod
+    async def close(self): ...
+
+
+class SQLiteStateBackend(StateBackend):
+    """Состояние в базе SQLite (WAL), доступной всем процессам бота на хосте.
+
+    Запросы выполняются в потоке, чтобы не блокировать цикл событий.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS fsm (
+            key TEXT PRIMARY KEY, state TEXT, data TEXT NOT NULL DEFAULT '{}'
+        );
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY, chat_id INTEGER, status TEXT NOT NULL,
+            owner TEXT, updated_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS containers (
+            container_id TEXT PRIMARY KEY, owner TEXT NOT NULL, image TEXT, created_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS instances (
+            instance_id TEXT PRIMARY KEY, heartbeat_at REAL NOT NULL
+        );
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._connection.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(self.SCHEMA)
+        logger.info(f"State backend: SQLite {path}")
+
+    def _execute(self, query: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._connection.execute(query, params)
+
+    def _fetch(self, query: str, params: tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._connection.execute(query, params).fetchall()
+
+    async def _run(self, function, *args):
+        return await asyncio.to_thread(function, *args)
+
+    async def get_fsm_state(self, key: str) -> Optional[str]:
+        rows = await self._run(self._fetch, "SELECT state FROM fsm WHERE key = ?", (key,))
+        return rows[0]["state"] if rows else None
+
+    async def set_fsm_state(self, key: str, state: Optional[str]):
+        await self._run(
+            self._execute,
+            "INSERT INTO fsm (key, state) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET state = excluded.state",
+            (key, state),
+        )
+
+    async def get_fsm_data(self, key: str) -> Dict[str, Any]:
+        rows = await self._run(self._fetch, "SELECT data FROM fsm WHERE key = ?", (key,))
+        return json.loads(rows[0]["data"]) if rows else {}
+
+    async def set_fsm_data(self, key: str, data: Dict[str, Any]):
+        await self._run(
+            self._execute,
+            "INSERT INTO fsm (key, data) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET data = excluded.data",
+            (key, json.dumps(data, ensure_ascii=False)),
+        )
+
+    async def put_job(self, job_id: str, chat_id: int, status: str, instance_id: str):
+        await self._run(
+            self._execute,
+            "INSERT INTO jobs (job_id, chat_id, status, owner, updated_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(job_id) DO UPDATE SET status = excluded.status, owner = excluded.owner, "
+            "updated_at = excluded.updated_at "
+            # Запрос отмены не затирается, пока задача не завершится
+            f"WHERE jobs.status != ? OR excluded.status NOT IN ({', '.join('?' * len(UNFINISHED_STATES))})",
+            (job_id, chat_id, status, instance_id, time.time(), JOB_CANCEL_REQUESTED, *UNFINISHED_STATES),
+        )
+
+    async def claim_job(self, job_id: str, chat_id: int, status: str, instance_id: str, ttl: int) -> bool:
+        def claim() -> bool:
+            now = time.time()
+            with self._lock:
+                self._connection.execute(
+                    "INSERT OR IGNORE INTO jobs (job_id, chat_id, status, owner, updated_at) VALUES (?, ?, ?, NULL, ?)",
+                    (job_id, chat_id, status, now),
+                )
+                # Условие проверяется и запись меняется одним запросом - задачу заберет только один процесс
+                cursor = self._connection.execute(
+                    "UPDATE jobs SET owner = ?, status = ?, updated_at = ? WHERE job_id = ? AND status != ? AND ("
+                    "owner IS NULL OR owner = ? OR owner NOT IN "
+                    "(SELECT instance_id FROM instances WHERE heartbeat_at > ?))",
+                    (instance_id, status, now, job_id, JOB_CANCEL_REQUESTED, instance_id, now - ttl),
+                )
+                return cursor.rowcount > 0
+
+        return await self._run(claim)
+
+    async def list_jobs(self, status: Optional[str] = None) -> List[Dict[str, Any]]:
+        if status is None:
+            rows = await self._run(self._fetch, "SELECT * FROM jobs ORDER BY updated_at")
+        else:
+            rows = await self._run(self._fetch, "SELECT * FROM jobs WHERE status = ? ORDER BY updated_at", (status,))
+        return [dict(row) for row in rows]
+
+    async def request_cancel(self, chat_id: int, instance_id: str) -> int:
+        cursor = await self._run(
+            self._execute,
+            f"UPDATE jobs SET status = ?, updated_at = ? WHERE chat_id = ? AND owner != ? "
+            f"AND status IN ({', '.join('?' * len(UNFINISHED_STATES))})",
+            (JOB_CANCEL_REQUESTED, time.time(), chat_id, instance_id, *UNFINISHED_STATES),
+        )
+        return cursor.rowcount
+
+    async def add_container(self, container_id: str, instance_id: str, image_name: str):
+        await self._run(
+            self._execute,
+            "INSERT OR REPLACE INTO containers (container_id, owner, image, created_at) VALUES (?, ?, ?, ?)",
+            (container_id, instance_id, image_name, time.time()),
+        )
+
+    async def remove_container(self, container_id: str):
+        await self._run(self._execute, "DELETE FROM containers WHERE container_id = ?", (container_id,))
+
+    async def list_containers(self) -> List[Dict[str, Any]]:
+        return [dict(row) for row in await self._run(self._fetch, "SELECT * FROM containers")]
+
+    async def heartbeat(self, instance_id: str):
+        await self._run(
+            self._execute,
+            "INSERT OR REPLACE INTO instances (instance_id, heartbeat_at) VALUES (?, ?)",
+            (instance_id, time.time()),
+        )
+
+    async def remove_instance(self, instance_id: str):
+        await self._run(self._execute, "DELETE FROM instances WHERE instance_id = ?", (instance_id,))
+
+    async def live_instances(self, ttl: int) -> Set[str]:
+        rows = await self._run(
+            self._fetch, "SELECT instance_id FROM instances WHERE heartbeat_at > ?", (time.time() - ttl,)
+        )
+        return {row["instance_id"] for row in rows}
+
+    async def close(self):
+        with self._lock:
+            self._connection.close()
+        logger.info("State backend closed")
+
+
+class BackendStorage(BaseStorage):
+    """Хранилище FSM aiogram поверх StateBackend - состояние пользователей общее для процессов
+    и переживает перезапуск."""
+
+    def __init__(self, backend: StateBackend, key_builder: Optional[KeyBuilder] = None):
+        self.backend = backend
+        self.key_builder = key_builder or DefaultKeyBuilder()
+
+    async def set_state(self, key: StorageKey, state: StateType = None):
+        await self.backend.set_fsm_state(
+            self.key_builder.build(key), state.state if isinstance(state, State) else state
+        )
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self.backend.get_fsm_state(self.key_builder.build(key))
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]):
+        await self.backend.set_fsm_data(self.key_builder.build(key), data)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return await self.backend.get_fsm_data(self.key_builder.build(key))
+
+    async def close(self):
+        # Диспетчер закрывает хранилище при остановке приема обновлений, а выполняющиеся
+        # задачи еще пишут в реестр - общее состояние закрывается в main
+        pass
+
+
+def create_state_backend() -> StateBackend:
+    """Хранилище состояния по настройке STATE_BACKEND."""
+    if STATE_BACKEND == "memory":
+        return SQLiteStateBackend(":memory:")
+    if STATE_BACKEND == "sqlite":
+        return SQLiteStateBackend(STATE_DB_PATH or os.path.join(DATA_DIR, "state.sqlite3"))
+    raise ValueError(f"Unknown STATE_BACKEND: {STATE_BACKEND}")
+
+
+# Создание глобального экземпляра
+state_backend = create_state_backend()
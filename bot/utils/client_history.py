@@ -0,0 +1,96 @@
+import os
+import json
+import time
+import hashlib
+import logging
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from bot.cache import listing_id
+from bot.config.config import CLIENT_HISTORY_TTL
+from bot.utils.workspace import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+CLIENTS_DIR = os.path.join(DATA_DIR, "clients")
+
+
+class LinkDelta(NamedTuple):
+    """Отличие нового списка ссылок клиента от последней успешной задачи."""
+
+    added: List[str]
+    removed: List[str]
+    unchanged: List[str]
+
+
+def _link_key(link: str) -> str:
+    return listing_id(link) or link
+
+
+def diff_links(previous: List[str], links: List[str]) -> LinkDelta:
+    """Сравнивает списки по номерам объявлений (порядок нового списка сохраняется)."""
+    previous_keys = {_link_key(link) for link in previous}
+    current_keys = {_link_key(link) for link in links}
+    return LinkDelta(
+        added=[link for link in links if _link_key(link) not in previous_keys],
+        removed=[link for link in previous if _link_key(link) not in current_keys],
+        unchanged=[link for link in links if _link_key(link) in previous_keys],
+    )
+
+
+class ClientHistory:
+    """Последняя успешная задача каждого клиента в каждом чате (data/clients/<хэш чата и имени>.json).
+
+    По ней повторная задача клиента обрабатывает только добавленные ссылки:
+    презентации и строки таблицы для остальных уже были созданы и отправлены в этот чат.
+    История не общая для чатов: другой агент с тем же именем клиента презентаций не получал.
+    """
+
+    def __init__(self, root: str = CLIENTS_DIR, ttl: int = CLIENT_HISTORY_TTL):
+        self.root = root
+        self.ttl = ttl
+
+    def _path(self, chat_id: int, client_name: str) -> str:
+        key = hashlib.sha256(f"{chat_id}:{client_name.strip().casefold()}".encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.root, f"{key}.json")
+
+    def get(self, chat_id: int, client_name: str) -> Optional[Dict[str, Any]]:
+        """Запись о последней успешной задаче клиента в чате или None (нет или устарела)."""
+        try:
+            with open(self._path(chat_id, client_name), encoding="utf-8") as file:
+                record = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if time.time() - record.get("updated_at", 0) > self.ttl:
+            return None
+        return record
+
+    def diff(self, chat_id: int, client_name: str, links: List[str]) -> Optional[LinkDelta]:
+        """Отличие от последней успешной задачи клиента в чате (None - истории нет, нужна полная обработка)."""
+        record = self.get(chat_id, client_name)
+        if record is None:
+            return None
+        return diff_links(record["links"], links)
+
+    def record(self, chat_id: int, client_name: str, links: List[str], job_id: Optional[str] = None):
+        """Запоминает ссылки клиента, по которым в чат отправлены результаты."""
+        os.makedirs(self.root, exist_ok=True)
+        path = self._path(chat_id, client_name)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(
+                {
+                    "chat_id": chat_id,
+                    "client_name": client_name,
+                    "links": links,
+                    "job_id": job_id,
+                    "updated_at": time.time(),
+                },
+                file,
+                ensure_ascii=False,
+            )
+        os.replace(tmp_path, path)
+        logger.info(f"Client history of {client_name} updated: {len(links)} links")
+
+
+# Создание глобального экземпляра
+client_history = ClientHistory()
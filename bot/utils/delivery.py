@@ -0,0 +1,231 @@
+import os
+import json
+import random
+import asyncio
+import hashlib
+import logging
+import zipfile
+from typing import Awaitable, Callable, Dict, List, Optional, TypeVar, Union
+
+from aiogram.types import Message, FSInputFile, InputMediaDocument
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from bot.config.config import DELIVERY_CONCURRENCY, DELIVERY_RETRIES, DELIVERY_ZIP_THRESHOLD
+from bot.utils.file_lock import file_lock
+from bot.utils.progress import telegram_rate_limiter
+from bot.metrics import DELIVERY_DURATION
+from bot.utils.workspace import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+FILE_ID_CACHE_PATH = os.path.join(DATA_DIR, "cache", "telegram_file_ids.json")
+
+# Максимум документов в одном альбоме (ограничение sendMediaGroup)
+ALBUM_SIZE = 10
+
+# Общее ограничение одновременных загрузок для всех задач
+upload_semaphore = asyncio.Semaphore(DELIVERY_CONCURRENCY)
+
+
+class FileIdCache:
+    """file_id уже загруженных в Telegram файлов по содержимому: повторная отправка без загрузки.
+
+    Изменения копятся в памяти и записываются одним flush() на отправку (вне цикла событий).
+    Файл общий для процессов бота: запись идет под блокировкой поверх свежей версии с диска.
+    """
+
+    def __init__(self, path: str = FILE_ID_CACHE_PATH):
+        self.path = path
+        self._ids: Optional[Dict[str, str]] = None
+        # Несохраненные изменения: отпечаток -> file_id (None - удалить)
+        self._changes: Dict[str, Optional[str]] = {}
+
+    @staticmethod
+    def fingerprint(file_path: str) -> str:
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return f"{digest.hexdigest()}:{os.path.basename(file_path)}"
+
+    def _read(self) -> Dict[str, str]:
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    @property
+    def ids(self) -> Dict[str, str]:
+        if self._ids is None:
+            self._ids = self._read()
+        return self._ids
+
+    def get(self, fingerprint: str) -> Optional[str]:
+        if fingerprint in self._changes:
+            return self._changes[fingerprint]
+        return self.ids.get(fingerprint)
+
+    def put(self, fingerprint: str, file_id: str):
+        self._changes[fingerprint] = file_id
+
+    def discard(self, fingerprint: str):
+        if self.get(fingerprint):
+            self._changes[fingerprint] = None
+
+    async def flush(self):
+        """Записывает накопленные изменения."""
+        if not self._changes:
+            return
+        changes = dict(self._changes)
+        try:
+            self._ids = await asyncio.to_thread(self._save, changes)
+        except OSError as e:
+            logger.warning(f"Failed to save Telegram file_id cache: {e}")
+            return
+        # Изменения, сделанные во время записи, остаются до следующего flush
+        for fingerprint, file_id in changes.items():
+            if self._changes.get(fingerprint, file_id) == file_id:
+                self._changes.pop(fingerprint, None)
+
+    def _save(self, changes: Dict[str, Optional[str]]) -> Dict[str, str]:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with file_lock(self.path):
+            ids = self._read()
+            for fingerprint, file_id in changes.items():
+                if file_id is None:
+                    ids.pop(fingerprint, None)
+                else:
+                    ids[fingerprint] = file_id
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                json.dump(ids, file)
+            os.replace(tmp_path, self.path)
+        return ids
+
+
+# Создание глобального экземпляра
+file_id_cache = FileIdCache()
+
+
+async def send_with_retry(chat_id: int, send: Callable[[], Awaitable[T]], description: str) -> T:
+    """Отправка с учетом лимитов: ждет RetryAfter, повторяет сетевые ошибки с экспоненциальной паузой."""
+    for attempt in range(1, DELIVERY_RETRIES + 1):
+        await telegram_rate_limiter.acquire(chat_id)
+        try:
+            return await send()
+        except TelegramRetryAfter as e:
+            if attempt == DELIVERY_RETRIES:
+                raise
+            logger.warning(f"Flood control while sending {description}, retry in {e.retry_after}s")
+            await asyncio.sleep(e.retry_after)
+        except (TelegramNetworkError, TelegramServerError) as e:
+            if attempt == DELIVERY_RETRIES:
+                raise
+            delay = min(60, 2 ** attempt) + random.uniform(0, 1)
+            logger.warning(f"Error sending {description}: {e}, attempt {attempt}/{DELIVERY_RETRIES}, retry in {delay:.1f}s")
+            await asyncio.sleep(delay)
+    raise RuntimeError(f"Failed to send {description}")
+
+
+def zip_files(files: List[str], archive_path: str) -> str:
+    """Упаковывает файлы в один архив."""
+    with zipfile.ZipFile(archive_path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for file_path in files:
+            archive.write(file_path, arcname=os.path.basename(file_path))
+    return archive_path
+
+
+async def _send_group(message: Message, files: List[str]) -> int:
+    """Отправляет до ALBUM_SIZE файлов одним альбомом (или одним документом). Возвращает число отправленных."""
+    # Хэширование содержимого читает файлы целиком - вне цикла событий
+    fingerprints = await asyncio.gather(*(asyncio.to_thread(file_id_cache.fingerprint, path) for path in files))
+
+    def media(use_cache: bool) -> List[Union[str, FSInputFile]]:
+        return [
+            (file_id_cache.get(fp) if use_cache else None) or FSInputFile(path)
+            for path, fp in zip(files, fingerprints)
+        ]
+
+    async def send(use_cache: bool) -> List[Message]:
+        items = media(use_cache)
+        if len(items) == 1:
+            return [await send_with_retry(
+                message.chat.id, lambda: message.answer_document(items[0]), os.path.basename(files[0])
+            )]
+        return await send_with_retry(
+            message.chat.id,
+            lambda: message.answer_media_group([InputMediaDocument(media=item) for item in items]),
+            f"album of {len(items)} files",
+        )
+
+    async with upload_semaphore:
+        try:
+            sent = await send(use_cache=True)
+        except TelegramBadRequest as e:
+            # Сохраненный file_id мог устареть - загружаем файлы заново
+            if not any(file_id_cache.get(fp) for fp in fingerprints):
+                raise
+            logger.warning(f"Cached file_id rejected ({e}), uploading again")
+            for fp in fingerprints:
+                file_id_cache.discard(fp)
+            sent = await send(use_cache=False)
+
+    for fp, sent_message in zip(fingerprints, sent):
+        if sent_message.document:
+            file_id_cache.put(fp, sent_message.document.file_id)
+    for path in files:
+        logger.info(f"Файл отправлен: {os.path.basename(path)}")
+    return len(sent)
+
+
+async def deliver_files(message: Message, files: List[str], archive_dir: Optional[str] = None) -> int:
+    """Отправляет готовые файлы в чат: альбомами, параллельно (с общим ограничением) и с повторами.
+
+    Если файлов больше DELIVERY_ZIP_THRESHOLD, отправляется один архив. Возвращает число
+    доставленных файлов; ошибки отдельных альбомов не мешают отправке остальных.
+    """
+    if not files:
+        return 0
+    try:
+        return await _deliver_files(message, files, archive_dir)
+    finally:
+        # file_id новых загрузок сохраняются один раз на отправку
+        await file_id_cache.flush()
+
+
+async def _deliver_files(message: Message, files: List[str], archive_dir: Optional[str]) -> int:
+    if DELIVERY_ZIP_THRESHOLD and len(files) > DELIVERY_ZIP_THRESHOLD and archive_dir:
+        archive_path = await asyncio.to_thread(
+            zip_files, files, os.path.join(archive_dir, "presentations.zip")
+        )
+        logger.info(f"{len(files)} files packed into {archive_path}")
+        try:
+            with DELIVERY_DURATION.time(mode="zip"):
+                await _send_group(message, [archive_path])
+            return len(files)
+        except Exception as e:
+            logger.error(f"Ошибка при отправке архива: {e}", exc_info=True)
+            return 0
+
+    groups = [files[i:i + ALBUM_SIZE] for i in range(0, len(files), ALBUM_SIZE)]
+    with DELIVERY_DURATION.time(mode="albums"):
+        results = await asyncio.gather(*(_send_group(message, group) for group in groups), return_exceptions=True)
+
+    sent = 0
+    for group, result in zip(groups, results):
+        if isinstance(result, Exception):
+            logger.error(
+                f"Ошибка при отправке файлов {', '.join(map(os.path.basename, group))}: {result}",
+                exc_info=result,
+            )
+        else:
+            sent += result
+    return sent
@@ -0,0 +1,35 @@
+import os
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows - блокировка между процессами не поддерживается
+    fcntl = None
+
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """Эксклюзивная блокировка файла path между процессами бота (через path.lock).
+
+    Под ней читают свежую версию общего JSON файла, меняют и записывают её,
+    чтобы процессы не затирали изменения друг друга.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(f"{path}.lock", "a") as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def file_version(path: str) -> Optional[Tuple[int, int, int]]:
+    """Признак изменения файла (другой процесс записал новую версию) или None, если файла нет."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
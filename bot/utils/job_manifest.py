@@ -0,0 +1,157 @@
+import os
+import json
+import time
+import logging
+from typing import Any, Dict, List, Optional
+
+from bot.utils.workspace import JobWorkspace, JOBS_DIR
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+
+# Состояния задачи
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_FAILED = "failed"
+JOB_DONE = "done"
+JOB_CANCELLED = "cancelled"
+# Только в реестре задач: /cancel получил другой процесс, задачу должен остановить её владелец
+JOB_CANCEL_REQUESTED = "cancel_requested"
+
+# Незавершенные задачи, которые подхватываются после перезапуска бота
+UNFINISHED_STATES = (JOB_QUEUED, JOB_RUNNING)
+
+
+class JobManifest:
+    """Манифест задачи в её каталоге: входные данные, состояние и контрольные точки этапов.
+
+    Позволяет продолжить упавшую или прерванную перезапуском задачу с первого
+    незавершенного этапа, не повторяя уже выполненные.
+    """
+
+    def __init__(self, workspace: JobWorkspace, data: Optional[Dict[str, Any]] = None):
+        self.workspace = workspace
+        self.data = data or {
+            "job_id": workspace.job_id,
+            "status": JOB_QUEUED,
+            "stages": {},
+            "created_at": time.time(),
+        }
+
+    @property
+    def path(self) -> str:
+        return self.workspace.host(MANIFEST_NAME)
+
+    @classmethod
+    def create(
+        cls,
+        workspace: JobWorkspace,
+        chat_id: int,
+        client_name: str,
+        links: List[str],
+        message: Optional[Dict[str, Any]] = None,
+        client_links: Optional[List[str]] = None,
+    ) -> "JobManifest":
+        """Создает манифест новой задачи.
+
+        client_links - полный список ссылок клиента, если задача обрабатывает только его изменения.
+        """
+        workspace.create()
+        manifest = cls(workspace)
+        manifest.data.update(
+            chat_id=chat_id, client_name=client_name, links=links, message=message, client_links=client_links or links
+        )
+        manifest.save()
+        return manifest
+
+    @classmethod
+    def load(cls, workspace: JobWorkspace) -> Optional["JobManifest"]:
+        """Загружает манифест задачи или None, если его нет или он поврежден."""
+        try:
+            with open(workspace.host(MANIFEST_NAME), encoding="utf-8") as file:
+                return cls(workspace, json.load(file))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to read manifest of job {workspace.job_id}: {e}")
+            return None
+
+    @classmethod
+    def all(cls) -> List["JobManifest"]:
+        """Манифесты всех задач на диске, от новых к старым."""
+        if not os.path.isdir(JOBS_DIR):
+            return []
+        manifests = (cls.load(JobWorkspace(job_id)) for job_id in os.listdir(JOBS_DIR))
+        return sorted(
+            (m for m in manifests if m is not None),
+            key=lambda m: m.data.get("created_at", 0),
+            reverse=True,
+        )
+
+    @classmethod
+    def latest_failed(cls, chat_id: int) -> Optional["JobManifest"]:
+        """Последняя упавшая задача чата."""
+        for manifest in cls.all():
+            if manifest.chat_id == chat_id and manifest.status == JOB_FAILED:
+                return manifest
+        return None
+
+    @classmethod
+    def cleanup_expired(cls, max_age: int):
+        """Удаляет каталоги упавших задач, которые не продолжали дольше max_age секунд."""
+        now = time.time()
+        for manifest in cls.all():
+            if manifest.status == JOB_FAILED and now - manifest.data.get("updated_at", 0) > max_age:
+                manifest.workspace.cleanup()
+
+    def save(self):
+        """Атомарно записывает манифест на диск."""
+        self.data["updated_at"] = time.time()
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(self.data, file, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    @property
+    def job_id(self) -> str:
+        return self.data["job_id"]
+
+    @property
+    def chat_id(self) -> Optional[int]:
+        return self.data.get("chat_id")
+
+    @property
+    def status(self) -> str:
+        return self.data["status"]
+
+    def set_status(self, status: str):
+        self.data["status"] = status
+        self.save()
+        logger.info(f"Job {self.job_id} is {status}")
+
+    def mark_stage(self, index: int, state: str, artifacts: List[str]):
+        """Контрольная точка: состояние этапа и созданные им файлы (относительно каталога задачи)."""
+        self.data["stages"][str(index)] = {
+            "state": state,
+            "artifacts": artifacts,
+            "finished_at": time.time(),
+        }
+        self.save()
+
+    def all_stages_done(self, done_state: str) -> bool:
+        """Все этапы задачи завершились успешно (в том числе необязательные)."""
+        stages = self.data["stages"].values()
+        return bool(stages) and all(checkpoint["state"] == done_state for checkpoint in stages)
+
+    def completed_stages(self, done_state: str) -> List[int]:
+        """Этапы, завершенные успешно и чьи файлы на месте - их можно не повторять."""
+        completed = []
+        for index, checkpoint in self.data["stages"].items():
+            if checkpoint["state"] != done_state:
+                continue
+            if all(os.path.exists(self.workspace.host(path)) for path in checkpoint["artifacts"]):
+                completed.append(int(index))
+            else:
+                logger.warning(f"Job {self.job_id}: artifacts of stage {index} are missing, it will be re-run")
+        return completed
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from bot.cache import normalize_listing_url, listing_id
+from bot.config.config import LINK_CHECK_ENABLED, LINK_CHECK_CONCURRENCY, LINK_CHECK_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# Ответы, по которым объявление точно недоступно; остальные ошибки (капча, 403, сеть) ссылку не отбрасывают
+DEAD_STATUSES = {404, 410}
+
+USER_AGENT = "Mozilla/5.0 (compatible; PresentationBot/1.0)"
+
+
+def canonical_link(url: str) -> str:
+    """Единая ссылка на объявление: https://www.cian.ru/<путь>/ без параметров, якоря и мобильного поддомена.
+
+    Региональные поддомены (spb.cian.ru) сохраняются.
+    """
+    normalized = normalize_listing_url(url)
+    parts = urlsplit(normalized)
+    if parts.netloc == "cian.ru":
+        return f"https://www.cian.ru{parts.path}"
+    return normalized
+
+
+@dataclass
+class PreparedLinks:
+    """Ссылки задачи после предварительной обработки."""
+
+    links: List[str] = field(default_factory=list)
+    # (исходная строка, ссылка, которую она повторяет)
+    duplicates: List[Tuple[str, str]] = field(default_factory=list)
+    unavailable: List[str] = field(default_factory=list)
+
+
+def deduplicate_links(lines: List[str]) -> PreparedLinks:
+    """Приводит ссылки к каноническому виду и убирает повторы одного объявления (порядок сохраняется)."""
+    prepared = PreparedLinks()
+    seen: Dict[str, str] = {}
+    for line in lines:
+        link = canonical_link(line)
+        # Одно объявление может быть открыто по разным путям - сравниваем по номеру
+        key = listing_id(link) or link
+        if key in seen:
+            prepared.duplicates.append((line, seen[key]))
+            continue
+        seen[key] = link
+        prepared.links.append(link)
+    return prepared
+
+
+async def _is_unavailable(session: aiohttp.ClientSession, semaphore: asyncio.Semaphore, link: str) -> bool:
+    async with semaphore:
+        try:
+            async with session.head(link, allow_redirects=True) as response:
+                if response.status == 405:
+                    # HEAD не поддерживается - читаем только заголовки ответа на GET
+                    async with session.get(link, allow_redirects=True) as get_response:
+                        return get_response.status in DEAD_STATUSES
+                return response.status in DEAD_STATUSES
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.debug(f"Link check failed for {link}: {e}")
+            return False
+
+
+async def find_unavailable_links(links: List[str]) -> List[str]:
+    """Ссылки на снятые/несуществующие объявления (параллельные HEAD-запросы через общий пул соединений)."""
+    if not links:
+        return []
+    semaphore = asyncio.Semaphore(LINK_CHECK_CONCURRENCY)
+    connector = aiohttp.TCPConnector(limit=LINK_CHECK_CONCURRENCY, ttl_dns_cache=300)
+    timeout = aiohttp.ClientTimeout(total=LINK_CHECK_TIMEOUT)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers={"User-Agent": USER_AGENT}) as session:
+        results = await asyncio.gather(*(_is_unavailable(session, semaphore, link) for link in links))
+    return [link for link, unavailable in zip(links, results) if unavailable]
+
+
+async def prepare_links(lines: List[str]) -> PreparedLinks:
+    """Дедупликация и (если LINK_CHECK_ENABLED) проверка доступности объявлений."""
+    prepared = deduplicate_links(lines)
+    if LINK_CHECK_ENABLED:
+        try:
+            prepared.unavailable = await find_unavailable_links(prepared.links)
+        except Exception as e:
+            # Проверка - оптимизация: при сбое обрабатываем все ссылки, как раньше
+            logger.warning(f"Link availability check failed: {e}")
+        unavailable = set(prepared.unavailable)
+        prepared.links = [link for link in prepared.links if link not in unavailable]
+    if prepared.duplicates or prepared.unavailable:
+        logger.info(
+            f"Links prepared: {len(prepared.links)} kept, {len(prepared.duplicates)} duplicates, "
+            f"{len(prepared.unavailable)} unavailable"
+        )
+    return prepared
+
+
+def format_link_report(prepared: PreparedLinks, limit: int = 10) -> str:
+    """Сообщение пользователю о том, какие ссылки не будут обработаны (пустая строка - сообщать нечего)."""
+
+    def listing(items: List[str]) -> str:
+        lines = items[:limit]
+        if len(items) > limit:
+            lines.append(f"… и ещё {len(items) - limit}")
+        return "\n".join(lines)
+
+    parts = []
+    if prepared.duplicates:
+        parts.append(
+            f"♻️ Убрано повторов: {len(prepared.duplicates)}\n"
+            + listing([f"{line} → {kept}" for line, kept in prepared.duplicates])
+        )
+    if prepared.unavailable:
+        parts.append(f"🚫 Объявления недоступны и пропущены: {len(prepared.unavailable)}\n" + listing(prepared.unavailable))
+    return "\n\n".join(parts)
@@ -0,0 +1,101 @@
+import os
+import json
+import time
+import logging
+from typing import Any, Dict, Optional
+
+from bot.config.config import LOG_RETENTION
+from bot.logger import LOGS_DIR, job_log_path
+from bot.utils.file_lock import file_lock, file_version
+
+logger = logging.getLogger(__name__)
+
+LOG_INDEX_PATH = os.path.join(LOGS_DIR, "index.json")
+
+# Размер блока, которыми файл читается с конца
+TAIL_BLOCK_SIZE = 64 * 1024
+
+
+def tail_lines(path: str, lines: int) -> bytes:
+    """Последние lines строк файла; читаются только блоки с конца, а не весь файл."""
+    with open(path, "rb") as file:
+        position = file.seek(0, os.SEEK_END)
+        blocks = []
+        newlines = 0
+        # Строк должно набраться на одну больше: первая прочитанная может быть неполной
+        while position > 0 and newlines <= lines:
+            size = min(TAIL_BLOCK_SIZE, position)
+            position -= size
+            file.seek(position)
+            block = file.read(size)
+            blocks.append(block)
+            newlines += block.count(b"\n")
+    return b"".join(b"".join(reversed(blocks)).splitlines(keepends=True)[-lines:])
+
+
+class LogIndex:
+    """Индекс логов задач (logs/index.json): какой чат запускал задачу и где её лог.
+
+    /logs находит лог по индексу, не просматривая каталог; устаревшие логи
+    (старше LOG_RETENTION) удаляются при регистрации новых задач. Индекс общий для процессов
+    бота: он перечитывается, когда файл изменился, а запись идет под блокировкой поверх свежей версии.
+    """
+
+    def __init__(self, path: str = LOG_INDEX_PATH, retention: int = LOG_RETENTION):
+        self.path = path
+        self.retention = retention
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+        self._version = None
+
+    @property
+    def entries(self) -> Dict[str, Dict[str, Any]]:
+        version = file_version(self.path)
+        if self._entries is None or version != self._version:
+            try:
+                with open(self.path, encoding="utf-8") as file:
+                    self._entries = json.load(file)
+            except (OSError, ValueError):
+                self._entries = {}
+            self._version = version
+        return self._entries
+
+    def register(self, job_id: str, chat_id: int):
+        """Записывает задачу в индекс (повторная регистрация при /retry только обновляет время)."""
+        with file_lock(self.path):
+            now = time.time()
+            entry = self.entries.setdefault(job_id, {"chat_id": chat_id, "path": job_log_path(job_id), "created": now})
+            entry["updated"] = now
+            self._prune(now)
+            self._save()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.entries.get(job_id)
+
+    def latest(self, chat_id: int) -> Optional[str]:
+        """Последняя задача чата."""
+        jobs = [(entry["updated"], job_id) for job_id, entry in self.entries.items() if entry["chat_id"] == chat_id]
+        return max(jobs)[1] if jobs else None
+
+    def _prune(self, now: float):
+        for job_id, entry in list(self.entries.items()):
+            if now - entry["updated"] > self.retention:
+                try:
+                    os.remove(entry["path"])
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.warning(f"Failed to remove job log {entry['path']}: {e}")
+                    continue
+                del self.entries[job_id]
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(self.entries, file)
+        os.replace(tmp_path, self.path)
+        self._version = file_version(self.path)
+
+
+# Создание глобального экземпляра
+log_index = LogIndex()
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import os
+from collections import deque
+from typing import AsyncIterator, Deque, List, Optional
+
+from bot.config.config import LOG_TAIL_BYTES
+
+logger = logging.getLogger(__name__)
+
+# Сколько непрочитанных строк хранится для каждого подписчика (старые отбрасываются)
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+
+class LogStream:
+    """Потоковый приемник логов одного запуска контейнера.
+
+    Каждая строка сразу дописывается в файл лога задачи (без файла - в общий лог бота),
+    в памяти остается только кольцевой буфер последних LOG_TAIL_BYTES байт
+    (для сообщения об ошибке), а подписчики получают строки через асинхронный итератор lines().
+    """
+
+    def __init__(self, path: Optional[str] = None, prefix: str = "", tail_bytes: int = LOG_TAIL_BYTES):
+        self.prefix = prefix
+        self.tail_bytes = tail_bytes
+        self._tail: Deque[str] = deque()
+        self._tail_size = 0
+        self._subscribers: List[asyncio.Queue] = []
+        self._closed = False
+        self._file = None
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._file = open(path, "a", encoding="utf-8", buffering=1)
+
+    def write(self, line: str):
+        """Принимает одну строку лога."""
+        line = line.rstrip("\r\n")
+        if self._file:
+            self._file.write(f"{self.prefix}{line}\n")
+        else:
+            logger.info(f"{self.prefix}{line}")
+
+        self._tail.append(line)
+        self._tail_size += len(line) + 1
+        while self._tail_size > self.tail_bytes and len(self._tail) > 1:
+            self._tail_size -= len(self._tail.popleft()) + 1
+
+        for queue in self._subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(line)
+
+    def tail(self) -> str:
+        """Последние строки лога (не больше tail_bytes)."""
+        return "\n".join(self._tail)
+
+    async def lines(self) -> AsyncIterator[str]:
+        """Асинхронный итератор по строкам лога до закрытия потока.
+
+        Подписчик начинает с уже записанных строк из кольцевого буфера: задача-подписчик
+        запускается позже контейнера, и первые строки (обычно первые отметки прогресса)
+        иначе были бы потеряны.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        for line in list(self._tail)[-SUBSCRIBER_QUEUE_SIZE:]:
+            queue.put_nowait(line)
+        self._subscribers.append(queue)
+        try:
+            while not (self._closed and queue.empty()):
+                line = await queue.get()
+                if line is None:
+                    break
+                yield line
+        finally:
+            self._subscribers.remove(queue)
+
+    def close(self):
+        """Завершает поток: закрывает файл и останавливает итераторы подписчиков."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._file:
+            self._file.close()
+            self._file = None
+        for queue in self._subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(None)
+
+
+class LineSplitter:
+    """Собирает строки из произвольных кусков вывода (куски могут рвать строки посередине)."""
+
+    def __init__(self, stream: LogStream):
+        self.stream = stream
+        self._pending = ""
+
+    def feed(self, chunk: str):
+        self._pending += chunk
+        *lines, self._pending = self._pending.split("\n")
+        for line in lines:
+            self.stream.write(line)
+
+    def flush(self):
+        if self._pending:
+            self.stream.write(self._pending)
+            self._pending = ""
@@ -1,22 +1,47 @@
 import os
+import math
+import time
+import asyncio
 import logging
-from typing import Callable, List, Tuple, Dict, Optional
+from typing import Awaitable, Callable, List, Tuple, Dict, Optional
 from aiogram.types import Message
 from bot.orchestrator import (
     orchestrator,
 )  # Импортируем глобальный асинхронный оркестратор
+from bot.utils.workspace import JobWorkspace
+from bot.utils.stage_graph import Stage, STAGE_DONE, STAGE_FAILED, STAGE_SKIPPED, run_stage_graph
+from bot.utils.sharding import count_items, split_file, merge_tables
+from bot.utils.table_format import (
+    copy_table,
+    inspect_table,
+    is_table,
+    read_table,
+    stage_table_format,
+    table_file_name,
+)
+from bot.utils.stage_cache import run_cached_stage
+from bot.utils.job_manifest import JobManifest
+from bot.utils.log_stream import LogStream
+from bot.utils.progress import ProgressReporter
+from bot.metrics import STAGE_DURATION
+from bot.cache import normalize_listing_url
+from bot.config.config import SHARD_SIZE, SHARD_CONCURRENCY, CACHE_ENABLED, CACHE_LINK_COLUMN, TABLE_FORMAT
 import aiofiles
 
 logger = logging.getLogger(__name__)
 
 # Глобальные пути
 DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "data"))
-STAGES_OF_PRESENTATION_CREATION = [1, 2, 3, 4]
+STAGES_OF_PRESENTATION_CREATION = [1, 2, 3, 4]  # Ошибка на этих этапах означает, что презентаций не будет
+# Ссылки упавших шардов: этап в целом успешен, но по этим объявлениям результатов нет
+FAILED_LINKS_FILE = "failed_links.txt"
 
 
-async def save_links_to_file(links: List[str], filename: str = "links.txt") -> str:
-    """Асинхронно сохраняет список ссылок в файл."""
-    links_path = os.path.join(DATA_DIR, "table", filename)
+async def save_links_to_file(
+    links: List[str], workspace: JobWorkspace, filename: str = "links.txt"
+) -> str:
+    """Асинхронно сохраняет список ссылок в файл задачи."""
+    links_path = workspace.host(JobWorkspace.TABLE_DIR, filename)
     os.makedirs(os.path.dirname(links_path), exist_ok=True)
 
     # Используем асинхронную запись в файл
@@ -52,138 +77,499 @@ async def update_status(
     message: Message,
     log_message: str,
     status_callback: Optional[Callable[[str], None]] = None,
+    progress: Optional[ProgressReporter] = None,
+    stage_index: Optional[int] = None,
 ):
-    """Асинхронное обновление статуса."""
+    """Асинхронное обновление статуса.
+
+    С ProgressReporter статус попадает в одно редактируемое сообщение задачи,
+    без него - отправляется отдельным сообщением.
+    """
     try:
         if status_callback:
             await status_callback(log_message)
         logger.info(log_message)
-        await message.answer(log_message)
+        if progress:
+            progress.update(log_message, stage_index)
+        else:
+            await message.answer(log_message)
     except Exception as e:
         logger.error(f"Error updating status: {e}")
 
 
+def job_table() -> str:
+    """Путь общей таблицы задачи относительно каталога задачи (одинаков для всех задач), формат - TABLE_FORMAT."""
+    return os.path.join(JobWorkspace.TABLE_DIR, table_file_name("data", TABLE_FORMAT))
+
+
 def get_processing_stages(
+    workspace: JobWorkspace,
     client_name: Optional[str] = None,
-) -> List[Tuple[str, str, Dict[str, str], str]]:
-    """Генерация этапов обработки (синхронная функция, не требует изменений)."""
-    return [
-        (
+) -> List[Stage]:
+    """Генерация этапов обработки для каталога задачи.
+
+    Пути к данным задачи указываются внутри контейнера (см. JobWorkspace.container),
+    общие ресурсы (маски, шаблон, конфиг) по-прежнему берутся из /app/data.
+    inputs/outputs описывают, какие данные этап читает и пишет: по ним строится
+    граф зависимостей, и независимые этапы выполняются параллельно.
+
+    Формат таблицы этапа передается в TABLE_FORMAT; этап, образ которого понимает
+    другой формат, чем общая таблица задачи, работает со своей копией, которую бот
+    преобразует перед этапом (input_copy) и после него (output_copy).
+    """
+    links_path = workspace.container(JobWorkspace.TABLE_DIR, "links.txt")
+    pic_path = workspace.container(JobWorkspace.PIC_DIR) + "/"
+    output_path = workspace.container(JobWorkspace.OUTPUT_DIR) + "/"
+    table = job_table()
+
+    def stage_table(index: int, image_name: str, writes: bool = False, reads: bool = True, private: Optional[str] = None):
+        """(формат, путь таблицы этапа в контейнере, input_copy, output_copy)."""
+        table_format = stage_table_format(image_name)
+        if table_format == TABLE_FORMAT and not private:
+            return table_format, workspace.container(table), None, None
+        own = os.path.join(JobWorkspace.TABLE_DIR, table_file_name(private or f"data_stage{index}", table_format))
+        return (
+            table_format,
+            workspace.container(own),
+            (table, own) if reads else None,
+            (own, table) if writes else None,
+        )
+
+    parser_format, parser_table, _, parser_copy = stage_table(1, "cian_deep_page_parser", writes=True, reads=False)
+    rewriter_format, rewriter_table, rewriter_input, rewriter_copy = stage_table(2, "rewriter_image", writes=True)
+    # Обработка изображений читает свою копию таблицы, т.к. переписывание текста
+    # параллельно перезаписывает общую таблицу
+    images_format, images_table, images_input, _ = stage_table(3, "image_processor", private="data_images")
+    presentation_format, presentation_table, presentation_input, _ = stage_table(4, "presentation_image")
+    sheet_format, sheet_table, sheet_input, _ = stage_table(5, "sheet_tools_image")
+
+    stages = [
+        Stage(
             "🔄 Этап 1/5: Парсинг данных...",
             "cian_deep_page_parser",
             {
-                "INPUT_PATH": "/app/data/table/links.txt",
-                "OUTPUT_PATH": "/app/data/table/data.csv",
+                "INPUT_PATH": links_path,
+                "OUTPUT_PATH": parser_table,
+                "TABLE_FORMAT": parser_format,
             },
             "✅ Парсинг завершен",
+            index=1,
+            inputs=("links",),
+            outputs=("listings",),
+            # Порт отладки Chrome; порт хоста у каждого контейнера свой, поэтому шарды не конфликтуют
+            ports=(9222,),
+            shard_input="INPUT_PATH",
+            shard_output="OUTPUT_PATH",
+            cache_output="OUTPUT_PATH",
+            table_output="OUTPUT_PATH",
+            output_copy=parser_copy,
         ),
-        (
+        Stage(
             "🔄 Этап 2/5: Переписывание текста...",
             "rewriter_image",
             {
-                "INPUT_PATH": "/app/data/table/data.csv",
+                "INPUT_PATH": rewriter_table,
                 "MAX_SYMBOL": "500",
                 "COLUMN_NAME": "Описание",
+                "TABLE_FORMAT": rewriter_format,
             },
             "✅ Переписывание завершено",
+            index=2,
+            inputs=("listings",),
+            outputs=("descriptions",),
+            input_copy=rewriter_input,
+            table_output="INPUT_PATH",
+            output_copy=rewriter_copy,
         ),
-        (
+        Stage(
             "🔄 Этап 3/5: Обработка изображений...",
             "image_processor",
             {
-                "INPUT_PATH": "/app/data/table/data.csv",
+                "INPUT_PATH": images_table,
                 "MASK_DIR_PATH": "/app/data/mask/",
-                "BASE_IMAGE_DIR_PATH": "/app/data/presentation/pic/",
+                "BASE_IMAGE_DIR_PATH": pic_path,
+                "TABLE_FORMAT": images_format,
             },
             "✅ Обработка таблиц завершена",
+            index=3,
+            inputs=("listings",),
+            outputs=("pictures",),
+            input_copy=images_input,
+            shard_input="INPUT_PATH",
+            cache_output="BASE_IMAGE_DIR_PATH",
         ),
-        (
+        Stage(
             "🔄 Этап 4/5: Создание презентации...",
             "presentation_image",
             {
-                "INPUT_PATH": "/app/data/table/data.csv",
-                "OUTPUT_PATH": "/app/data/presentation/output/",
-                "PIC_PATH": "/app/data/presentation/pic/",
+                "INPUT_PATH": presentation_table,
+                "OUTPUT_PATH": output_path,
+                "PIC_PATH": pic_path,
                 "TEMPLATE_PATH": "/app/data/presentation/template/Упрощенный_белый_шаблон.pptx",
+                "TABLE_FORMAT": presentation_format,
             },
             "✅ Создание презентации завершено",
+            index=4,
+            inputs=("listings", "descriptions", "pictures"),
+            outputs=("presentations",),
+            input_copy=presentation_input,
         ),
-        (
+        Stage(
             "🔄 Этап 5/5: Отправка данных в Google таблицу...",
             "sheet_tools_image",
             {
-                "INPUT_PATH": "/app/data/table/data.csv",
-                "PRESENTATION_PATH": "/app/data/presentation/output/",
+                "INPUT_PATH": sheet_table,
+                "PRESENTATION_PATH": output_path,
                 "CONFIG_PATH": "/app/data/config/config.env",
                 "CLIENT_NAME": client_name,
+                "TABLE_FORMAT": sheet_format,
             },
             "✅ Обработка таблиц завершена",
+            index=5,
+            inputs=("listings", "descriptions", "presentations"),
+            outputs=("sheet",),
+            input_copy=sheet_input,
         ),
     ]
+    return [stage._replace(critical=stage.index in STAGES_OF_PRESENTATION_CREATION) for stage in stages]
+
+
+def stage_images() -> List[str]:
+    """Образы всех этапов конвейера (прогреваются при запуске бота)."""
+    stages = get_processing_stages(JobWorkspace("warm-up"))
+    return list(dict.fromkeys(stage.image_name for stage in stages))
+
+
+def stage_artifacts(stage: Stage, workspace: JobWorkspace) -> List[str]:
+    """Файлы и каталоги задачи, с которыми работал этап (пути относительно каталога задачи)."""
+    artifacts = []
+    for value in stage.environment.values():
+        if isinstance(value, str) and value.startswith(workspace.container_path):
+            host_path = workspace.to_host(value)
+            if os.path.exists(host_path):
+                artifacts.append(os.path.relpath(host_path, workspace.path))
+    return artifacts
+
+
+def prepare_stage_input(stage: Stage, workspace: JobWorkspace):
+    """Создает частную копию входной таблицы этапа (в формате этапа) перед его запуском."""
+    if stage.input_copy:
+        source, target = stage.input_copy
+        copy_table(workspace.host(source), workspace.host(target))
+
+
+def finish_stage_output(stage: Stage, workspace: JobWorkspace):
+    """Переносит таблицу, записанную этапом в своем формате, в общую таблицу задачи."""
+    if stage.output_copy:
+        source, target = stage.output_copy
+        copy_table(workspace.host(source), workspace.host(target))
+
+
+def check_stage_output(stage: Stage, workspace: JobWorkspace) -> List[str]:
+    """Проблемы таблицы, записанной этапом (без полного разбора JSONL)."""
+    if not stage.table_output:
+        return []
+    return inspect_table(workspace.to_host(stage.environment[stage.table_output])).problems
+
+
+def missing_listings(links: List[str], workspace: JobWorkspace) -> List[str]:
+    """Ссылки, по которым в таблице задачи нет строк (объявление не разобрано).
+
+    Пустой список, если таблицы нет или в ней нет колонки со ссылкой - тогда сопоставить нельзя.
+    """
+    try:
+        fieldnames, rows, _ = read_table(workspace.host(job_table()))
+    except (OSError, ValueError) as e:
+        logger.warning(f"Failed to read table of job {workspace.job_id}: {e}")
+        return []
+    if CACHE_LINK_COLUMN not in fieldnames:
+        return []
+    parsed = {normalize_listing_url(str(row.get(CACHE_LINK_COLUMN) or "")) for row in rows}
+    return [link for link in links if normalize_listing_url(link) not in parsed]
+
+
+def shard_links(path: str) -> List[str]:
+    """Ссылки входа шарда: строки файла ссылок или колонка со ссылкой таблицы."""
+    if is_table(path):
+        return [str(row[CACHE_LINK_COLUMN]) for row in read_table(path)[1] if row.get(CACHE_LINK_COLUMN)]
+    with open(path, encoding="utf-8") as file:
+        return [line.strip() for line in file if line.strip()]
+
+
+def record_failed_links(workspace: JobWorkspace, links: List[str]):
+    """Запоминает ссылки упавших шардов в каталоге задачи."""
+    with open(workspace.host(JobWorkspace.TABLE_DIR, FAILED_LINKS_FILE), "a", encoding="utf-8") as file:
+        file.writelines(f"{link}\n" for link in links)
+
+
+def unprocessed_links(links: List[str], workspace: JobWorkspace) -> List[str]:
+    """Ссылки, по которым задача не дала результатов: нет строки в таблице или упал их шард."""
+    try:
+        with open(workspace.host(JobWorkspace.TABLE_DIR, FAILED_LINKS_FILE), encoding="utf-8") as file:
+            failed = {normalize_listing_url(line.strip()) for line in file if line.strip()}
+    except FileNotFoundError:
+        failed = set()
+    missing = set(missing_listings(links, workspace))
+    return [link for link in links if link in missing or normalize_listing_url(link) in failed]
+
+
+def input_items(environment: Dict[str, str], workspace: JobWorkspace) -> int:
+    """Размер входа этапа (ссылок или строк таблицы в INPUT_PATH) - по нему подбираются ограничения ресурсов."""
+    input_path = environment.get("INPUT_PATH")
+    if not input_path:
+        return 0
+    try:
+        return count_items(workspace.to_host(input_path))
+    except (OSError, ValueError) as e:
+        logger.warning(f"Failed to count items in {input_path}: {e}")
+        return 0
+
+
+# Подписчик на строки лога контейнера этапа: получает этап и поток (async for line in stream.lines())
+LogWatcher = Callable[[Stage, LogStream], Awaitable[None]]
+
+
+async def run_stage_container(
+    stage: Stage,
+    workspace: JobWorkspace,
+    environment: Dict[str, str],
+    label: str,
+    log_watcher: Optional[LogWatcher] = None,
+) -> Tuple[str, int]:
+    """Запуск контейнера этапа с потоковой записью логов в файл лога задачи.
+
+    Порты хоста для объявленных этапом портов выделяет оркестратор.
+    """
+    log_stream = LogStream(workspace.log_path, prefix=f"[{label}] ")
+    watcher = asyncio.create_task(log_watcher(stage, log_stream)) if log_watcher else None
+    try:
+        return await orchestrator.run_container(
+            stage.image_name,
+            environment=environment,
+            ports=dict.fromkeys(stage.ports),
+            volumes=workspace.volumes,
+            log_stream=log_stream,
+            items=input_items(environment, workspace),
+        )
+    finally:
+        log_stream.close()
+        if watcher:
+            await asyncio.gather(watcher, return_exceptions=True)
+
+
+async def run_sharded_stage(
+    stage: Stage, workspace: JobWorkspace, log_watcher: Optional[LogWatcher] = None
+) -> Tuple[bool, str, List[int]]:
+    """Выполняет этап в нескольких контейнерах параллельно, по SHARD_SIZE элементов входа.
+
+    Выходная таблица (если есть) собирается из успешных шардов, ошибка шарда
+    теряет только его элементы. Возвращает (успех, логи, номера упавших шардов).
+    """
+    input_path = workspace.to_host(stage.environment[stage.shard_input])
+    shard_count = math.ceil(count_items(input_path) / SHARD_SIZE)
+    shard_dir = workspace.host(JobWorkspace.SHARDS_DIR, f"stage{stage.index}")
+    os.makedirs(shard_dir, exist_ok=True)
+
+    extension = os.path.splitext(input_path)[1]
+    shard_inputs = split_file(
+        input_path,
+        [os.path.join(shard_dir, f"{n}_input{extension}") for n in range(1, shard_count + 1)],
+        SHARD_SIZE,
+    )
+    output_extension = os.path.splitext(stage.environment[stage.shard_output])[1] if stage.shard_output else ".csv"
+    shard_outputs = [os.path.join(shard_dir, f"{n}_output{output_extension}") for n in range(1, len(shard_inputs) + 1)]
+    semaphore = asyncio.Semaphore(SHARD_CONCURRENCY)
+
+    async def run_shard(number: int, shard_input: str, shard_output: str) -> Tuple[bool, str]:
+        environment = dict(stage.environment)
+        environment[stage.shard_input] = workspace.to_container(shard_input)
+        if stage.shard_output:
+            environment[stage.shard_output] = workspace.to_container(shard_output)
+        async with semaphore:
+            try:
+                logs, exit_code = await run_stage_container(
+                    stage, workspace, environment, f"{stage.index}.{number}:{stage.image_name}", log_watcher=log_watcher
+                )
+            except Exception as e:
+                logger.error(f"Shard {shard_input} of stage {stage.index} failed: {e}")
+                return False, str(e)
+        return exit_code == 0, logs
+
+    logger.info(f"Stage {stage.index} ({stage.image_name}) split into {len(shard_inputs)} shards")
+    results = await asyncio.gather(
+        *(run_shard(n, i, o) for n, (i, o) in enumerate(zip(shard_inputs, shard_outputs), start=1))
+    )
+
+    failed = [n for n, (success, _) in enumerate(results, start=1) if not success]
+    if failed:
+        try:
+            record_failed_links(workspace, [link for n in failed for link in shard_links(shard_inputs[n - 1])])
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to record links of failed shards of stage {stage.index}: {e}")
+    if stage.shard_output and len(failed) < len(results):
+        rows = merge_tables(
+            [o for o, (success, _) in zip(shard_outputs, results) if success],
+            workspace.to_host(stage.environment[stage.shard_output]),
+        )
+        logger.info(f"Stage {stage.index}: merged {rows} rows from {len(results) - len(failed)} shards")
+
+    logs = "\n".join(shard_logs for _, shard_logs in results)
+    return len(failed) < len(results), logs, failed
+
+
+async def execute_stage(
+    stage: Stage, message: Message, workspace: JobWorkspace, log_watcher: Optional[LogWatcher] = None
+) -> Tuple[bool, str]:
+    """Запуск контейнера(ов) этапа: одним контейнером или по шардам, если вход большой."""
+    if stage.shard_input and count_items(workspace.to_host(stage.environment[stage.shard_input])) > SHARD_SIZE:
+        success, logs, failed_shards = await run_sharded_stage(stage, workspace, log_watcher)
+        if failed_shards:
+            await message.answer(
+                f"⚠️ Этап {stage.index}: части {', '.join(map(str, failed_shards))} "
+                f"(по {SHARD_SIZE} ссылок) завершились с ошибкой и будут пропущены."
+            )
+        return success, logs
+
+    # Асинхронный запуск контейнера
+    logs, exit_code = await run_stage_container(
+        stage,
+        workspace,
+        stage.environment,
+        f"{stage.index}:{stage.image_name}",
+        log_watcher=log_watcher,
+    )
+    if exit_code != 0:
+        logger.error(f"Stage {stage.index} exited with code {exit_code}")
+    return exit_code == 0, logs
 
 
 async def process_stage(
-    stage_info: Tuple[str, str, Dict[str, str], str],
+    stage: Stage,
     message: Message,
     status_callback: Callable[[str], None],
+    workspace: JobWorkspace,
+    log_watcher: Optional[LogWatcher] = None,
+    progress: Optional[ProgressReporter] = None,
 ) -> Tuple[bool, str]:
-    """Асинхронная обработка одного этапа."""
-    start_message, image_name, environment, end_message = stage_info
+    """Асинхронная обработка одного этапа.
 
+    Возвращает (успех, последние строки лога); полный лог - в файле лога задачи.
+    """
+    started = time.monotonic()
+    success = False
     try:
-        await update_status(message, start_message, status_callback)
+        await update_status(message, stage.start_message, status_callback, progress, stage.index)
 
-        # Асинхронный запуск контейнера
-        logs, exit_code = await orchestrator.run_container(
-            image_name, environment=environment,  ports={9222: 9223}
-        )
+        if CACHE_ENABLED and stage.cache_output:
+            # В контейнеры уходят только объявления, которых нет в кэше
+            success, logs = await run_cached_stage(
+                stage, workspace, lambda pending: execute_stage(pending, message, workspace, log_watcher)
+            )
+        else:
+            success, logs = await execute_stage(stage, message, workspace, log_watcher)
 
-        if exit_code != 0:
-            error_msg = f"Этап завершился с ошибкой (код {exit_code})"
+        problems = check_stage_output(stage, workspace) if success else []
+        if problems:
+            logger.error(f"Stage {stage.index} produced an invalid table: {'; '.join(problems)}")
+            success, logs = False, f"{logs}\nНекорректная таблица этапа: {'; '.join(problems)}"
+
+        if not success:
             await message.answer(f"```\n{logs[-4000:]}\n```", parse_mode="MarkdownV2")
             return False, logs
 
-        await update_status(message, end_message, status_callback)
+        finish_stage_output(stage, workspace)
+
+        await update_status(message, stage.end_message, status_callback, progress, stage.index)
         return True, logs
 
     except Exception as e:
         logger.error(f"Stage error: {e}", exc_info=True)
         return False, str(e)
 
+    finally:
+        STAGE_DURATION.observe(
+            time.monotonic() - started,
+            stage=stage.index,
+            image=stage.image_name,
+            status="success" if success else "failed",
+        )
+
 
 async def process_links_with_orchestrator(
     links: List[str],
     message: Message,
     client_name: Optional[str] = None,
     status_callback: Optional[Callable[[str], None]] = None,
-) -> bool:
-    """Асинхронная обработка всех этапов."""
+    workspace: Optional[JobWorkspace] = None,
+    manifest: Optional[JobManifest] = None,
+    log_watcher: Optional[LogWatcher] = None,
+    progress: Optional[ProgressReporter] = None,
+) -> Optional[List[str]]:
+    """Асинхронная обработка всех этапов.
+
+    Если передан манифест задачи, завершение каждого этапа сохраняется в нем,
+    а этапы, уже выполненные в прошлом запуске, повторно не запускаются.
+    log_watcher получает поток строк лога каждого запущенного контейнера
+    (по умолчанию - progress, который переносит прогресс из логов в сообщение статуса).
+
+    Возвращает список файлов презентаций, созданных этой задачей,
+    или None, если обработка завершилась ошибкой.
+    """
+    workspace = workspace or JobWorkspace()
+    if progress and not log_watcher:
+        log_watcher = progress.watch
     try:
-        await save_links_to_file(links)
-        stages = get_processing_stages(client_name)
-        logs = []
+        workspace.create()
+        await save_links_to_file(links, workspace)
+        stages = get_processing_stages(workspace, client_name)
+        completed = set(manifest.completed_stages(STAGE_DONE)) if manifest else set()
 
-        await update_status(message, "📝 Начало обработки ссылок...", status_callback)
+        if completed:
+            await update_status(
+                message, f"♻️ Продолжаю задачу: этапы {', '.join(map(str, sorted(completed)))} уже выполнены", status_callback, progress
+            )
+        else:
+            await update_status(message, "📝 Начало обработки ссылок...", status_callback, progress)
 
-        for stage_index, stage_info in enumerate(stages, start=1):
+        async def run_stage(stage: Stage) -> Tuple[bool, str]:
             success, stage_logs = await process_stage(
-                stage_info, message, status_callback
+                stage, message, status_callback, workspace, log_watcher, progress
             )
-            logs.append(stage_logs)
-
+            if manifest:
+                manifest.mark_stage(stage.index, STAGE_DONE if success else STAGE_FAILED, stage_artifacts(stage, workspace))
             if not success:
-                error_msg = f"Ошибка на этапе {stage_index}: {stage_info[0]}"
+                error_msg = f"Ошибка на этапе {stage.index}: {stage.start_message}"
                 await handle_error(Exception(error_msg), message, status_callback)
+            return success, stage_logs
 
-                if stage_index not in STAGES_OF_PRESENTATION_CREATION:
-                    return True
-                return False
+        async def skip_stage(stage: Stage):
+            if manifest:
+                manifest.mark_stage(stage.index, STAGE_SKIPPED, [])
+            await update_status(
+                message,
+                f"⏭ Этап {stage.index}/{len(stages)} пропущен из-за ошибки на предыдущем этапе",
+                status_callback,
+                progress,
+                stage.index,
+            )
 
-        await update_status(
-            message, "🎉 Все процессы успешно завершены!", status_callback
+        results = await run_stage_graph(
+            stages,
+            run_stage,
+            prepare=lambda stage: prepare_stage_input(stage, workspace),
+            on_skip=skip_stage,
+            completed=completed,
         )
-        return True
+
+        if any(results[stage.index][0] != STAGE_DONE for stage in stages if stage.critical):
+            return None
+
+        if all(state == STAGE_DONE for state, _ in results.values()):
+            await update_status(
+                message, "🎉 Все процессы успешно завершены!", status_callback, progress
+            )
+        return workspace.list_outputs()
 
     except Exception as e:
         await handle_error(e, message, status_callback)
-        return False
+        return None
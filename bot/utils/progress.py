@@ -0,0 +1,197 @@
+import re
+import time
+import asyncio
+import logging
+from typing import Dict, Optional, Tuple
+
+from aiogram.types import Message
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from bot.config.config import TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE, TELEGRAM_GROUP_RATE
+from bot.utils.log_stream import LogStream
+from bot.utils.stage_graph import Stage
+
+logger = logging.getLogger(__name__)
+
+# Строки прогресса, которые печатают контейнеры этапов: "processed 12/40", "обработано 12 из 40"
+PROGRESS_REGEX = re.compile(
+    r"(?:processed|progress|обработано)\D{0,3}(\d+)\s*(?:/|из|of)\s*(\d+)",
+    re.IGNORECASE,
+)
+
+
+def parse_progress(line: str) -> Optional[Tuple[int, int]]:
+    """Извлекает (сделано, всего) из строки лога или None."""
+    match = PROGRESS_REGEX.search(line)
+    if not match:
+        return None
+    done, total = int(match.group(1)), int(match.group(2))
+    return (min(done, total), total) if total > 0 else None
+
+
+class TokenBucket:
+    """Ведро токенов: не больше rate операций в секунду с запасом capacity."""
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """Сколько ждать до появления токена (0 - токен есть)."""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self._refill()
+        self.tokens -= 1
+
+    @property
+    def is_full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class TelegramRateLimiter:
+    """Общий для всех чатов ограничитель: глобальный лимит бота и лимит на каждый чат."""
+
+    def __init__(
+        self,
+        global_rate: float = TELEGRAM_GLOBAL_RATE,
+        chat_rate: float = TELEGRAM_CHAT_RATE,
+        group_rate: float = TELEGRAM_GROUP_RATE,
+    ):
+        self.global_bucket = TokenBucket(global_rate, capacity=global_rate)
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_buckets: Dict[int, TokenBucket] = {}
+        self._lock = asyncio.Lock()
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        if chat_id not in self.chat_buckets:
+            if len(self.chat_buckets) > 1000:
+                # Полные ведра ничего не помнят - их можно выбросить
+                self.chat_buckets = {cid: b for cid, b in self.chat_buckets.items() if not b.is_full}
+            # У групп и каналов отрицательные id
+            rate = self.group_rate if chat_id < 0 else self.chat_rate
+            self.chat_buckets[chat_id] = TokenBucket(rate)
+        return self.chat_buckets[chat_id]
+
+    async def acquire(self, chat_id: int):
+        """Дожидается права отправить одно сообщение в чат."""
+        while True:
+            async with self._lock:
+                chat_bucket = self._chat_bucket(chat_id)
+                delay = max(chat_bucket.delay(), self.global_bucket.delay())
+                if delay == 0:
+                    chat_bucket.consume()
+                    self.global_bucket.consume()
+                    return
+            await asyncio.sleep(delay)
+
+
+# Создание глобального экземпляра
+telegram_rate_limiter = TelegramRateLimiter()
+
+
+class ProgressReporter:
+    """Одно редактируемое сообщение со статусом задачи.
+
+    Изменения статуса этапов и прогресс из логов контейнеров накапливаются,
+    а сообщение редактируется не чаще, чем позволяет общий ограничитель.
+    """
+
+    def __init__(self, message: Message, limiter: TelegramRateLimiter = telegram_rate_limiter):
+        self.message = message
+        self.limiter = limiter
+        self.status_message: Optional[Message] = None
+        self.header = ""
+        self.footer = ""
+        self.stages: Dict[int, str] = {}
+        self.progress: Dict[int, Dict[int, Tuple[int, int]]] = {}
+        self._sent_text = ""
+        self._dirty = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> "ProgressReporter":
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return self
+
+    def update(self, text: str, stage_index: Optional[int] = None):
+        """Новый статус этапа (или задачи в целом, если этап не указан)."""
+        if stage_index is not None:
+            self.stages[stage_index] = text
+            self.progress.pop(stage_index, None)
+        elif not self.header:
+            self.header = text
+        else:
+            self.footer = text
+        self._dirty.set()
+
+    async def watch(self, stage: Stage, log_stream: LogStream):
+        """Подписчик на лог контейнера: переносит строки прогресса в статус этапа."""
+        async for line in log_stream.lines():
+            parsed = parse_progress(line)
+            if parsed:
+                self.progress.setdefault(stage.index, {})[id(log_stream)] = parsed
+                self._dirty.set()
+
+    def render(self) -> str:
+        lines = [self.header] if self.header else []
+        for index in sorted(self.stages):
+            line = self.stages[index]
+            shards = self.progress.get(index)
+            if shards:
+                done = sum(d for d, _ in shards.values())
+                total = sum(t for _, t in shards.values())
+                line += f" {done}/{total}"
+            lines.append(line)
+        if self.footer:
+            lines.append(self.footer)
+        return "\n".join(lines)
+
+    async def _send(self):
+        text = self.render()
+        if not text or text == self._sent_text:
+            return
+        await self.limiter.acquire(self.message.chat.id)
+        try:
+            if self.status_message is None:
+                self.status_message = await self.message.answer(text)
+            else:
+                await self.status_message.edit_text(text)
+            self._sent_text = text
+        except TelegramRetryAfter as e:
+            logger.warning(f"Flood control on status message, retry in {e.retry_after}s")
+            await asyncio.sleep(e.retry_after)
+            self._dirty.set()
+        except TelegramBadRequest as e:
+            # "message is not modified" и подобные - не повод останавливать отчет
+            logger.warning(f"Status message was not updated: {e}")
+
+    async def _run(self):
+        while True:
+            await self._dirty.wait()
+            self._dirty.clear()
+            try:
+                await self._send()
+            except Exception as e:
+                logger.error(f"Error updating status message: {e}")
+
+    async def close(self):
+        """Отправляет последнее состояние и останавливает обновления."""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await self._send()
+        except Exception as e:
+            logger.error(f"Error updating status message: {e}")
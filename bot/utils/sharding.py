@@ -0,0 +1,51 @@
+import os
+import logging
+from typing import Dict, List
+
+from bot.utils.table_format import is_table, read_table, write_table
+
+logger = logging.getLogger(__name__)
+
+
+def count_items(path: str) -> int:
+    """Количество элементов, по которым можно шардировать файл (ссылок или строк таблицы)."""
+    if is_table(path):
+        return len(read_table(path)[1])
+    with open(path, encoding="utf-8") as file:
+        return sum(1 for line in file if line.strip())
+
+
+def split_file(path: str, shard_paths: List[str], shard_size: int) -> List[str]:
+    """Делит файл ссылок (.txt) или таблицу (.csv, .jsonl) на шарды по shard_size элементов.
+
+    Возвращает пути созданных шардов (не больше len(shard_paths)).
+    """
+    if is_table(path):
+        fieldnames, rows, delimiter = read_table(path)
+        chunks = [rows[i:i + shard_size] for i in range(0, len(rows), shard_size)]
+        for shard_path, chunk in zip(shard_paths, chunks):
+            write_table(shard_path, fieldnames, chunk, delimiter)
+    else:
+        with open(path, encoding="utf-8") as file:
+            lines = [line.strip() for line in file if line.strip()]
+        chunks = [lines[i:i + shard_size] for i in range(0, len(lines), shard_size)]
+        for shard_path, chunk in zip(shard_paths, chunks):
+            with open(shard_path, "w", encoding="utf-8") as file:
+                file.write("\n".join(chunk))
+    return shard_paths[:len(chunks)]
+
+
+def merge_tables(shard_paths: List[str], target_path: str) -> int:
+    """Объединяет таблицы шардов (отсутствующие пропускаются) в таблицу формата target_path. Возвращает число строк."""
+    fieldnames: List[str] = []
+    rows: List[Dict[str, str]] = []
+    delimiter = ","
+    for shard_path in shard_paths:
+        if not os.path.isfile(shard_path):
+            logger.warning(f"Shard output {shard_path} is missing, skipping")
+            continue
+        shard_fields, shard_rows, delimiter = read_table(shard_path)
+        fieldnames.extend(name for name in shard_fields if name not in fieldnames)
+        rows.extend(shard_rows)
+    write_table(target_path, fieldnames, rows, delimiter)
+    return len(rows)
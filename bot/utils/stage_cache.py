@@ -0,0 +1,183 @@
+import os
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from bot.cache import listing_cache, listing_id, normalize_listing_url
+from bot.config.config import CACHE_LINK_COLUMN
+from bot.orchestrator import orchestrator
+from bot.utils.table_format import read_table, write_table
+from bot.utils.stage_graph import Stage
+from bot.utils.workspace import JobWorkspace
+
+logger = logging.getLogger(__name__)
+
+StageRunner = Callable[[Stage], Awaitable[Tuple[bool, str]]]
+
+
+def _pending_path(path: str) -> str:
+    """Путь для входа/выхода, содержащего только промахи кэша."""
+    base, extension = os.path.splitext(path)
+    return f"{base}_pending{extension}"
+
+
+def _row_link(row: Dict[str, str]) -> str:
+    return normalize_listing_url(row.get(CACHE_LINK_COLUMN) or "")
+
+
+def _read_links(path: str) -> List[str]:
+    with open(path, encoding="utf-8") as file:
+        return [line.strip() for line in file if line.strip()]
+
+
+def _write_links(path: str, links: List[str]):
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("\n".join(links))
+
+
+def _failed_misses_note(stage: Stage, failed: int, hits: int) -> str:
+    """Сообщение о промахах, которые этап не обработал, хотя часть объявлений взята из кэша."""
+    logger.warning(f"Stage {stage.index} ({stage.image_name}): {failed} uncached items failed, {hits} taken from cache")
+    return f"\nЭтап {stage.index}: не обработано объявлений вне кэша - {failed} (из кэша взято {hits})"
+
+
+async def run_cached_stage(stage: Stage, workspace: JobWorkspace, run: StageRunner) -> Tuple[bool, str]:
+    """Выполняет этап только для объявлений, которых нет в кэше, остальное берет из кэша.
+
+    Если выход этапа - таблица (парсинг), кэшируются строки по ссылкам из входного файла.
+    Если выход - каталог (изображения), кэшируются файлы, относящиеся к строкам входной таблицы.
+    Если этап не обработал промахи, он считается неуспешным, даже когда часть объявлений
+    взята из кэша: следующие этапы не должны молча работать с неполными данными.
+    Файловые операции (кэш и таблицы) выполняются вне цикла событий.
+    """
+    version = await orchestrator.image_version(stage.image_name)
+    input_path = workspace.to_host(stage.environment[stage.shard_input])
+    output = stage.environment[stage.cache_output]
+
+    def cache_key(url: str) -> str:
+        return listing_cache.key(url, stage.image_name, version, stage.environment)
+
+    if output.endswith("/"):
+        return await _run_cached_files(stage, workspace, run, input_path, workspace.to_host(output), cache_key)
+    return await _run_cached_rows(stage, workspace, run, input_path, workspace.to_host(output), cache_key)
+
+
+async def _run_cached_rows(stage, workspace, run, input_path, output_path, cache_key) -> Tuple[bool, str]:
+    links = await asyncio.to_thread(_read_links, input_path)
+
+    def read_cached() -> Dict[str, List[Dict[str, str]]]:
+        found = {}
+        for link in links:
+            rows = listing_cache.get_rows(cache_key(link), stage.image_name)
+            if rows is not None:
+                found[normalize_listing_url(link)] = rows
+        hits = sum(normalize_listing_url(link) in found for link in links)
+        listing_cache.log_stats(stage.image_name, hits, len(links) - hits)
+        return found
+
+    cached = await asyncio.to_thread(read_cached)
+    misses = [link for link in links if normalize_listing_url(link) not in cached]
+
+    fieldnames: List[str] = []
+    fresh: Dict[str, List[Dict[str, str]]] = {}
+    unmatched: List[Dict[str, str]] = []
+    logs, success, delimiter = "", True, ","
+
+    if misses:
+        pending_input, pending_output = _pending_path(input_path), _pending_path(output_path)
+        await asyncio.to_thread(_write_links, pending_input, misses)
+        environment = dict(stage.environment)
+        environment[stage.shard_input] = workspace.to_container(pending_input)
+        environment[stage.cache_output] = workspace.to_container(pending_output)
+        success, logs = await run(stage._replace(environment=environment))
+
+        if os.path.isfile(pending_output):
+            fieldnames, rows, delimiter = await asyncio.to_thread(read_table, pending_output)
+            miss_urls = {normalize_listing_url(link) for link in misses}
+            for row in rows:
+                url = _row_link(row)
+                if url in miss_urls:
+                    fresh.setdefault(url, []).append(row)
+                elif len(misses) == 1:
+                    # Без колонки со ссылкой строки единственной ссылки однозначно её
+                    fresh.setdefault(normalize_listing_url(misses[0]), []).append(row)
+                else:
+                    unmatched.append(row)
+            if unmatched:
+                logger.warning(
+                    f"{len(unmatched)} rows have no '{CACHE_LINK_COLUMN}' column value and won't be cached"
+                )
+            if success:
+                def store_fresh():
+                    for url, url_rows in fresh.items():
+                        listing_cache.put_rows(cache_key(url), url, url_rows)
+                await asyncio.to_thread(store_fresh)
+
+    if not success:
+        return False, logs + (_failed_misses_note(stage, len(misses), len(links) - len(misses)) if cached else "")
+
+    # Порядок строк - как в исходном списке ссылок
+    ordered = []
+    for link in links:
+        url = normalize_listing_url(link)
+        ordered.extend(cached.get(url) or fresh.get(url) or [])
+    ordered.extend(unmatched)
+    for rows in cached.values():
+        for row in rows:
+            fieldnames.extend(name for name in row if name not in fieldnames)
+    await asyncio.to_thread(write_table, output_path, fieldnames, ordered, delimiter)
+    return True, logs
+
+
+async def _run_cached_files(stage, workspace, run, input_path, output_dir, cache_key) -> Tuple[bool, str]:
+    fieldnames, rows, delimiter = await asyncio.to_thread(read_table, input_path)
+    os.makedirs(output_dir, exist_ok=True)
+
+    def copy_cached() -> List[Dict[str, str]]:
+        missing = [
+            row for row in rows
+            if not row.get(CACHE_LINK_COLUMN)
+            or listing_cache.get_files(cache_key(_row_link(row)), stage.image_name, output_dir) is None
+        ]
+        listing_cache.log_stats(stage.image_name, len(rows) - len(missing), len(missing))
+        return missing
+
+    missing_rows = await asyncio.to_thread(copy_cached)
+    hits = len(rows) - len(missing_rows)
+
+    if not missing_rows:
+        return True, ""
+
+    pending_input = _pending_path(input_path)
+    await asyncio.to_thread(write_table, pending_input, fieldnames, missing_rows, delimiter)
+    before = set(os.listdir(output_dir))
+    environment = dict(stage.environment)
+    environment[stage.shard_input] = workspace.to_container(pending_input)
+    success, logs = await run(stage._replace(environment=environment))
+
+    # Файлы относим к объявлению по номеру в имени файла (или целиком, если строка одна)
+    produced = sorted(
+        name for name in set(os.listdir(output_dir)) - before
+        if os.path.isfile(os.path.join(output_dir, name))
+    )
+
+    def store_produced():
+        for row in missing_rows if success else []:
+            if not row.get(CACHE_LINK_COLUMN):
+                continue
+            number = listing_id(row[CACHE_LINK_COLUMN])
+            if len(missing_rows) == 1:
+                files = produced
+            else:
+                files = [name for name in produced if number and number in name]
+            if files:
+                listing_cache.put_files(
+                    cache_key(row[CACHE_LINK_COLUMN]),
+                    row[CACHE_LINK_COLUMN],
+                    [os.path.join(output_dir, name) for name in files],
+                )
+    await asyncio.to_thread(store_produced)
+
+    if not success and hits:
+        logs += _failed_misses_note(stage, len(missing_rows), hits)
+    return success, logs
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Итоговые состояния этапа
+STAGE_DONE = "done"
+STAGE_FAILED = "failed"
+STAGE_SKIPPED = "skipped"
+
+
+class Stage(NamedTuple):
+    """Этап обработки: образ, его окружение и объявленные входы/выходы."""
+
+    start_message: str
+    image_name: str
+    environment: Dict[str, str]
+    end_message: str
+    index: int
+    inputs: Tuple[str, ...] = ()
+    outputs: Tuple[str, ...] = ()
+    critical: bool = True
+    # Порты контейнера, которые нужно опубликовать на хосте (порт хоста выделяет оркестратор)
+    ports: Tuple[int, ...] = ()
+    # Частная копия входного файла (исходный, копия - относительно каталога задачи),
+    # которую этап читает, пока параллельный этап переписывает оригинал
+    input_copy: Optional[Tuple[str, str]] = None
+    # Переменная окружения с входным файлом, который можно делить на шарды,
+    # и переменная с выходной таблицей, которую нужно собрать из шардов
+    shard_input: Optional[str] = None
+    shard_output: Optional[str] = None
+    # Переменная с выходом (таблица или каталог), результаты в котором кэшируются по объявлениям
+    cache_output: Optional[str] = None
+    # Переменная с таблицей, которую этап пишет: после успеха она проверяется (есть, не пуста)
+    table_output: Optional[str] = None
+    # Перенос таблицы этапа в общую таблицу задачи после успеха (исходный, целевой - относительно
+    # каталога задачи), если этап работает с таблицей в другом формате
+    output_copy: Optional[Tuple[str, str]] = None
+
+
+def build_dependencies(stages: List[Stage]) -> Dict[int, Set[int]]:
+    """Строит зависимости по объявленным артефактам.
+
+    Этап зависит от более раннего, если читает то, что тот пишет, пишет то, что тот читает,
+    или пишет тот же артефакт. Порядок в списке задает порядок при конфликте.
+    """
+    dependencies = {stage.index: set() for stage in stages}
+    for position, stage in enumerate(stages):
+        for earlier in stages[:position]:
+            if (
+                set(stage.inputs) & set(earlier.outputs)
+                or set(stage.outputs) & set(earlier.inputs)
+                or set(stage.outputs) & set(earlier.outputs)
+            ):
+                dependencies[stage.index].add(earlier.index)
+    return dependencies
+
+
+async def run_stage_graph(
+    stages: List[Stage],
+    run_stage: Callable[[Stage], Awaitable[Tuple[bool, str]]],
+    prepare: Optional[Callable[[Stage], None]] = None,
+    on_skip: Optional[Callable[[Stage], Awaitable[None]]] = None,
+    completed: Optional[Set[int]] = None,
+) -> Dict[int, Tuple[str, str]]:
+    """Выполняет этапы с учетом зависимостей, независимые - параллельно.
+
+    run_stage возвращает (успех, логи). prepare вызывается синхронно для всех этапов,
+    ставших готовыми, до запуска любого из них. Ошибка этапа пропускает только
+    зависящие от него этапы. completed - этапы, выполненные ранее (контрольные точки):
+    они не запускаются повторно, если не перезапускается ни одна из их зависимостей.
+    Возвращает {index: (состояние, логи)}.
+    """
+    dependencies = build_dependencies(stages)
+    results: Dict[int, Tuple[str, str]] = {}
+    for stage in stages:
+        if stage.index in (completed or ()) and all(results.get(dep, ("",))[0] == STAGE_DONE for dep in dependencies[stage.index]):
+            results[stage.index] = (STAGE_DONE, "")
+            logger.info(f"Stage {stage.index} ({stage.image_name}) restored from checkpoint")
+    pending = {stage.index: stage for stage in stages if stage.index not in results}
+    running: Dict[asyncio.Task, Stage] = {}
+
+    try:
+        while pending or running:
+            # Этапы, у которых упала или пропущена зависимость, пропускаем (рекурсивно)
+            blocked = True
+            while blocked:
+                blocked = [
+                    stage for stage in pending.values()
+                    if any(results.get(dep, ("",))[0] in (STAGE_FAILED, STAGE_SKIPPED) for dep in dependencies[stage.index])
+                ]
+                for stage in blocked:
+                    del pending[stage.index]
+                    results[stage.index] = (STAGE_SKIPPED, "")
+                    logger.warning(f"Stage {stage.index} ({stage.image_name}) skipped: dependency failed")
+                    if on_skip:
+                        await on_skip(stage)
+
+            ready = [
+                stage for stage in pending.values()
+                if all(results.get(dep, ("",))[0] == STAGE_DONE for dep in dependencies[stage.index])
+            ]
+            for stage in ready:
+                del pending[stage.index]
+                if prepare:
+                    prepare(stage)
+            for stage in ready:
+                running[asyncio.create_task(run_stage(stage))] = stage
+
+            if not running:
+                break
+
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                stage = running.pop(task)
+                try:
+                    success, logs = task.result()
+                except Exception as e:
+                    logger.error(f"Stage {stage.index} ({stage.image_name}) raised: {e}", exc_info=True)
+                    success, logs = False, str(e)
+                results[stage.index] = (STAGE_DONE if success else STAGE_FAILED, logs)
+    finally:
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+
+    return results
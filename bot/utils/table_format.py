@@ -0,0 +1,225 @@
+import csv
+import os
+import json
+import shutil
+import logging
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from bot.config.config import TABLE_FORMAT, STAGE_TABLE_FORMATS
+
+logger = logging.getLogger(__name__)
+
+# Форматы промежуточной таблицы задачи
+FORMAT_CSV = "csv"
+FORMAT_JSONL = "jsonl"
+TABLE_FORMATS = (FORMAT_CSV, FORMAT_JSONL)
+TABLE_EXTENSIONS = tuple(f".{name}" for name in TABLE_FORMATS)
+
+# Кодировка чтения таблиц: utf-8-sig понимает и файлы с BOM, и без него
+CSV_READ_ENCODING = "utf-8-sig"
+CSV_WRITE_ENCODING = "utf-8"
+
+# Версия схемы JSONL таблицы (первая строка файла: {"schema": {...}})
+SCHEMA_VERSION = 1
+# Каталог рядом с JSONL таблицей, куда этап может дописывать колонки, не переписывая таблицу
+COLUMNS_SUFFIX = ".columns"
+
+
+class TableInfo(NamedTuple):
+    """Результат дешевой проверки таблицы: число строк, колонки и найденные проблемы."""
+
+    rows: int
+    columns: List[str]
+    problems: List[str]
+
+
+def table_format(path: str) -> str:
+    """Формат таблицы по расширению файла."""
+    return FORMAT_JSONL if path.endswith(".jsonl") else FORMAT_CSV
+
+
+def is_table(path: str) -> bool:
+    return path.endswith(TABLE_EXTENSIONS)
+
+
+def table_file_name(name: str, format_name: str) -> str:
+    return f"{name}.{format_name}"
+
+
+def stage_table_format(image_name: str) -> str:
+    """Формат таблицы, который понимает образ этапа (STAGE_TABLE_FORMATS, по умолчанию TABLE_FORMAT)."""
+    value = STAGE_TABLE_FORMATS.get(image_name, TABLE_FORMAT)
+    if value not in TABLE_FORMATS:
+        logger.warning(f"Unknown table format {value!r} for {image_name}, using {FORMAT_CSV}")
+        return FORMAT_CSV
+    return value
+
+
+def detect_delimiter(path: str) -> str:
+    """Определяет разделитель CSV по первой строке (по умолчанию - запятая)."""
+    with open(path, encoding=CSV_READ_ENCODING, newline="") as file:
+        header = file.readline()
+    try:
+        return csv.Sniffer().sniff(header, delimiters=",;\t").delimiter
+    except csv.Error:
+        return ","
+
+
+def read_csv(path: str) -> Tuple[List[str], List[Dict[str, str]], str]:
+    """Читает CSV целиком: (заголовок, строки, разделитель)."""
+    delimiter = detect_delimiter(path)
+    with open(path, encoding=CSV_READ_ENCODING, newline="") as file:
+        reader = csv.DictReader(file, delimiter=delimiter)
+        rows = list(reader)
+        return list(reader.fieldnames or []), rows, delimiter
+
+
+def write_csv(path: str, fieldnames: List[str], rows: List[Dict[str, str]], delimiter: str = ","):
+    """Записывает CSV через временный файл, чтобы читатели не увидели недописанную таблицу."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding=CSV_WRITE_ENCODING, newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=fieldnames, delimiter=delimiter, extrasaction="ignore", lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(tmp_path, path)
+
+
+def _schema(line: str) -> Optional[Dict[str, Any]]:
+    """Схема из строки заголовка JSONL или None, если это строка данных."""
+    record = json.loads(line)
+    if isinstance(record, dict) and set(record) == {"schema"}:
+        return record["schema"]
+    return None
+
+
+def _read_jsonl_file(path: str) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """Колонки и строки одного JSONL файла. Заголовок со схемой необязателен - без него колонки берутся из строк."""
+    fieldnames: List[str] = []
+    rows: List[Dict[str, Any]] = []
+    with open(path, encoding="utf-8") as file:
+        for number, line in enumerate(file):
+            if not line.strip():
+                continue
+            if number == 0:
+                schema = _schema(line)
+                if schema is not None:
+                    fieldnames = list(schema.get("columns", []))
+                    continue
+            row = json.loads(line)
+            fieldnames.extend(name for name in row if name not in fieldnames)
+            rows.append(row)
+    return fieldnames, rows
+
+
+def column_files(path: str) -> List[str]:
+    """Файлы дописанных колонок JSONL таблицы в порядке применения."""
+    columns_dir = path + COLUMNS_SUFFIX
+    if not os.path.isdir(columns_dir):
+        return []
+    return [os.path.join(columns_dir, name) for name in sorted(os.listdir(columns_dir)) if name.endswith(".jsonl")]
+
+
+def read_jsonl(path: str) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """Читает JSONL таблицу вместе с дописанными колонками (поздние файлы перекрывают ранние)."""
+    fieldnames, rows = _read_jsonl_file(path)
+    for columns_path in column_files(path):
+        names, values = _read_jsonl_file(columns_path)
+        if len(values) != len(rows):
+            raise ValueError(f"{columns_path}: {len(values)} rows, table has {len(rows)}")
+        fieldnames.extend(name for name in names if name not in fieldnames)
+        for row, update in zip(rows, values):
+            row.update(update)
+    return fieldnames, rows
+
+
+def _dump_jsonl(path: str, fieldnames: List[str], rows: List[Dict[str, Any]]):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        file.write(json.dumps({"schema": {"version": SCHEMA_VERSION, "columns": fieldnames}}, ensure_ascii=False) + "\n")
+        for row in rows:
+            file.write(json.dumps({name: row.get(name) for name in fieldnames if name in row}, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, path)
+
+
+def write_jsonl(path: str, fieldnames: List[str], rows: List[Dict[str, Any]]):
+    """Записывает JSONL таблицу целиком; дописанные ранее колонки уже вошли в rows и удаляются."""
+    _dump_jsonl(path, fieldnames, rows)
+    shutil.rmtree(path + COLUMNS_SUFFIX, ignore_errors=True)
+
+
+def append_columns(path: str, name: str, fieldnames: List[str], values: List[Dict[str, Any]]):
+    """Дописывает (или заменяет) колонки JSONL таблицы отдельным файлом, не переписывая её.
+
+    values - по одной записи на строку таблицы, в том же порядке.
+    """
+    columns_dir = path + COLUMNS_SUFFIX
+    os.makedirs(columns_dir, exist_ok=True)
+    _dump_jsonl(os.path.join(columns_dir, f"{name}.jsonl"), fieldnames, values)
+
+
+def read_table(path: str) -> Tuple[List[str], List[Dict[str, Any]], str]:
+    """Читает таблицу любого формата: (колонки, строки, разделитель CSV)."""
+    if table_format(path) == FORMAT_JSONL:
+        return (*read_jsonl(path), ",")
+    return read_csv(path)
+
+
+def write_table(path: str, fieldnames: List[str], rows: List[Dict[str, Any]], delimiter: str = ","):
+    """Записывает таблицу в формате по расширению path."""
+    if table_format(path) == FORMAT_JSONL:
+        write_jsonl(path, fieldnames, rows)
+    else:
+        write_csv(path, fieldnames, rows, delimiter)
+
+
+def copy_table(source: str, target: str):
+    """Копирует таблицу, при необходимости преобразуя формат (CSV копируется как есть)."""
+    if table_format(source) == table_format(target) == FORMAT_CSV:
+        shutil.copyfile(source, target)
+        return
+    write_table(target, *read_table(source))
+
+
+def _scan_jsonl(path: str) -> Tuple[Optional[Dict[str, Any]], int]:
+    """(схема из заголовка или None, число строк данных) - без разбора строк данных."""
+    schema, count = None, 0
+    with open(path, encoding="utf-8") as file:
+        for number, line in enumerate(file):
+            if not line.strip():
+                continue
+            if number == 0:
+                schema = _schema(line)
+                if schema is not None:
+                    continue
+            count += 1
+    return schema, count
+
+
+def inspect_table(path: str) -> TableInfo:
+    """Дешевая проверка выхода этапа: файл есть, читается, не пуст, дописанные колонки совпадают по числу строк.
+
+    JSONL проверяется по заголовку и числу строк, без разбора каждой строки.
+    """
+    if not os.path.isfile(path):
+        return TableInfo(0, [], [f"{os.path.basename(path)} was not created"])
+    try:
+        if table_format(path) == FORMAT_CSV:
+            fieldnames, rows, _ = read_csv(path)
+            return TableInfo(len(rows), fieldnames, [] if rows else [f"{os.path.basename(path)} is empty"])
+
+        schema, count = _scan_jsonl(path)
+        if schema is None:
+            # Таблица без заголовка - колонки известны только после полного чтения
+            fieldnames = read_jsonl(path)[0]
+        else:
+            fieldnames = list(schema.get("columns", []))
+        problems = [] if count else [f"{os.path.basename(path)} is empty"]
+        for columns_path in column_files(path):
+            columns_schema, columns_count = _scan_jsonl(columns_path)
+            names = (columns_schema or {}).get("columns", [])
+            fieldnames.extend(name for name in names if name not in fieldnames)
+            if columns_count != count:
+                problems.append(f"{os.path.basename(columns_path)}: {columns_count} rows, table has {count}")
+        return TableInfo(count, fieldnames, problems)
+    except (OSError, ValueError, csv.Error) as e:
+        return TableInfo(0, [], [f"{os.path.basename(path)} is unreadable: {e}"])
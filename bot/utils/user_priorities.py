@@ -0,0 +1,91 @@
+import os
+import json
+import math
+import logging
+from typing import Dict, Optional
+
+from bot.config.config import USER_PRIORITIES
+from bot.utils.file_lock import file_lock, file_version
+from bot.utils.workspace import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES_PATH = os.path.join(DATA_DIR, "priorities.json")
+
+DEFAULT_PRIORITY = 1.0
+
+
+def is_valid_weight(weight: float) -> bool:
+    """Вес - конечное положительное число: NaN и бесконечность ломают сравнение оценок в планировщике."""
+    return math.isfinite(weight) and weight > 0
+
+
+def valid_weights(weights: Dict[str, float], source: str) -> Dict[int, float]:
+    """Веса пользователей из source без некорректных значений (они пропускаются с предупреждением)."""
+    result = {}
+    for user_id, weight in weights.items():
+        try:
+            valid = is_valid_weight(float(weight))
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            valid = False
+        if not valid:
+            logger.warning(f"Ignoring invalid priority {weight!r} of user {user_id!r} in {source}")
+            continue
+        result[user_id] = float(weight)
+    return result
+
+
+class UserPriorities:
+    """Веса приоритета пользователей: USER_PRIORITIES из настроек и изменения администраторов (/priority).
+
+    Вес делит оценку длительности задачи в планировщике: задачи пользователя с весом 2
+    идут в очереди так, будто они вдвое короче. Файл общий для процессов бота: изменение
+    на одном процессе видно остальным при следующем чтении.
+    """
+
+    def __init__(self, path: str = PRIORITIES_PATH, defaults: Optional[Dict[str, float]] = None):
+        self.path = path
+        self.defaults = valid_weights(defaults or {}, "USER_PRIORITIES")
+        self._overrides: Optional[Dict[int, float]] = None
+        self._version = None
+
+    @property
+    def overrides(self) -> Dict[int, float]:
+        version = file_version(self.path)
+        if self._overrides is None or version != self._version:
+            self._version = version
+            try:
+                with open(self.path, encoding="utf-8") as file:
+                    self._overrides = valid_weights(json.load(file), self.path)
+            except (OSError, ValueError):
+                self._overrides = {}
+        return self._overrides
+
+    def get(self, user_id: Optional[int]) -> float:
+        if user_id is None:
+            return DEFAULT_PRIORITY
+        return self.overrides.get(user_id, self.defaults.get(user_id, DEFAULT_PRIORITY))
+
+    def set(self, user_id: int, weight: float):
+        if not is_valid_weight(weight):
+            raise ValueError("Priority weight must be a positive finite number")
+        with file_lock(self.path):
+            self.overrides[user_id] = weight
+            self._save()
+        logger.info(f"Priority of user {user_id} set to {weight:g}")
+
+    def all(self) -> Dict[int, float]:
+        return {**self.defaults, **self.overrides}
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump({str(user_id): weight for user_id, weight in self.overrides.items()}, file)
+        os.replace(tmp_path, self.path)
+        self._version = file_version(self.path)
+
+
+# Создание глобального экземпляра
+user_priorities = UserPriorities(defaults=USER_PRIORITIES)
@@ -0,0 +1,83 @@
+import os
+import uuid
+import shutil
+import logging
+import posixpath
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from bot.logger import job_log_path
+
+logger = logging.getLogger(__name__)
+
+# Глобальные пути
+# BOT_DATA_DIR - другой каталог данных (например, временный для бенчмарка)
+DATA_DIR = os.getenv("BOT_DATA_DIR") or os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "data"))
+JOBS_DIR = os.path.join(DATA_DIR, "jobs")
+
+# Путь, по которому каталог задачи монтируется внутрь контейнера
+JOBS_CONTAINER_DIR = "/app/jobs"
+
+
+class JobWorkspace:
+    """Изолированный рабочий каталог одной задачи (data/jobs/<job_id>)."""
+
+    TABLE_DIR = "table"
+    PIC_DIR = os.path.join("presentation", "pic")
+    OUTPUT_DIR = os.path.join("presentation", "output")
+    SHARDS_DIR = "shards"
+
+    def __init__(self, job_id: Optional[str] = None):
+        self.job_id = job_id or f"{datetime.now().strftime('%Y%m%d_%H-%M-%S')}_{uuid.uuid4().hex[:8]}"
+        self.path = os.path.join(JOBS_DIR, self.job_id)
+        self.container_path = posixpath.join(JOBS_CONTAINER_DIR, self.job_id)
+
+    def create(self) -> "JobWorkspace":
+        """Создает структуру каталогов задачи."""
+        for sub_dir in (self.TABLE_DIR, self.PIC_DIR, self.OUTPUT_DIR):
+            os.makedirs(os.path.join(self.path, sub_dir), exist_ok=True)
+        logger.info(f"Workspace {self.job_id} created at {self.path}")
+        return self
+
+    def host(self, *parts: str) -> str:
+        """Путь внутри каталога задачи на хосте."""
+        return os.path.join(self.path, *parts)
+
+    def container(self, *parts: str) -> str:
+        """Тот же путь, но внутри контейнера."""
+        return posixpath.join(self.container_path, *(p.replace(os.sep, "/") for p in parts))
+
+    @property
+    def log_path(self) -> str:
+        """Файл с логами задачи (logs/jobs/<job_id>.log) - сохраняется и после удаления каталога задачи."""
+        return job_log_path(self.job_id)
+
+    def to_host(self, container_path: str) -> str:
+        """Переводит путь внутри контейнера в путь на хосте."""
+        relative = posixpath.relpath(container_path, self.container_path)
+        return os.path.join(self.path, *relative.split("/"))
+
+    def to_container(self, host_path: str) -> str:
+        """Переводит путь на хосте в путь внутри контейнера."""
+        return self.container(os.path.relpath(host_path, self.path))
+
+    @property
+    def volumes(self) -> Dict[str, str]:
+        """Привязка каталога задачи для Orchestrator.run_container."""
+        return {self.path: self.container_path}
+
+    def list_outputs(self) -> List[str]:
+        """Возвращает файлы презентаций, созданные именно этой задачей."""
+        output_dir = self.host(self.OUTPUT_DIR)
+        if not os.path.isdir(output_dir):
+            return []
+        return sorted(
+            os.path.join(output_dir, name)
+            for name in os.listdir(output_dir)
+            if os.path.isfile(os.path.join(output_dir, name))
+        )
+
+    def cleanup(self):
+        """Удаляет каталог задачи."""
+        shutil.rmtree(self.path, ignore_errors=True)
+        logger.info(f"Workspace {self.job_id} removed")
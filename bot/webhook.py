@@ -0,0 +1,68 @@
+import asyncio
+import logging
+import signal
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from bot.config.config import (
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def wait_for_stop_signal() -> asyncio.Event:
+    """Событие, которое выставляется по SIGINT/SIGTERM."""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows: обработчики сигналов в цикле событий недоступны, остается KeyboardInterrupt
+            pass
+    return stop_event
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    """Принимает обновления через aiohttp-сервер до сигнала остановки.
+
+    Запросы без правильного секрета (X-Telegram-Bot-Api-Secret-Token) отклоняются.
+    Несколько экземпляров бота можно поставить за балансировщиком на один адрес.
+    """
+    if not WEBHOOK_URL:
+        raise RuntimeError("WEBHOOK_URL is required in webhook mode")
+    if not WEBHOOK_SECRET:
+        logger.warning("WEBHOOK_SECRET is not set, webhook requests are not authenticated")
+
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=WEBHOOK_SECRET or None,
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=WEBHOOK_HOST, port=WEBHOOK_PORT)
+
+    stop_event = wait_for_stop_signal()
+    try:
+        await site.start()
+        await bot.set_webhook(
+            f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET or None,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+        logger.info(f"Webhook server listening on {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+        await stop_event.wait()
+        logger.info("Stop signal received, shutting down webhook server")
+    finally:
+        # Новые обновления больше не принимаются; вебхук не удаляем - его могут обслуживать другие экземпляры
+        await runner.cleanup()
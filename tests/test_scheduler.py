@@ -0,0 +1,62 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from bot.resource_limits import ResourceHistory, ResourceLimits
+from bot.scheduler import Job, Scheduler
+
+GB = 1024 ** 3
+STAGE_IMAGES = ["cian_parser", "image_processor"]
+
+
+class SchedulerMemoryBudgetTest(unittest.IsolatedAsyncioTestCase):
+    """Резерв памяти по умолчанию не должен сводить планировщик к одной задаче."""
+
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.history = ResourceHistory(os.path.join(self.directory.name, "resource_history.json"))
+        # Обычный узел Docker на 16 GB - бюджет 80% его памяти; один из трех воркеров - для коротких задач
+        self.scheduler = Scheduler(workers=3)
+        await self.scheduler.start(memory_capacity=16 * GB)
+        self.release = asyncio.Event()
+
+    async def asyncTearDown(self):
+        self.release.set()
+        await self.scheduler.stop()
+        self.directory.cleanup()
+
+    async def submit(self, job_id: str, chat_id: int, memory: int) -> Job:
+        async def run():
+            await self.release.wait()
+
+        job = Job(job_id=job_id, chat_id=chat_id, run=run, memory=memory, items=20)
+        await self.scheduler.submit(job)
+        return job
+
+    async def wait_running(self, count: int):
+        for _ in range(100):
+            if self.scheduler.running_count >= count:
+                return
+            await asyncio.sleep(0.01)
+
+    async def test_default_reservation_runs_jobs_concurrently(self):
+        for index in range(2):
+            await self.submit(f"job-{index}", chat_id=index, memory=self.history.job_memory(STAGE_IMAGES, 20))
+        await self.wait_running(2)
+        self.assertEqual(self.scheduler.running_count, 2)
+
+    async def test_reservation_from_history_runs_jobs_concurrently(self):
+        for image in STAGE_IMAGES:
+            for items in (5, 10, 20):
+                self.history.record(image, items, 300 * 1024 ** 2 + items * 10 * 1024 ** 2, 1.0, ResourceLimits())
+        memory = self.history.job_memory(STAGE_IMAGES, 20)
+        self.assertGreater(memory, 0)
+        for index in range(2):
+            await self.submit(f"job-{index}", chat_id=index, memory=memory)
+        await self.wait_running(2)
+        self.assertEqual(self.scheduler.running_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()